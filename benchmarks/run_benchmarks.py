@@ -0,0 +1,340 @@
+"""
+Offline benchmarks of the converter hot paths on synthetic COCO datasets.
+
+    python benchmarks/run_benchmarks.py --scales small medium --output results.json
+    python benchmarks/run_benchmarks.py --compare baseline.json --output results.json
+
+Every stage is timed several times at every scale, results (median, min and mean seconds,
+items per second) are written as JSON and compared with the baseline results if passed.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import synthetic_coco
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(REPO_DIR, "src")
+RESULTS_VERSION = 1
+# settings which don't change results of the measured stages
+NOT_COMPARED_SETTINGS = ["scales", "stages", "repeat", "threshold", "work_dir"]
+
+# images count, (height, width) and objects per image
+SCALES = {
+    "small": {"images": 20, "image_size": (480, 640), "objects": 10},
+    "medium": {"images": 20, "image_size": (1080, 1920), "objects": 50},
+    "large": {"images": 10, "image_size": (2160, 3840), "objects": 200},
+}
+STAGES = [
+    "load_annotations",
+    "polygon_vertices",
+    "rle_to_polygon",
+    "sly_annotation",
+    "sly_annotation_json",
+    "convert_dataset",
+    "move_test_dataset",
+]
+
+
+def install_globals(work_dir, args):
+    """The converter modules get offline globals with the benchmark settings."""
+    sys.path.insert(0, SRC_DIR)
+    import offline_globals
+
+    return offline_globals.install_globals(
+        work_dir,
+        fingerprint="benchmark",
+        INCLUDE_CAPTIONS=args.captions > 0,
+        CONVERT_RLE_TO_BITMAP=args.rle_to_bitmap,
+        CONVERSION_WORKERS=args.workers,
+    )
+
+
+class ScaleData:
+    """Synthetic dataset of the scale: files on disk and the loaded annotations."""
+
+    def __init__(self, g, work_dir, scale, args):
+        import coco_converter
+        import supervisely as sly
+
+        params = SCALES[scale]
+        self.scale = scale
+        self.image_size = params["image_size"]
+        instances, captions = synthetic_coco.generate_coco(
+            params["images"],
+            params["image_size"],
+            params["objects"],
+            vertices=args.vertices,
+            holes_ratio=args.holes_ratio,
+            rle_ratio=args.rle_ratio,
+            captions_per_image=args.captions,
+            seed=args.seed,
+        )
+        self.source_dir = os.path.join(work_dir, "source", scale)
+        self.instances_path, self.captions_path = synthetic_coco.write_dataset(
+            self.source_dir, instances, captions
+        )
+        self.coco = self.load_annotations()
+        self.images = [self.coco.img_to_anns[img_id] for img_id in self.coco.images]
+        self.polygons = [
+            ann for anns in self.images for ann in anns if type(ann.get("segmentation")) is list
+        ]
+        self.rles = [
+            ann for anns in self.images for ann in anns if type(ann.get("segmentation")) is dict
+        ]
+
+        g.image_index = g.input_source.index_images(os.path.join(self.source_dir, "images"))
+        g.image_index.assign_images(self.coco.images)
+        reset_project(g)
+        g.META = sly.ProjectMeta()
+        meta = coco_converter.get_sly_meta_from_coco(
+            self.coco.categories, scale, self.coco.ann_types
+        )
+        self.meta = coco_converter.finalize_dataset_meta(meta, self.coco.categories, self.coco)
+        self.class_registry = coco_converter.ClassRegistry(self.meta, self.coco.categories)
+
+    def load_annotations(self):
+        import coco_loader
+
+        coco = coco_loader.load_coco_annotations(self.instances_path)
+        if self.captions_path is not None:
+            coco.add_captions(self.captions_path)
+        return coco
+
+
+def reset_project(g):
+    if os.path.exists(g.SLY_BASE_DIR):
+        shutil.rmtree(g.SLY_BASE_DIR)
+    os.makedirs(g.SLY_BASE_DIR)
+
+
+def stage_load_annotations(g, data):
+    return len(data.load_annotations().annotations)
+
+
+def stage_polygon_vertices(g, data):
+    import coco_converter
+
+    for ann in data.polygons:
+        coco_converter.convert_polygon_vertices(ann, data.image_size)
+    return len(data.polygons)
+
+
+def stage_rle_to_polygon(g, data):
+    import coco_converter
+
+    for ann in data.rles:
+        coco_converter.convert_rle_mask_to_polygon(ann)
+    return len(data.rles)
+
+
+def stage_sly_annotation(g, data):
+    import coco_converter
+
+    for anns in data.images:
+        ann = coco_converter.create_sly_ann_from_coco_annotation(
+            data.class_registry, anns, data.image_size
+        )
+        coco_converter.annotation_to_json(ann)
+    return len(data.images)
+
+
+def stage_sly_annotation_json(g, data):
+    import coco_converter
+
+    for anns in data.images:
+        coco_converter.create_sly_ann_json_from_coco_annotation(
+            data.class_registry, anns, data.image_size
+        )
+    return len(data.images)
+
+
+def prepare_images_copy(g, data):
+    """Images are moved by the converter, so every run gets a fresh copy of the source."""
+    images_dir = os.path.join(g.STORAGE_DIR, "images_copy")
+    if os.path.exists(images_dir):
+        shutil.rmtree(images_dir)
+    shutil.copytree(os.path.join(data.source_dir, "images"), images_dir)
+    reset_project(g)
+    g.image_index = g.input_source.index_images(images_dir)
+    g.src_img_dir = images_dir
+    dataset_dir = os.path.join(g.SLY_BASE_DIR, data.scale)
+    g.img_dir = g.dst_img_dir = os.path.join(dataset_dir, "img")
+    g.ann_dir = os.path.join(dataset_dir, "ann")
+    os.makedirs(g.img_dir)
+    os.makedirs(g.ann_dir)
+
+
+def stage_convert_dataset(g, data):
+    import coco_converter
+
+    g.META = data.meta
+    counters, _ = coco_converter.convert_trainval_dataset(
+        data.scale, data.meta, data.coco.categories, data.coco
+    )
+    return counters["converted"]
+
+
+def stage_move_test_dataset(g, data):
+    import coco_converter
+
+    return coco_converter.move_testds_to_sly_dataset(data.scale, 0, meta=data.meta)
+
+
+STAGE_SETUP = {
+    "convert_dataset": prepare_images_copy,
+    "move_test_dataset": prepare_images_copy,
+}
+
+
+def time_stage(g, stage, data, repeat):
+    func = globals()[f"stage_{stage}"]
+    setup = STAGE_SETUP.get(stage)
+    timings, items = [], 0
+    for _ in range(repeat):
+        if setup is not None:
+            setup(g, data)
+        gc.collect()
+        start = time.perf_counter()
+        items = func(g, data)
+        timings.append(time.perf_counter() - start)
+    median = statistics.median(timings)
+    return {
+        "stage": stage,
+        "scale": data.scale,
+        "items": items,
+        "repeat": repeat,
+        "median": median,
+        "min": min(timings),
+        "mean": statistics.mean(timings),
+        "items_per_second": items / median if median > 0 else None,
+    }
+
+
+def get_environment():
+    import supervisely as sly
+
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "supervisely": getattr(sly, "__version__", None),
+        "commit": commit,
+    }
+
+
+def compare_results(results, baseline, threshold):
+    """Prints median time ratios to the baseline, returns the list of regressed stages."""
+    baseline_results = {(item["stage"], item["scale"]): item for item in baseline["results"]}
+    regressions = []
+    print(f"\n{'stage':<22}{'scale':<8}{'baseline, s':>13}{'current, s':>13}{'ratio':>8}")
+    for item in results:
+        base = baseline_results.get((item["stage"], item["scale"]))
+        if base is None or base["median"] == 0:
+            continue
+        ratio = item["median"] / base["median"]
+        mark = ""
+        if ratio > threshold:
+            mark = "  slower"
+            regressions.append(item)
+        print(
+            f"{item['stage']:<22}{item['scale']:<8}{base['median']:>13.4f}"
+            f"{item['median']:>13.4f}{ratio:>8.2f}{mark}"
+        )
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=["small", "medium"])
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--repeat", type=int, default=3, help="runs of every stage")
+    parser.add_argument("--output", help="path of the results json")
+    parser.add_argument("--compare", help="path of the baseline results json")
+    parser.add_argument(
+        "--threshold", type=float, default=1.2, help="median time ratio reported as regression"
+    )
+    parser.add_argument("--workers", type=int, default=1, help="conversion processes")
+    parser.add_argument("--vertices", type=int, default=32, help="vertices of polygon rings")
+    parser.add_argument("--holes-ratio", type=float, default=0.2, help="polygons with holes")
+    parser.add_argument("--rle-ratio", type=float, default=0.1, help="crowd RLE objects")
+    parser.add_argument("--captions", type=int, default=2, help="captions per image")
+    parser.add_argument("--rle-to-bitmap", action="store_true", help="convert RLE to bitmaps")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", help="directory of the generated data, temporary by default")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="coco_benchmarks_")
+    os.makedirs(work_dir, exist_ok=True)
+    g = install_globals(work_dir, args)
+
+    import supervisely as sly
+
+    # per image warnings of the converter are not a part of the measured work
+    sly.logger.setLevel("ERROR")
+    results = []
+    try:
+        for scale in args.scales:
+            data = ScaleData(g, work_dir, scale, args)
+            for stage in args.stages:
+                result = time_stage(g, stage, data, args.repeat)
+                results.append(result)
+                print(
+                    f"{stage:<22}{scale:<8}median {result['median']:.4f} s, "
+                    f"{result['items']} items, {result['items_per_second'] or 0:.1f} items/s"
+                )
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "version": RESULTS_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "environment": get_environment(),
+        "settings": {
+            key: value for key, value in vars(args).items() if key not in ["output", "compare"]
+        },
+        "scales": {scale: SCALES[scale] for scale in args.scales},
+        "results": results,
+    }
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        changed = [
+            key
+            for key, value in report["settings"].items()
+            if key not in NOT_COMPARED_SETTINGS and baseline["settings"].get(key) != value
+        ]
+        if len(changed) > 0:
+            print(f"Baseline was measured with other settings: {', '.join(changed)}")
+        regressions = compare_results(results, baseline, args.threshold)
+        if len(regressions) > 0:
+            print(f"{len(regressions)} stages are slower than the baseline")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
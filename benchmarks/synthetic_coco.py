@@ -0,0 +1,223 @@
+"""
+Deterministic generator of synthetic COCO datasets for the converter benchmarks.
+The same parameters and seed always give the same annotations and images.
+"""
+
+import json
+import math
+import os
+
+import cv2
+import numpy as np
+
+CATEGORIES = ["person", "car", "dog", "cat", "tree", "road sign", "bicycle", "bottle"]
+IMAGE_EXT = ".jpg"
+
+
+def encode_rle_counts(mask, top, left, image_size):
+    """
+    Uncompressed COCO RLE counts of the mask placed at (top, left) in the image:
+    runs go in column-major order and start with background.
+    """
+    height, width = image_size
+    padded = np.pad(mask.astype(np.int8), ((1, 1), (0, 0)))
+    # (column, row) of run starts and ends inside every column of the mask
+    changes = np.diff(padded, axis=0).T
+    cols, rows = np.nonzero(changes == 1)
+    starts = (left + cols) * height + top + rows
+    cols, rows = np.nonzero(changes == -1)
+    ends = (left + cols) * height + top + rows
+    if len(starts) == 0:
+        return [height * width]
+    # runs crossing the column border are merged
+    joined = starts[1:] == ends[:-1]
+    starts = starts[np.concatenate([[True], ~joined])]
+    ends = ends[np.concatenate([~joined, [True]])]
+    bounds = np.stack([starts, ends], axis=1).reshape(-1)
+    counts = np.diff(np.concatenate([[0], bounds, [height * width]])).tolist()
+    if len(counts) > 1 and counts[-1] == 0:
+        # the mask ends at the last pixel
+        counts.pop()
+    return counts
+
+
+def counts_to_string(counts):
+    """Compresses RLE counts to COCO string (the same as rleToString in pycocotools)."""
+    chars = []
+    for idx, count in enumerate(counts):
+        value = count
+        if idx > 2:
+            value -= counts[idx - 2]
+        more = True
+        while more:
+            char = value & 0x1F
+            value >>= 5
+            more = value != -1 if char & 0x10 else value != 0
+            if more:
+                char |= 0x20
+            chars.append(chr(char + 48))
+    return "".join(chars)
+
+
+def star_ring(rng, center, radius, vertices):
+    """Star-shaped ring around the center, radii are between 0.6 and 1 of the radius."""
+    angles = np.sort(rng.uniform(0, 2 * math.pi, vertices))
+    radii = radius * rng.uniform(0.6, 1.0, vertices)
+    xs = center[0] + radii * np.cos(angles)
+    ys = center[1] + radii * np.sin(angles)
+    return np.stack([xs, ys], axis=1)
+
+
+def ring_to_coco(ring, image_size):
+    height, width = image_size
+    ring = np.clip(ring, 0, [width - 1, height - 1])
+    return [round(float(coord), 2) for coord in ring.reshape(-1)]
+
+
+def random_object_geometry(rng, image_size, max_radius):
+    height, width = image_size
+    radius = rng.uniform(max_radius / 4, max_radius)
+    center = rng.uniform([radius, radius], [width - radius, height - radius])
+    return center, radius
+
+
+def polygon_segmentation(rng, image_size, max_radius, vertices, holes, parts):
+    """COCO polygon segmentation of several parts, holes are rings inside the first part."""
+    segmentation = []
+    for part in range(parts):
+        center, radius = random_object_geometry(rng, image_size, max_radius)
+        segmentation.append(ring_to_coco(star_ring(rng, center, radius, vertices), image_size))
+        if part > 0:
+            continue
+        for _ in range(holes):
+            # outer radii are at least 0.6 of the radius, so holes are strictly inside
+            offset = rng.uniform(-0.2 * radius, 0.2 * radius, 2)
+            hole = star_ring(rng, center + offset, 0.15 * radius, max(vertices // 4, 3))
+            segmentation.append(ring_to_coco(hole, image_size))
+    return segmentation
+
+
+def rle_segmentation(rng, image_size, max_radius, compressed):
+    """COCO RLE of an ellipse mask, compressed to string or uncompressed counts."""
+    height, width = image_size
+    center, radius = random_object_geometry(rng, image_size, max_radius)
+    radius_x, radius_y = radius, radius * rng.uniform(0.5, 1.0)
+    left, top = int(center[0] - radius_x), int(center[1] - radius_y)
+    ys, xs = np.mgrid[0 : int(2 * radius_y) + 1, 0 : int(2 * radius_x) + 1]
+    mask = ((xs + left - center[0]) / radius_x) ** 2 + ((ys + top - center[1]) / radius_y) ** 2 <= 1
+    mask = mask[: height - top, : width - left]
+    counts = encode_rle_counts(mask, top, left, image_size)
+    if compressed:
+        counts = counts_to_string(counts)
+    return {"size": list(image_size), "counts": counts}
+
+
+def get_segmentation_bbox(segmentation):
+    if isinstance(segmentation, dict):
+        return None
+    points = np.array([coord for ring in segmentation for coord in ring]).reshape(-1, 2)
+    x_min, y_min = points.min(axis=0)
+    x_max, y_max = points.max(axis=0)
+    return [round(float(value), 2) for value in [x_min, y_min, x_max - x_min, y_max - y_min]]
+
+
+def generate_coco(
+    images_count,
+    image_size,
+    objects_per_image,
+    vertices=32,
+    holes_ratio=0.2,
+    multipart_ratio=0.1,
+    rle_ratio=0.1,
+    captions_per_image=0,
+    seed=0,
+):
+    """
+    Returns instances and captions (None if captions_per_image is 0) annotations.
+    image_size is (height, width), ratios are fractions of objects with holes,
+    with several polygon parts and crowd RLE masks (every other mask is compressed).
+    """
+    rng = np.random.RandomState(seed)
+    height, width = image_size
+    max_radius = min(height, width) / 8
+    categories = [
+        {"id": idx + 1, "name": name, "supercategory": "object"}
+        for idx, name in enumerate(CATEGORIES)
+    ]
+    images, annotations, captions = [], [], []
+    for img_id in range(1, images_count + 1):
+        file_name = f"{img_id:08d}{IMAGE_EXT}"
+        images.append({"id": img_id, "file_name": file_name, "height": height, "width": width})
+        for _ in range(objects_per_image):
+            ann = {
+                "id": len(annotations) + 1,
+                "image_id": img_id,
+                "category_id": int(rng.randint(1, len(categories) + 1)),
+                "iscrowd": 0,
+            }
+            kind = rng.uniform()
+            if kind < rle_ratio:
+                ann["iscrowd"] = 1
+                ann["segmentation"] = rle_segmentation(
+                    rng, image_size, max_radius, compressed=ann["id"] % 2 == 0
+                )
+                ann["bbox"] = []
+            else:
+                holes = int(rng.randint(1, 4)) if rng.uniform() < holes_ratio else 0
+                parts = 2 if rng.uniform() < multipart_ratio else 1
+                ann["segmentation"] = polygon_segmentation(
+                    rng, image_size, max_radius, vertices, holes, parts
+                )
+                ann["bbox"] = get_segmentation_bbox(ann["segmentation"])
+            annotations.append(ann)
+        for _ in range(captions_per_image):
+            words = rng.choice(CATEGORIES, size=int(rng.randint(3, 8)))
+            captions.append(
+                {"id": len(captions) + 1, "image_id": img_id, "caption": " ".join(words)}
+            )
+    instances = {"images": images, "annotations": annotations, "categories": categories}
+    if captions_per_image == 0:
+        return instances, None
+    return instances, {"images": images, "annotations": captions}
+
+
+def write_image(path, image_size, seed):
+    """Writes a JPEG image with smooth gradients, so its size is close to a real photo."""
+    height, width = image_size
+    rng = np.random.RandomState(seed)
+    ys, xs = np.mgrid[0:height, 0:width].astype(np.float32)
+    channels = []
+    for _ in range(3):
+        x_wave = np.sin(xs / rng.uniform(20, 200) + rng.uniform(0, 6))
+        y_wave = np.cos(ys / rng.uniform(20, 200))
+        channels.append((x_wave + y_wave) * 60 + 128)
+    image = np.clip(np.stack(channels, axis=2), 0, 255).astype(np.uint8)
+    cv2.imwrite(path, image)
+
+
+def write_dataset(dataset_dir, instances, captions=None, write_images=True):
+    """
+    Writes the dataset in the layout of the custom COCO datasets of the app:
+    images/ and annotations/instances.json (and captions.json).
+    Returns paths of the instances and captions files.
+    """
+    img_dir = os.path.join(dataset_dir, "images")
+    ann_dir = os.path.join(dataset_dir, "annotations")
+    os.makedirs(img_dir, exist_ok=True)
+    os.makedirs(ann_dir, exist_ok=True)
+    instances_path = os.path.join(ann_dir, "instances.json")
+    with open(instances_path, "w") as f:
+        json.dump(instances, f)
+    captions_path = None
+    if captions is not None:
+        captions_path = os.path.join(ann_dir, "captions.json")
+        with open(captions_path, "w") as f:
+            json.dump(captions, f)
+    if write_images:
+        for image in instances["images"]:
+            write_image(
+                os.path.join(img_dir, image["file_name"]),
+                (image["height"], image["width"]),
+                seed=image["id"],
+            )
+    return instances_path, captions_path
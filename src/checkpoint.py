@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import threading
+
+import supervisely as sly
+from supervisely.io.fs import silent_remove
+
+CHECKPOINTS_DIR = "coco_import_checkpoints"
+# modal state fields which define the result of the import
+FINGERPRINT_STATE_KEYS = [
+    "cocoDataset",
+    "originalDataset",
+    "slySelectedContext",
+    "slyFolder",
+    "slyFile",
+    "files",
+    "captions",
+    "rleToBitmap",
+    "projectName",
+    "uploadMode",
+]
+
+
+def get_fingerprint(workspace_id):
+    state = {key: os.environ.get(f"modal.state.{key}") for key in FINGERPRINT_STATE_KEYS}
+    state_json = json.dumps({"workspace_id": workspace_id, **state}, sort_keys=True)
+    # hex digest is used as the checkpoint dir name
+    return hashlib.sha256(state_json.encode("utf-8")).hexdigest()
+
+
+def open_checkpoint(cache_dir, workspace_id):
+    """
+    Checkpoint of the import with the current settings in the app cache dir: the app data dir
+    belongs to the task session, so a restarted task gets an empty one.
+    """
+    fingerprint = get_fingerprint(workspace_id)
+    checkpoint_dir = os.path.join(cache_dir, CHECKPOINTS_DIR, fingerprint)
+    return Checkpoint(os.path.join(checkpoint_dir, "checkpoint.jsonl"), fingerprint)
+
+
+class Checkpoint:
+    """
+    Progress manifest of the import: finished downloads, converted and uploaded images of every
+    dataset, fully converted datasets, the output project and its datasets.
+    Records are appended to a json lines file, so a restarted task with the same settings
+    skips finished work and continues uploading to the same project.
+    If path is None, the progress is kept in memory only and names of converted and uploaded
+    images are not recorded, the task can't be restarted anyway.
+    """
+
+    def __init__(self, path, fingerprint):
+        self.path = path
+        # files of the import which are reused after the restart are kept in this dir too
+        self.dir = os.path.dirname(path) if path is not None else None
+        self.fingerprint = fingerprint
+        self.downloads = set()
+        self.converted = {}  # dataset -> names of images written to the local project
+        self.uploaded = {}  # dataset -> names of uploaded images
+        self.finished = {}  # dataset -> number of images of the fully converted dataset
+        self.project_id = None
+        self.dataset_ids = {}
+        self._lock = threading.Lock()
+        self.is_resumed = self._load()
+        if self.path is not None and not self.is_resumed:
+            os.makedirs(self.dir, exist_ok=True)
+            with open(self.path, "w") as f:
+                f.write(json.dumps({"event": "start", "fingerprint": fingerprint}) + "\n")
+
+    def _load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return False
+        with open(self.path, "r") as f:
+            text = f.read()
+        # the last record may be incomplete if the task was killed while writing it
+        lines = text.split("\n")
+        records = []
+        for line in lines[:-1]:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+        if len(records) == 0 or records[0] != {"event": "start", "fingerprint": self.fingerprint}:
+            sly.logger.info("Checkpoint of another import is found, it is ignored")
+            return False
+        if len(records) < len(lines) - 1 or lines[-1] != "":
+            # new records must not be appended to the incomplete line
+            with open(self.path, "w") as f:
+                f.writelines(json.dumps(record) + "\n" for record in records)
+        for record in records[1:]:
+            self._apply(record)
+        sly.logger.info(
+            "Resuming the import from the checkpoint",
+            extra={
+                "downloads": sorted(self.downloads),
+                "finished_datasets": self.finished,
+                "converted": {ds: len(names) for ds, names in self.converted.items()},
+                "uploaded": {ds: len(names) for ds, names in self.uploaded.items()},
+                "project_id": self.project_id,
+            },
+        )
+        return True
+
+    def _apply(self, record):
+        event = record["event"]
+        if event == "download":
+            self.downloads.add(record["name"])
+        elif event == "converted":
+            self.converted.setdefault(record["dataset"], set()).update(record["names"])
+        elif event == "uploaded":
+            self.uploaded.setdefault(record["dataset"], set()).update(record["names"])
+        elif event == "dataset_finished":
+            self.finished[record["dataset"]] = record["images"]
+        elif event == "project":
+            self.project_id = record["id"]
+        elif event == "dataset_id":
+            self.dataset_ids[record["dataset"]] = record["id"]
+        elif event == "reset_uploads":
+            self.project_id = None
+            self.dataset_ids = {}
+            self.uploaded = {}
+
+    def _add(self, record):
+        with self._lock:
+            self._apply(record)
+            if self.path is not None:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+
+    def is_downloaded(self, name):
+        return name in self.downloads
+
+    def add_download(self, name):
+        self._add({"event": "download", "name": name})
+
+    def is_converted(self, dataset, name):
+        """The image is converted to the local project or uploaded before the restart."""
+        if self.path is None:
+            return False
+        return name in self.converted.get(dataset, ()) or name in self.uploaded.get(dataset, ())
+
+    def add_converted(self, dataset, names):
+        if self.path is not None and len(names) > 0:
+            self._add({"event": "converted", "dataset": dataset, "names": list(names)})
+
+    def is_uploaded(self, dataset, name):
+        if self.path is None:
+            return False
+        return name in self.uploaded.get(dataset, ())
+
+    def add_uploaded(self, dataset, names):
+        if self.path is not None:
+            self._add({"event": "uploaded", "dataset": dataset, "names": list(names)})
+
+    def finish_dataset(self, dataset, images_count):
+        self._add({"event": "dataset_finished", "dataset": dataset, "images": images_count})
+
+    def set_project(self, project_id):
+        self._add({"event": "project", "id": project_id})
+
+    def set_dataset_id(self, dataset, dataset_id):
+        self._add({"event": "dataset_id", "dataset": dataset, "id": dataset_id})
+
+    def reset_uploads(self):
+        """Forgets the output project, e.g. if it was removed after the restart."""
+        self._add({"event": "reset_uploads"})
+
+    def remove(self):
+        """Removes the manifest after the import is finished."""
+        if self.path is not None:
+            silent_remove(self.path)
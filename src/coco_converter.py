@@ -1,30 +1,25 @@
-import glob
-import json
+import functools
+import math
 import os
 import shutil
+import time
 import uuid
-from copy import deepcopy
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 
 import cv2
 import numpy as np
-import pycocotools.mask as mask_util
-from PIL import Image
-from pycocotools.coco import COCO
 
+import conversion_cache
 import globals as g
+import image_utils
+import image_verification
+import parallel
 import supervisely as sly
-from supervisely.io.fs import file_exists, mkdir
-
-
-def check_high_level_coco_ann_structure(ann_path):
-    with open(ann_path, "r") as f:
-        dataset = json.load(f)
-        for key in ["annotations", "images", "categories"]:
-            if key not in dataset:
-                raise Exception(f"[{key}] field is missing")
-            if not isinstance(dataset[key], list):
-                raise Exception(f"[{key}] field value must be a list of dicts")
+from supervisely.annotation.annotation import AnnotationJsonFields
+from supervisely.annotation.label import LabelJsonFields
+from supervisely.geometry.constants import EXTERIOR, GEOMETRY_SHAPE, GEOMETRY_TYPE, INTERIOR, POINTS
+from supervisely.io.fs import mkdir
 
 
 def add_tail(body: str, tail: str):
@@ -42,22 +37,6 @@ def wrong_geometry_first_warning(cls_name, obj_cls, expeted_type):
         )
 
 
-def get_ann_types(coco: COCO) -> List[str]:
-    ann_types = []
-
-    sly.logger.info("Getting info about annotation types..")
-
-    annotation_ids = coco.getAnnIds()
-    if any("bbox" in coco.anns[ann_id] for ann_id in annotation_ids):
-        ann_types.append("bbox")
-    if any("segmentation" in coco.anns[ann_id] for ann_id in annotation_ids):
-        ann_types.append("segmentation")
-    if any("caption" in coco.anns[ann_id] for ann_id in annotation_ids):
-        ann_types.append("caption")
-
-    return ann_types
-
-
 def create_sly_meta_from_coco_categories(coco_categories, ann_types=None):
     colors = []
     tag_metas = []
@@ -100,13 +79,98 @@ def dump_meta(coco_categories, path_to_meta, ann_types=None):
     return g.META
 
 
-def update_and_dump_meta(meta, obj_class):
-    meta = meta.add_obj_class(obj_class)
-    meta_json = meta.to_json()
-    path_to_meta = os.path.join(g.SLY_BASE_DIR, "meta.json")
-    sly.json.dump_json_file(meta_json, path_to_meta)
-    g.META = meta
-    return meta
+conversion_worker_context = {}
+CONVERSION_CHUNK_SIZE = 16
+MISSING_FILES_REPORT_LIMIT = 20
+CHECKPOINT_BATCH_SIZE = 100
+EMPTY_ANNOTATION_JSON = sly.Annotation((0, 0)).to_json()
+
+
+class ClassRegistry:
+    """Object classes of the meta by COCO category id and kind ("polygon", "bbox" or "rle")."""
+
+    def __init__(self, meta: sly.ProjectMeta, coco_categories):
+        self.meta = meta
+        self.class_names = coco_category_to_class_name(coco_categories)
+        self.caption_tag_meta = meta.get_tag_meta("caption")
+        self._obj_classes = {}
+        self._flushed_meta = meta
+
+    def get_class_name(self, category_id):
+        return self.class_names.get(category_id)
+
+    def get_obj_class(self, category_id, kind):
+        key = (category_id, kind)
+        if key not in self._obj_classes:
+            self._obj_classes[key] = self._resolve_obj_class(category_id, kind)
+        return self._obj_classes[key]
+
+    def _resolve_obj_class(self, category_id, kind):
+        class_name = self.class_names[category_id]
+        if kind == "polygon":
+            return self.meta.get_obj_class(class_name)
+        if not class_name.endswith(kind):
+            class_name = add_tail(class_name, kind)
+        obj_class = self.meta.get_obj_class(class_name)
+        if obj_class is None and kind == "rle":
+            raise RuntimeError(f"Object class '{class_name}' is missing in the project meta")
+        return obj_class
+
+    def get_rle_class_name(self, category_id):
+        class_name = self.class_names[category_id]
+        if not class_name.endswith("rle"):
+            class_name = add_tail(class_name, "rle")
+        return class_name
+
+    def add_obj_class(self, obj_class: sly.ObjClass):
+        self.meta = self.meta.add_obj_class(obj_class)
+        # a new class may change results of cached lookups by name
+        self._obj_classes.clear()
+
+    def flush_meta(self):
+        """Writes meta.json if new classes were added since the previous flush."""
+        g.META = self.meta
+        if self.meta is self._flushed_meta:
+            return
+        path_to_meta = os.path.join(g.SLY_BASE_DIR, "meta.json")
+        sly.json.dump_json_file(self.meta.to_json(), path_to_meta)
+        self._flushed_meta = self.meta
+
+
+# thread pool encoding bitmaps to json, created on the first use in every process
+bitmap_encoding_pool = None
+bitmap_encoding_pool_pid = None
+
+
+def get_bitmap_encoding_pool():
+    global bitmap_encoding_pool, bitmap_encoding_pool_pid
+    # threads of the pool are not inherited by forked conversion workers
+    if bitmap_encoding_pool is None or bitmap_encoding_pool_pid != os.getpid():
+        bitmap_encoding_pool = ThreadPoolExecutor(max_workers=g.BITMAP_ENCODING_THREADS)
+        bitmap_encoding_pool_pid = os.getpid()
+    return bitmap_encoding_pool
+
+
+def is_concurrent_encoding_needed(labels):
+    bitmaps_count = sum(isinstance(label.geometry, sly.Bitmap) for label in labels)
+    return g.BITMAP_ENCODING_THREADS > 1 and bitmaps_count >= 2
+
+
+def labels_to_json(labels):
+    """Returns json of the labels, bitmaps are encoded concurrently as in annotation_to_json."""
+    if not is_concurrent_encoding_needed(labels):
+        return [label.to_json() for label in labels]
+    return list(get_bitmap_encoding_pool().map(lambda label: label.to_json(), labels))
+
+
+def annotation_to_json(ann: sly.Annotation):
+    """The same as ann.to_json(), but bitmap labels are encoded concurrently."""
+    if not is_concurrent_encoding_needed(ann.labels):
+        return ann.to_json()
+    ann_json = ann.clone(labels=[]).to_json()
+    ann_json[AnnotationJsonFields.LABELS] = labels_to_json(ann.labels)
+    return ann_json
+
 
 def get_coco_annotations_for_current_image(coco_image, coco_anns):
     image_id = coco_image["id"]
@@ -117,7 +181,67 @@ def coco_category_to_class_name(coco_categories):
     return {category["id"]: category["name"] for category in coco_categories}
 
 
-def convert_polygon_vertices(coco_ann, image_size):
+def get_polygon_outline_contour(exterior, image_size):
+    """Outline contour drawn only inside the polygon bounding box, None if it's empty."""
+    # the same rounding as in sly.PointLocation
+    points = np.floor(np.array(exterior, dtype=np.float64)).astype(np.int64)
+    if len(points) < 3:
+        points = np.concatenate([points, np.repeat(points[-1:], 3 - len(points), axis=0)])
+    height, width = image_size
+    x_min, y_min = points.min(axis=0)
+    x_max, y_max = points.max(axis=0)
+    left, top = max(int(x_min) - 1, 0), max(int(y_min) - 1, 0)
+    right, bottom = min(int(x_max) + 2, width), min(int(y_max) + 2, height)
+    if left >= right or top >= bottom:
+        return None
+
+    canvas = np.zeros((bottom - top, right - left), dtype=np.uint8)
+    offset = np.array([left, top], dtype=np.int64)
+    cv2.polylines(canvas, [(points - offset).astype(np.int32)], isClosed=True, color=255)
+    contours, _ = cv2.findContours(canvas, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    if len(contours) == 0:
+        return None
+    return contours[0] + offset.astype(np.int32)
+
+
+def get_containment_candidates(points):
+    """[i, j] is True if ring j lies within the floored bounding box of ring i."""
+    mins = np.array([ring.min(axis=0) for ring in points], dtype=np.float64)
+    maxs = np.array([ring.max(axis=0) for ring in points], dtype=np.float64)
+    outer_mins, outer_maxs = np.floor(mins), np.floor(maxs)
+    candidates = (outer_mins[:, None, :] <= mins[None, :, :]).all(axis=2) & (
+        maxs[None, :, :] <= outer_maxs[:, None, :]
+    ).all(axis=2)
+    np.fill_diagonal(candidates, False)
+    return candidates
+
+
+def points_inside_contour(contour, points, chunk_size=2**20):
+    """The same as `cv2.pointPolygonTest(contour, point, False) > 0` for every point."""
+    v = contour.reshape(-1, 2).astype(np.float32)
+    v0 = np.roll(v, 1, axis=0)
+    vx, vy, v0x, v0y = v[:, 0], v[:, 1], v0[:, 0], v0[:, 1]
+    dx, dy = (vx - v0x).astype(np.float64), (vy - v0y).astype(np.float64)
+
+    points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+    result = np.empty(len(points), dtype=bool)
+    step = max(chunk_size // len(v), 1)
+    for start in range(0, len(points), step):
+        px = points[start : start + step, 0:1]
+        py = points[start : start + step, 1:2]
+        skip = ((v0y <= py) & (vy <= py)) | ((v0y > py) & (vy > py)) | ((v0x < px) & (vx < px))
+        between = ((v0x <= px) & (px <= vx)) | ((vx <= px) & (px <= v0x))
+        on_edge = skip & (py == vy) & ((px == vx) | ((py == v0y) & between))
+        dist = (py - v0y).astype(np.float64) * dx - (px - v0x).astype(np.float64) * dy
+        dist = np.where(vy < v0y, -dist, dist)
+        on_edge |= ~skip & (dist == 0)
+        crossings = np.count_nonzero(~skip & (dist > 0), axis=1)
+        result[start : start + step] = ~on_edge.any(axis=1) & (crossings % 2 == 1)
+    return result
+
+
+def get_polygon_rings(coco_ann, image_size):
+    """Returns (exterior, interiors) of the polygons of COCO segmentation, points are (x, y)."""
     polygons = coco_ann["segmentation"]
     if all(type(coord) is float for coord in polygons):
         polygons = [polygons]
@@ -133,137 +257,486 @@ def convert_polygon_vertices(coco_ann, image_size):
         exteriors.append(exterior_points)
 
     interiors = {idx: [] for idx in range(len(exteriors))}
-    id2del = []
+    points = [np.array(exterior, dtype=np.float32) for exterior in exteriors]
+    candidates = get_containment_candidates(points)
+    id2del = set()
     for idx, exterior in enumerate(exteriors):
-        temp_img = np.zeros(image_size + (3,), dtype=np.uint8)
-        geom = sly.Polygon([sly.PointLocation(y, x) for x, y in exterior])
-        geom.draw_contour(temp_img, color=[255, 255, 255])
-        im = cv2.cvtColor(temp_img, cv2.COLOR_RGB2GRAY)
-        contours, _ = cv2.findContours(im, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
-        if len(contours) == 0:
+        if not candidates[idx].any():
             continue
-        for idy, exterior2 in enumerate(exteriors):
-            if idx == idy or idy in id2del:
+        contour = get_polygon_outline_contour(exterior, image_size)
+        if contour is None:
+            continue
+        contour_min, contour_max = contour.min(axis=(0, 1)), contour.max(axis=(0, 1))
+        for idy in np.flatnonzero(candidates[idx]):
+            if idy in id2del:
                 continue
-            points_inside = [
-                cv2.pointPolygonTest(contours[0], (x, y), False) > 0 for x, y in exterior2
-            ]
-            # if all list elements are True, then all points are inside or on contour
-            if all(points_inside):
-                interiors[idx].append(deepcopy(exteriors[idy]))
-                id2del.append(idy)
+            exterior2 = points[idy]
+            if (exterior2.min(axis=0) < contour_min).any() or (
+                exterior2.max(axis=0) > contour_max
+            ).any():
+                continue
+            # all points must be strictly inside the contour
+            if points_inside_contour(contour, exterior2).all():
+                interiors[idx].append(exteriors[idy])
+                id2del.add(idy)
 
     # remove contours from exteriors that are inside other contours
     for j in sorted(id2del, reverse=True):
         del exteriors[j]
 
-    figures = []
-    for exterior, interior in zip(exteriors, interiors.values()):
-        exterior = [sly.PointLocation(y, x) for x, y in exterior]
-        interior = [[sly.PointLocation(y, x) for x, y in points] for points in interior]
-        figures.append(sly.Polygon(exterior, interior))
+    return list(zip(exteriors, interiors.values()))
 
-    return figures
 
+def create_polygon(exterior, interior):
+    exterior = [sly.PointLocation(y, x) for x, y in exterior]
+    interior = [[sly.PointLocation(y, x) for x, y in points] for points in interior]
+    return sly.Polygon(exterior, interior)
 
-def convert_rle_mask_to_polygon(coco_ann):
-    if type(coco_ann["segmentation"]["counts"]) is str:
-        coco_ann["segmentation"]["counts"] = bytes(
-            coco_ann["segmentation"]["counts"], encoding="utf-8"
-        )
-        mask = mask_util.decode(coco_ann["segmentation"])
-    else:
-        rle_obj = mask_util.frPyObjects(
-            coco_ann["segmentation"],
-            coco_ann["segmentation"]["size"][0],
-            coco_ann["segmentation"]["size"][1],
-        )
-        mask = mask_util.decode(rle_obj)
-    mask = np.array(mask, dtype=bool)
-    if not np.any(mask):
+
+def convert_polygon_vertices(coco_ann, image_size):
+    return [
+        create_polygon(exterior, interior)
+        for exterior, interior in get_polygon_rings(coco_ann, image_size)
+    ]
+
+
+def rle_string_to_counts(counts):
+    """Decodes compressed COCO RLE counts string (the same as rleFrString in pycocotools)."""
+    if isinstance(counts, str):
+        counts = counts.encode("utf-8")
+    chars = np.frombuffer(counts, dtype=np.uint8).astype(np.int64) - 48
+    ends = np.flatnonzero((chars & 0x20) == 0)
+    if len(ends) == 0:
+        return np.zeros(0, dtype=np.int64)
+    chars = chars[: ends[-1] + 1]
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    lengths = ends - starts + 1
+    shifts = 5 * (np.arange(len(chars)) - np.repeat(starts, lengths))
+    values = np.add.reduceat((chars & 0x1F) << shifts, starts)
+    negative = (chars[ends] & 0x10) != 0
+    values[negative] -= np.left_shift(1, 5 * lengths[negative])
+    # every count except the first three is stored
+    # as a difference with the count two positions before
+    counts = values.copy()
+    counts[1::2] = np.cumsum(values[1::2])
+    counts[2::2] = np.cumsum(values[2::2])
+    return counts
+
+
+def get_rle_counts(segmentation):
+    counts = segmentation["counts"]
+    if isinstance(counts, (str, bytes)):
+        return rle_string_to_counts(counts)
+    return np.asarray(counts, dtype=np.int64).reshape(-1)
+
+
+def rle_has_foreground(segmentation):
+    """Checks if the decoded mask is not empty without decoding it."""
+    height, width = segmentation["size"]
+    counts = get_rle_counts(segmentation)
+    ends = np.cumsum(counts)
+    run_starts = np.minimum(ends - counts, height * width)[1::2]
+    run_ends = np.minimum(ends, height * width)[1::2]
+    return bool((run_ends > run_starts).any())
+
+
+def decode_rles_in_bbox(segmentations):
+    """Returns (mask cropped by its bounding box, (top, left)) of every RLE, None if empty."""
+    if len(segmentations) == 0:
+        return []
+    counts_list = [get_rle_counts(segmentation) for segmentation in segmentations]
+    objects_count = len(segmentations)
+    heights = np.array([segmentation["size"][0] for segmentation in segmentations], dtype=np.int64)
+    widths = np.array([segmentation["size"][1] for segmentation in segmentations], dtype=np.int64)
+    lengths = np.array([len(counts) for counts in counts_list], dtype=np.int64)
+    counts = np.concatenate(counts_list)
+    run_objects = np.repeat(np.arange(objects_count), lengths)
+    first = np.cumsum(lengths) - lengths
+    positions = np.arange(len(counts)) - first[run_objects]
+
+    # RLE runs go in column-major order and start with background
+    totals = np.concatenate([[0], np.cumsum(counts)])
+    ends = totals[1:] - totals[first][run_objects]
+    areas = (heights * widths)[run_objects]
+    run_starts, run_ends = np.minimum(ends - counts, areas), np.minimum(ends, areas)
+    foreground = (positions % 2 == 1) & (run_ends > run_starts)
+    run_objects = run_objects[foreground]
+    run_starts, run_ends = run_starts[foreground], run_ends[foreground]
+    has_runs = np.bincount(run_objects, minlength=objects_count) > 0
+
+    height = heights[run_objects]
+    first_col, last_col = run_starts // height, (run_ends - 1) // height
+    single_col = first_col == last_col
+    int64_max = np.iinfo(np.int64).max
+    top, left = np.full(objects_count, int64_max), np.full(objects_count, int64_max)
+    bottom, right = np.zeros(objects_count, dtype=np.int64), np.zeros(objects_count, dtype=np.int64)
+    np.minimum.at(top, run_objects, np.where(single_col, run_starts % height, 0))
+    np.maximum.at(bottom, run_objects, np.where(single_col, (run_ends - 1) % height, height - 1))
+    np.minimum.at(left, run_objects, first_col)
+    np.maximum.at(right, run_objects, last_col)
+    crop_heights = np.where(has_runs, bottom - top + 1, 0)
+    crop_widths = np.where(has_runs, right - left + 1, 0)
+    crop_areas = crop_heights * crop_widths
+    offsets = np.cumsum(crop_areas) - crop_areas
+
+    # all masks are filled in one buffer, runs spanning several columns
+    # are possible only if the crop has full image height
+    crop_starts = (
+        offsets[run_objects]
+        + (first_col - left[run_objects]) * crop_heights[run_objects]
+        + run_starts % height
+        - top[run_objects]
+    )
+    crop_ends = crop_starts + (run_ends - run_starts)
+    diff = np.zeros(int(crop_areas.sum()) + 1, dtype=np.int8)
+    np.add.at(diff, crop_starts, 1)
+    np.add.at(diff, crop_ends, -1)
+    masks = np.cumsum(diff[:-1], dtype=np.int8).astype(bool)
+
+    result = []
+    for idx in range(objects_count):
+        if not has_runs[idx]:
+            result.append((None, None))
+            continue
+        mask = masks[offsets[idx] : offsets[idx] + crop_areas[idx]]
+        mask = np.ascontiguousarray(mask.reshape(crop_widths[idx], crop_heights[idx]).T)
+        result.append((mask, (int(top[idx]), int(left[idx]))))
+    return result
+
+
+def decode_rle_in_bbox(segmentation):
+    """Decodes a single COCO RLE inside its bounding box, see decode_rles_in_bbox."""
+    return decode_rles_in_bbox([segmentation])[0]
+
+
+def convert_rle_mask_to_polygon(coco_ann, decoded_mask=None):
+    if decoded_mask is None:
+        decoded_mask = decode_rle_in_bbox(coco_ann["segmentation"])
+    mask, origin = decoded_mask
+    if mask is None:
         return [], None
-    bitmap = sly.Bitmap(mask)
+    bitmap = sly.Bitmap(mask, origin=sly.PointLocation(*origin))
     if g.CONVERT_RLE_TO_BITMAP:
         return None, bitmap
     return bitmap.to_contours(), None
 
 
-def create_sly_ann_from_coco_annotation(
-    meta: sly.ProjectMeta, coco_categories, coco_ann, image_size
+def finalize_dataset_meta(meta: sly.ProjectMeta, coco_categories, coco_annotations):
+    """Pre-scan: checks classes of all converted objects and writes meta.json."""
+    class_registry = ClassRegistry(meta, coco_categories)
+    check_dataset_classes(class_registry, coco_annotations)
+    class_registry.flush_meta()
+    return class_registry.meta
+
+
+def get_object_class_kinds(object):
+    """Kinds of the object classes used by the conversion of the COCO object, see ClassRegistry."""
+    kinds = []
+    segm = object.get("segmentation")
+    if segm is not None and len(segm) > 0:
+        kinds.append("polygon")
+        # RLE masks are converted to polygons otherwise
+        if type(segm) is dict and g.CONVERT_RLE_TO_BITMAP:
+            kinds.append("rle")
+    bbox = object.get("bbox")
+    if bbox is not None and len(bbox) == 4:
+        kinds.append("bbox")
+    return kinds
+
+
+def is_image_converted(img_id, img_info):
+    image_name = img_info.get("file_name")
+    if image_name is None:
+        return False
+    return g.image_index.get_image_path(os.path.basename(image_name), img_id) is not None
+
+
+def check_dataset_classes(class_registry: ClassRegistry, coco_annotations):
+    checked = set()  # (category id, kind) and "caption"
+    for img_id, img_info, img_ann in coco_annotations.iter_images():
+        image_converted = None
+        for object in img_ann:
+            category_id = object.get("category_id")
+            if category_id is None or class_registry.get_class_name(category_id) is None:
+                continue
+            kinds = [
+                kind
+                for kind in get_object_class_kinds(object)
+                if (category_id, kind) not in checked
+            ]
+            check_caption = object.get("caption") is not None and "caption" not in checked
+            if len(kinds) == 0 and not check_caption:
+                continue
+            if image_converted is None:
+                # classes are checked and created only for images which will be converted
+                image_converted = is_image_converted(img_id, img_info)
+            if not image_converted:
+                break
+            for kind in kinds:
+                if check_obj_class(class_registry, category_id, kind, object):
+                    checked.add((category_id, kind))
+            if check_caption:
+                checked.add("caption")
+                if class_registry.caption_tag_meta is None:
+                    sly.logger.warn("Tag 'caption' is missing in the project meta")
+
+
+def check_obj_class(class_registry: ClassRegistry, category_id, kind, object):
+    """Returns False if the kind must be checked again on the next object of the category."""
+    obj_class_polygon = class_registry.get_obj_class(category_id, "polygon")
+    if kind == "polygon":
+        # the conversion fails for categories without polygon class as before
+        if obj_class_polygon is not None and obj_class_polygon.geometry_type != sly.Polygon:
+            wrong_geometry_first_warning(
+                obj_class_polygon.name, obj_class_polygon, sly.Polygon.geometry_name()
+            )
+        return True
+    if kind == "bbox":
+        obj_class_rectangle = class_registry.get_obj_class(category_id, "bbox")
+        if obj_class_rectangle is not None and obj_class_rectangle.geometry_type != sly.Rectangle:
+            wrong_geometry_first_warning(
+                obj_class_rectangle.name, obj_class_rectangle, sly.Rectangle.geometry_name()
+            )
+        return True
+    # objects with conflicting polygon class are skipped by the conversion
+    if obj_class_polygon is None or obj_class_polygon.geometry_type != sly.Polygon:
+        return True
+    if not rle_has_foreground(object["segmentation"]):
+        return False
+    obj_class_name_rle = class_registry.get_rle_class_name(category_id)
+    obj_class_bitmap = class_registry.meta.get_obj_class(obj_class_name_rle)
+    if obj_class_bitmap is None:
+        obj_class_bitmap = sly.ObjClass(obj_class_name_rle, sly.Bitmap, obj_class_polygon.color)
+        class_registry.add_obj_class(obj_class_bitmap)
+    elif obj_class_bitmap.geometry_type != sly.Bitmap:
+        wrong_geometry_first_warning(
+            obj_class_name_rle, obj_class_bitmap, sly.Bitmap.geometry_name()
+        )
+    return True
+
+
+class LabelsFactory:
+    """Creates sly.Label objects of the converted COCO objects."""
+
+    def label(self, geometry, obj_class, key):
+        return sly.Label(geometry, obj_class, binding_key=key)
+
+    def polygon(self, exterior, interior, obj_class, key):
+        return self.label(create_polygon(exterior, interior), obj_class, key)
+
+    def rectangle(self, top, left, bottom, right, obj_class, key):
+        return self.label(sly.Rectangle(top, left, bottom, right), obj_class, key)
+
+    def get_bbox(self, label):
+        bbox = label.geometry.to_bbox()
+        return bbox.top, bbox.left, bbox.bottom, bbox.right
+
+
+class LabelsJsonFactory(LabelsFactory):
+    """Creates json of polygons and rectangles inside the image without sly objects."""
+
+    def __init__(self, image_size):
+        self.height, self.width = image_size
+
+    def _is_inside(self, top, left, bottom, right):
+        return top >= 0 and left >= 0 and bottom < self.height and right < self.width
+
+    def _label_json(self, points, geometry_name, obj_class, key):
+        label_json = {
+            LabelJsonFields.OBJ_CLASS_NAME: obj_class.name,
+            LabelJsonFields.DESCRIPTION: "",
+            LabelJsonFields.TAGS: [],
+            POINTS: points,
+        }
+        # keys order of VectorGeometry.to_json() and Rectangle.to_json() updated by Label.to_json()
+        if geometry_name == sly.Polygon.geometry_name():
+            label_json[GEOMETRY_SHAPE] = geometry_name
+            label_json[GEOMETRY_TYPE] = geometry_name
+        else:
+            label_json[GEOMETRY_TYPE] = geometry_name
+            label_json[GEOMETRY_SHAPE] = geometry_name
+        if obj_class.sly_id is not None:
+            label_json[LabelJsonFields.OBJ_CLASS_ID] = obj_class.sly_id
+        if key is not None:
+            label_json[LabelJsonFields.INSTANCE_KEY] = key
+        return label_json
+
+    def polygon(self, exterior, interior, obj_class, key):
+        # polygons with less than 3 points are completed with a warning by sly.Polygon
+        if obj_class.geometry_type is not sly.Polygon or any(
+            len(points) < 3 for points in [exterior, *interior]
+        ):
+            return super().polygon(exterior, interior, obj_class, key)
+        # the same rounding as in sly.PointLocation
+        exterior_json = [[math.floor(x), math.floor(y)] for x, y in exterior]
+        cols, rows = zip(*exterior_json)
+        bbox = min(rows), min(cols), max(rows), max(cols)
+        if not self._is_inside(*bbox):
+            return super().polygon(exterior, interior, obj_class, key)
+        points = {
+            EXTERIOR: exterior_json,
+            INTERIOR: [[[math.floor(x), math.floor(y)] for x, y in ring] for ring in interior],
+        }
+        return self._label_json(points, sly.Polygon.geometry_name(), obj_class, key), bbox
+
+    def rectangle(self, top, left, bottom, right, obj_class, key):
+        bbox = top, left, bottom, right
+        # incorrect values and classes are left to sly.Rectangle and sly.Label validation
+        if (
+            obj_class is None
+            or obj_class.geometry_type is not sly.Rectangle
+            or not all(type(value) in [int, float] and math.isfinite(value) for value in bbox)
+            or top > bottom
+            or left > right
+        ):
+            return super().rectangle(top, left, bottom, right, obj_class, key)
+        bbox = tuple(math.floor(value) for value in bbox)
+        if not self._is_inside(*bbox):
+            return super().rectangle(top, left, bottom, right, obj_class, key)
+        top, left, bottom, right = bbox
+        points = {EXTERIOR: [[left, top], [right, bottom]], INTERIOR: []}
+        return self._label_json(points, sly.Rectangle.geometry_name(), obj_class, key), bbox
+
+    def get_bbox(self, label):
+        if isinstance(label, sly.Label):
+            return super().get_bbox(label)
+        return label[1]
+
+
+def get_object_kind(object):
+    """Kind of the COCO object reported in metrics: "rle", "polygon" or "bbox"."""
+    segm = object.get("segmentation")
+    if type(segm) is dict:
+        return "rle"
+    if type(segm) is list and len(segm) > 0:
+        return "polygon"
+    return "bbox"
+
+
+def convert_coco_object(
+    class_registry: ClassRegistry, object, decoded_mask, image_size, factory: LabelsFactory
+):
+    """Returns labels and the caption tag (or None) of a single COCO object."""
+    labels = []
+    category_id = object.get("category_id")
+    if category_id is None:
+        return labels, None
+    obj_class_name = class_registry.get_class_name(category_id)
+    if obj_class_name is None:
+        sly.logger.warn(f"Category with id {category_id} not found in categories list")
+        return labels, None
+
+    segm = object.get("segmentation")
+    curr_labels = []
+    key = None
+    if segm is not None and len(segm) > 0:
+        obj_class_polygon = class_registry.get_obj_class(category_id, "polygon")
+
+        if obj_class_polygon.geometry_type != sly.Polygon:
+            wrong_geometry_first_warning(
+                obj_class_name, obj_class_polygon, sly.Polygon.geometry_name()
+            )
+            return labels, None
+        elif type(segm) is dict:
+            polygons, mask = convert_rle_mask_to_polygon(object, decoded_mask)
+            key = uuid.uuid4().hex
+            if mask is not None:
+                obj_class_bitmap = class_registry.get_obj_class(category_id, "rle")
+                if obj_class_bitmap.geometry_type != sly.Bitmap:
+                    wrong_geometry_first_warning(
+                        obj_class_bitmap.name, obj_class_bitmap, sly.Bitmap.geometry_name()
+                    )
+                    return labels, None
+                curr_labels.append(factory.label(mask, obj_class_bitmap, key))
+            else:
+                for polygon in polygons:
+                    curr_labels.append(factory.label(polygon, obj_class_polygon, key))
+        elif type(segm) is list and object["segmentation"]:
+            with g.metrics.timer("polygon_nesting"):
+                rings = get_polygon_rings(object, image_size)
+            key = uuid.uuid4().hex
+            curr_labels.extend(
+                [
+                    factory.polygon(exterior, interior, obj_class_polygon, key)
+                    for exterior, interior in rings
+                ]
+            )
+
+    bbox = object.get("bbox")
+    if bbox is not None and len(bbox) == 4:
+        obj_class_rectangle = class_registry.get_obj_class(category_id, "bbox")
+        if len(curr_labels) > 1:
+            for label in curr_labels:
+                labels.append(factory.rectangle(*factory.get_bbox(label), obj_class_rectangle, key))
+        else:
+            x, y, w, h = bbox
+            labels.append(factory.rectangle(y, x, y + h, x + w, obj_class_rectangle, key))
+    labels.extend(curr_labels)
+
+    caption = object.get("caption")
+    if caption is None:
+        return labels, None
+    return labels, sly.Tag(class_registry.caption_tag_meta, caption)
+
+
+def convert_coco_objects(
+    class_registry: ClassRegistry, coco_ann, image_size, factory: LabelsFactory
 ):
     labels = []
     imag_tags = []
-    name_cat_id_map = coco_category_to_class_name(coco_categories)
-    for object in coco_ann:
-        category_id = object.get("category_id")
-        if category_id is None:
-            continue
-        obj_class_name = name_cat_id_map.get(category_id)
-        if obj_class_name is None:
-            sly.logger.warn(f"Category with id {category_id} not found in categories list")
-            continue
+    rle_objects = [
+        idx for idx, object in enumerate(coco_ann) if type(object.get("segmentation")) is dict
+    ]
+    rle_segmentations = [coco_ann[idx]["segmentation"] for idx in rle_objects]
+    with g.metrics.timer("rle_decoding"):
+        decoded_masks = dict(zip(rle_objects, decode_rles_in_bbox(rle_segmentations)))
+    for idx, object in enumerate(coco_ann):
+        start = time.perf_counter()
+        object_labels, tag = convert_coco_object(
+            class_registry, object, decoded_masks.get(idx), image_size, factory
+        )
+        labels.extend(object_labels)
+        if tag is not None:
+            imag_tags.append(tag)
+        g.metrics.add_object_time(
+            time.perf_counter() - start,
+            object.get("id"),
+            object.get("image_id"),
+            object.get("category_id"),
+            get_object_kind(object),
+        )
 
-        segm = object.get("segmentation")
-        curr_labels = []
-        key = None
-        if segm is not None and len(segm) > 0:
-            obj_class_polygon = meta.get_obj_class(obj_class_name)
+    return labels, imag_tags
 
-            if obj_class_polygon.geometry_type != sly.Polygon:
-                wrong_geometry_first_warning(obj_class_name, obj_class_polygon, sly.Polygon.geometry_name())
-                continue
-            elif type(segm) is dict:
-                polygons, mask = convert_rle_mask_to_polygon(object)
-                key = uuid.uuid4().hex
-                if mask is not None:
-                    obj_class_name_rle = obj_class_name
-                    if not obj_class_name_rle.endswith("rle"):
-                        obj_class_name_rle = add_tail(obj_class_name_rle, "rle")
-                    obj_class_bitmap = meta.get_obj_class(obj_class_name_rle)
-                    if obj_class_bitmap is None:
-                        obj_class_bitmap = sly.ObjClass(
-                            obj_class_name_rle, sly.Bitmap, obj_class_polygon.color
-                        )
-                        meta = update_and_dump_meta(meta, obj_class_bitmap)
-                    elif obj_class_bitmap.geometry_type != sly.Bitmap:
-                        wrong_geometry_first_warning(obj_class_name_rle, obj_class_bitmap, sly.Bitmap.geometry_name())
-                        continue
-                    label = sly.Label(mask, obj_class_bitmap, binding_key=key)
-                    curr_labels.append(label)
-                else:
-                    for polygon in polygons:
-                        figure = polygon
-                        label = sly.Label(figure, obj_class_polygon, binding_key=key)
-                        curr_labels.append(label)
-            elif type(segm) is list and object["segmentation"]:
-                figures = convert_polygon_vertices(object, image_size)
-                key = uuid.uuid4().hex
-                curr_labels.extend(
-                    [sly.Label(figure, obj_class_polygon, binding_key=key) for figure in figures]
-                )
 
-        bbox = object.get("bbox")
-        if bbox is not None and len(bbox) == 4:
-            if not obj_class_name.endswith("bbox"):
-                obj_class_name = add_tail(obj_class_name, "bbox")
-            obj_class_rectangle = meta.get_obj_class(obj_class_name)
-            if len(curr_labels) > 1:
-                for label in curr_labels:
-                    bbox = label.geometry.to_bbox()
-                    labels.append(sly.Label(bbox, obj_class_rectangle, binding_key=key))
-            else:
-                x, y, w, h = bbox
-                rectangle = sly.Label(
-                    sly.Rectangle(y, x, y + h, x + w), obj_class_rectangle, binding_key=key
-                )
-                labels.append(rectangle)
-        labels.extend(curr_labels)
+def create_sly_ann_from_coco_annotation(class_registry: ClassRegistry, coco_ann, image_size):
+    labels, img_tags = convert_coco_objects(class_registry, coco_ann, image_size, LabelsFactory())
+    return sly.Annotation(image_size, labels=labels, img_tags=img_tags)
 
-        caption = object.get("caption")
-        if caption is not None:
-            imag_tags.append(sly.Tag(meta.get_tag_meta("caption"), caption))
 
-    return sly.Annotation(image_size, labels=labels, img_tags=imag_tags), meta
+def create_sly_ann_json_from_coco_annotation(class_registry: ClassRegistry, coco_ann, image_size):
+    """The same as annotation_to_json(create_sly_ann_from_coco_annotation(...))."""
+    if None in image_size:
+        ann = create_sly_ann_from_coco_annotation(class_registry, coco_ann, image_size)
+        return annotation_to_json(ann)
+    labels, img_tags = convert_coco_objects(
+        class_registry, coco_ann, image_size, LabelsJsonFactory(image_size)
+    )
+    canvas = sly.Rectangle.from_size(image_size)
+    items = []
+    for label in labels:
+        if isinstance(label, sly.Label):
+            items.extend(label.crop(canvas))
+        else:
+            items.append(label[0])
+    with g.metrics.timer("annotation_json"):
+        labels_json = iter(labels_to_json([item for item in items if isinstance(item, sly.Label)]))
+    ann_json = get_empty_annotation_json(image_size)
+    ann_json[AnnotationJsonFields.IMG_TAGS] = sly.TagCollection(img_tags).to_json()
+    ann_json[AnnotationJsonFields.LABELS] = [
+        next(labels_json) if isinstance(item, sly.Label) else item for item in items
+    ]
+    return ann_json
 
 
 def create_sly_dataset_dir(dataset_name):
@@ -282,38 +755,303 @@ def remove_empty_sly_dataset_dir(dataset_name):
         shutil.rmtree(dataset_dir)
 
 
-def move_trainvalds_to_sly_dataset(dataset, coco_image, ann):
+def move_trainvalds_to_sly_dataset(dataset, coco_image, ann_json, coco_img_path):
     image_name = coco_image["file_name"]
     if "/" in image_name:
         image_name = os.path.basename(image_name)
-    ann_json = ann.to_json()
-    coco_img_path = os.path.join(g.src_img_dir, image_name)
     sly_img_path = os.path.join(g.img_dir, image_name)
-    if file_exists(os.path.join(coco_img_path)):
-        sly.json.dump_json_file(ann_json, os.path.join(g.ann_dir, f"{image_name}.json"))
-        shutil.move(coco_img_path, sly_img_path)
+    sly_ann_path = os.path.join(g.ann_dir, f"{image_name}.json")
+    with g.metrics.timer("annotation_write"):
+        sly.json.dump_json_file(ann_json, sly_ann_path)
+    with g.metrics.timer("image_move"):
+        g.input_source.move(coco_img_path, sly_img_path)
+    return image_name, sly_img_path, sly_ann_path
 
 
-def move_testds_to_sly_dataset(dataset, image_cnt):
+def check_dataset_images(dataset, coco_annotations):
+    """Images with missing files and with file names of previous images are skipped."""
+    missing, duplicates = g.image_index.assign_images(coco_annotations.images)
+    if len(missing) > 0:
+        sly.logger.warn(
+            f"{len(missing)} images of {dataset} dataset are not found in '{g.src_img_dir}' folder",
+            extra={"missing_files": missing[:MISSING_FILES_REPORT_LIMIT]},
+        )
+    if len(duplicates) > 0:
+        sly.logger.warn(
+            f"{len(duplicates)} images of {dataset} dataset have the same file name "
+            "as previous images, only the first image with the file name is converted",
+            extra={"duplicate_files": duplicates[:MISSING_FILES_REPORT_LIMIT]},
+        )
+
+
+def convert_trainval_image(dataset, class_registry: ClassRegistry, img_id, img_info, img_ann):
+    """Returns status and (name, image path, annotation path or json in direct mode)."""
+    image_name = img_info.get("file_name")
+    if image_name is None:
+        return "incorrect", None
+    if "/" in image_name:
+        image_name = os.path.basename(image_name)
+    coco_img_path = g.image_index.get_image_path(image_name, img_id)
+    if coco_img_path is None:
+        return "skipped", None
+    if g.checkpoint.is_converted(dataset, image_name):
+        return "converted", None
+    img_size = get_image_size_from_coco_annotation(img_info, img_id)
+    if g.DIRECT_ANNOTATION_JSON:
+        ann_json = create_sly_ann_json_from_coco_annotation(
+            class_registry=class_registry,
+            coco_ann=img_ann,
+            image_size=img_size,
+        )
+    else:
+        ann = create_sly_ann_from_coco_annotation(
+            class_registry=class_registry,
+            coco_ann=img_ann,
+            image_size=img_size,
+        )
+        with g.metrics.timer("annotation_json"):
+            ann_json = annotation_to_json(ann)
+    if g.UPLOAD_MODE == "direct":
+        with g.metrics.timer("image_move"):
+            img_path = g.input_source.get_local_path(coco_img_path, g.img_dir)
+        return "converted", (image_name, img_path, ann_json)
+    item = move_trainvalds_to_sly_dataset(
+        dataset=dataset, coco_image=img_info, ann_json=ann_json, coco_img_path=coco_img_path
+    )
+    return "converted", item
+
+
+def convert_trainval_image_timed(dataset, class_registry: ClassRegistry, img_id, img_info, img_ann):
+    start = time.perf_counter()
+    result = convert_trainval_image(dataset, class_registry, img_id, img_info, img_ann)
+    g.metrics.add_image_time(
+        time.perf_counter() - start, img_id, img_info.get("file_name"), len(img_ann)
+    )
+    return result
+
+
+def init_conversion_worker(dataset, meta, coco_categories):
+    conversion_worker_context.update(
+        dataset=dataset, class_registry=ClassRegistry(meta, coco_categories)
+    )
+
+
+def convert_trainval_images_chunk(tasks):
+    """Runs in a worker process, returns results and metrics of the worker."""
+    context = conversion_worker_context
+    with g.metrics.profiled(f"convert_{context['dataset']}_worker"):
+        results = [
+            convert_trainval_image_timed(context["dataset"], context["class_registry"], *task)
+            for task in tasks
+        ]
+    return results, g.metrics.pop_local()
+
+
+def iter_chunks_results(dataset, chunks_results):
+    """Flattens results of convert_trainval_images_chunk and merges metrics of the workers."""
+    for results, local_metrics in chunks_results:
+        g.metrics.merge_local(dataset, local_metrics)
+        yield from results
+
+
+class ConvertedItems:
+    """Passes converted items to the uploader and records them to the checkpoint."""
+
+    def __init__(self, dataset, meta, uploader=None):
+        self.dataset = dataset
+        self.meta = meta
+        self.uploader = uploader
+        self._names = []
+
+    def add(self, item):
+        if self.uploader is not None:
+            self.uploader.add_item(self.dataset, *item, meta=self.meta)
+            return
+        self._names.append(item[0])
+        if len(self._names) >= CHECKPOINT_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        g.checkpoint.add_converted(self.dataset, self._names)
+        self._names = []
+
+
+def convert_trainval_dataset(
+    dataset, meta, coco_categories, coco_annotations, uploader=None, cache_writer=None
+):
+    """Returns counters of converted, incorrect and skipped images and the project meta."""
+    check_dataset_images(dataset, coco_annotations)
+    if g.VERIFY_IMAGES:
+        with g.metrics.stage("verify_images", dataset) as stage:
+            image_verification.verify_trainval_images(dataset, coco_annotations)
+            stage.items += len(coco_annotations.images)
+    with g.metrics.stage("prescan_meta", dataset) as stage:
+        meta = finalize_dataset_meta(meta, coco_categories, coco_annotations)
+        stage.items += len(coco_annotations.images)
+    class_registry = ClassRegistry(meta, coco_categories)
+
     ds_progress = sly.Progress(
-        f"Converting dataset: {dataset}",
-        len(os.listdir(g.src_img_dir)),
+        message=f"Converting dataset: {dataset}",
+        total_cnt=len(coco_annotations.images),
         min_report_percent=1,
     )
-    for image in os.listdir(g.src_img_dir):
-        if not sly.image.has_valid_ext(image):
-            continue
-        src_image_path = os.path.join(g.src_img_dir, image)
-        dst_image_path = os.path.join(g.dst_img_dir, image)
-        shutil.move(src_image_path, dst_image_path)
-        im = Image.open(dst_image_path)
-        width, height = im.size
-        img_size = (height, width)
-        ann = sly.Annotation(img_size)
-        ann_json = ann.to_json()
-        sly.json.dump_json_file(ann_json, os.path.join(g.ann_dir, f"{image}.json"))
-        ds_progress.iter_done_report()
-        image_cnt += 1
+    counters = {"converted": 0, "incorrect": 0, "skipped": 0}
+    tasks = coco_annotations.iter_images()
+
+    pool = None
+    workers = parallel.get_workers_count(g.CONVERSION_WORKERS, len(coco_annotations.images))
+    if workers > 1:
+        pool = parallel.get_process_pool(
+            workers, initializer=init_conversion_worker, initargs=(dataset, meta, coco_categories)
+        )
+
+    if pool is None:
+        results = (
+            convert_trainval_image_timed(dataset, class_registry, img_id, img_info, img_ann)
+            for img_id, img_info, img_ann in tasks
+        )
+        # workers are profiled separately, see convert_trainval_images_chunk
+        profiled = g.metrics.profiled(f"convert_{dataset}")
+    else:
+        sly.logger.info(f"Converting dataset {dataset} using {workers} processes")
+        chunks = parallel.chunked(tasks, CONVERSION_CHUNK_SIZE)
+        results = iter_chunks_results(
+            dataset,
+            parallel.imap_ordered(
+                pool, convert_trainval_images_chunk, chunks, max_pending=workers * 2
+            ),
+        )
+        profiled = nullcontext()
+
+    items = ConvertedItems(dataset, meta, uploader)
+    try:
+        with g.metrics.stage("convert", dataset) as stage, profiled:
+            for status, item in results:
+                counters[status] += 1
+                stage.items += 1
+                if cache_writer is not None and status == "converted":
+                    if item is None:
+                        cache_writer.is_complete = False
+                    else:
+                        # the uploader may remove the annotation file after the upload
+                        cache_writer.add(item[0], item[2])
+                if item is not None:
+                    items.add(item)
+                ds_progress.iter_done_report()
+    except BaseException:
+        if cache_writer is not None:
+            cache_writer.discard()
+        raise
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        items.flush()
+        g.metrics.merge_local(dataset, g.metrics.pop_local())
+    if cache_writer is not None:
+        cache_writer.commit(counters, meta)
+    return counters, meta
+
+
+def convert_cached_image(entry, name):
+    """The same as convert_trainval_image, but the annotation is taken from the cache entry."""
+    coco_img_path = g.image_index.get_image_path(name)
+    if g.UPLOAD_MODE == "direct":
+        with g.metrics.timer("image_move"):
+            img_path = g.input_source.get_local_path(coco_img_path, g.img_dir)
+        return name, img_path, entry.read_annotation(name)
+    sly_img_path = os.path.join(g.img_dir, name)
+    sly_ann_path = os.path.join(g.ann_dir, f"{name}.json")
+    with g.metrics.timer("annotation_write"):
+        entry.extract_annotation(name, sly_ann_path)
+    with g.metrics.timer("image_move"):
+        g.input_source.move(coco_img_path, sly_img_path)
+    return name, sly_img_path, sly_ann_path
+
+
+def convert_cached_dataset(dataset, entry, uploader=None):
+    """The same as convert_trainval_dataset, but annotations are taken from the cache."""
+    meta = entry.meta
+    g.META = meta
+    sly.json.dump_json_file(meta.to_json(), os.path.join(g.SLY_BASE_DIR, "meta.json"))
+    names = [name for name in entry.names if not g.checkpoint.is_converted(dataset, name)]
+    ds_progress = sly.Progress(f"Converting dataset: {dataset}", len(names), min_report_percent=1)
+    threads = parallel.get_workers_count(g.IMAGE_THREADS, len(names))
+    items = ConvertedItems(dataset, meta, uploader)
+    try:
+        with g.metrics.stage("convert_cached", dataset) as stage, ThreadPoolExecutor(
+            max_workers=threads
+        ) as executor:
+            convert = functools.partial(convert_cached_image, entry)
+            for item in parallel.imap_ordered(executor, convert, names, threads * 4):
+                items.add(item)
+                ds_progress.iter_done_report()
+                stage.items += 1
+    finally:
+        items.flush()
+        g.metrics.merge_local(dataset, g.metrics.pop_local())
+    return dict(entry.counters), meta
+
+
+def get_empty_annotation_json(img_size):
+    """The same as sly.Annotation(img_size).to_json(), but without creating the annotation."""
+    height, width = img_size
+    return {
+        **EMPTY_ANNOTATION_JSON,
+        AnnotationJsonFields.IMG_SIZE: {
+            AnnotationJsonFields.IMG_SIZE_HEIGHT: height,
+            AnnotationJsonFields.IMG_SIZE_WIDTH: width,
+        },
+    }
+
+
+def convert_test_image(image):
+    """Moves the image of the dataset without annotations and writes the empty annotation."""
+    src_image_path = g.image_index.get_image_path(image)
+    if g.UPLOAD_MODE == "direct":
+        with g.metrics.timer("image_move"):
+            img_path = g.input_source.get_local_path(src_image_path, g.dst_img_dir)
+    else:
+        img_path = os.path.join(g.dst_img_dir, image)
+        with g.metrics.timer("image_move"):
+            g.input_source.move(src_image_path, img_path)
+    with g.metrics.timer("image_size"):
+        ann_json = get_empty_annotation_json(image_utils.get_image_size(img_path))
+    if g.UPLOAD_MODE == "direct":
+        return image, img_path, ann_json
+    ann_path = os.path.join(g.ann_dir, f"{image}.json")
+    with g.metrics.timer("annotation_write"):
+        sly.json.dump_json_file(ann_json, ann_path)
+    return image, img_path, ann_path
+
+
+def move_testds_to_sly_dataset(dataset, image_cnt, meta=None, uploader=None):
+    """Images are moved in a thread pool and uploaded in the original order."""
+    images = [image for image in g.image_index.names() if sly.image.has_valid_ext(image)]
+    # images converted before the restart are counted, but not moved again
+    done_images = [image for image in images if g.checkpoint.is_converted(dataset, image)]
+    if len(done_images) > 0:
+        image_cnt += len(done_images)
+        done_images = set(done_images)
+        images = [image for image in images if image not in done_images]
+    if g.VERIFY_IMAGES:
+        with g.metrics.stage("verify_images", dataset) as stage:
+            image_verification.verify_test_images(dataset, images)
+            stage.items += len(images)
+    ds_progress = sly.Progress(f"Converting dataset: {dataset}", len(images), min_report_percent=1)
+    threads = parallel.get_workers_count(g.IMAGE_THREADS, len(images))
+    items = ConvertedItems(dataset, meta, uploader)
+    try:
+        with g.metrics.stage("move_images", dataset) as stage, ThreadPoolExecutor(
+            max_workers=threads
+        ) as executor:
+            for item in parallel.imap_ordered(executor, convert_test_image, images, threads * 4):
+                items.add(item)
+                ds_progress.iter_done_report()
+                image_cnt += 1
+                stage.items += 1
+    finally:
+        items.flush()
+        g.metrics.merge_local(dataset, g.metrics.pop_local())
     return image_cnt
 
 
@@ -321,14 +1059,14 @@ def get_ann_path(ann_dir, dataset_name, is_original):
     instances_ann, captions_ann = None, None
     if is_original:
         instances_ann = os.path.join(ann_dir, f"instances_{dataset_name}.json")
-        if not (os.path.exists(instances_ann) and os.path.isfile(instances_ann)):
+        if not g.input_source.file_exists(instances_ann):
             instances_ann = None
         if g.INCLUDE_CAPTIONS:
             captions_ann = os.path.join(ann_dir, f"captions_{dataset_name}.json")
-            if not (os.path.exists(captions_ann) and os.path.isfile(captions_ann)):
+            if not g.input_source.file_exists(captions_ann):
                 captions_ann = None
     else:
-        ann_files = glob.glob(os.path.join(ann_dir, "*.json"))
+        ann_files = g.input_source.list_files(ann_dir, "*.json")
         if len(ann_files) == 1:
             instances_ann, captions_ann = ann_files[0], None
             if g.INCLUDE_CAPTIONS:
@@ -378,6 +1116,22 @@ def get_ann_path(ann_dir, dataset_name, is_original):
     return instances_ann, captions_ann
 
 
+def get_conversion_cache_key(dataset, instances_ann_path, captions_ann_path):
+    """Key of the dataset in the conversion cache, see conversion_cache.get_dataset_key."""
+    ann_paths = [instances_ann_path]
+    if captions_ann_path is not None and g.input_source.file_exists(captions_ann_path):
+        ann_paths.append(captions_ann_path)
+    options = {
+        "rle_to_bitmap": g.CONVERT_RLE_TO_BITMAP,
+        "captions": g.INCLUDE_CAPTIONS,
+        # meta of the original datasets is created only for the first dataset
+        "meta_exists": os.path.exists(os.path.join(g.SLY_BASE_DIR, "meta.json")),
+    }
+    return conversion_cache.get_dataset_key(
+        g.input_source, dataset, ann_paths, options, g.META, g.image_index.names()
+    )
+
+
 def get_image_size_from_coco_annotation(image_info, img_id):
     for key in ["height", "width"]:
         if key not in image_info:
@@ -1,90 +1,268 @@
 import os
 import shutil
-
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from os.path import basename, dirname, normpath
 
 import requests
-from supervisely.io.fs import download, file_exists, mkdir, silent_remove, dir_exists
+from supervisely._utils import get_string_hash
+from supervisely.io.fs import (
+    dir_exists,
+    download,
+    file_exists,
+    get_file_ext,
+    mkdir,
+    remove_dir,
+    silent_remove,
+)
 import supervisely as sly
 
 import dl_progress
 import globals as g
+import input_source
+import parallel
+import ranged_download
+import zip_stream
+
+
+def get_download_headers(link):
+    return requests.head(link, allow_redirects=True).headers
+
+
+def get_download_size(headers):
+    return int(headers.get("content-length", 0))
 
 
 def download_file_from_link(
-    link, file_name, archive_path, progress_message, app_logger
+    link, file_name, archive_path, progress_message, app_logger, progress_cb=None, headers=None
 ):
-    response = requests.head(link, allow_redirects=True)
-    sizeb = int(response.headers.get("content-length", 0))
-    progress_cb = dl_progress.get_progress_cb(
-        g.api, g.TASK_ID, progress_message, sizeb, is_size=True
-    )
+    """
+    Downloads the file, if progress_cb is passed, it is used instead of a new progress.
+    The HEAD request is sent only if its headers are not passed.
+    """
+    if headers is None:
+        headers = get_download_headers(link)
+    sizeb = get_download_size(headers)
+    shared_progress = progress_cb is not None
+    if not shared_progress:
+        progress_cb = dl_progress.get_progress_cb(
+            g.api, g.TASK_ID, progress_message, sizeb, is_size=True
+        )
     if not file_exists(archive_path):
-        download(link, archive_path, cache=g.my_app.cache, progress=progress_cb)
-        dl_progress.reset_progress(g.api, g.TASK_ID)
+        cache = g.my_app.cache
+        is_cached = cache is not None and cache.check_storage_object(
+            get_string_hash(link), get_file_ext(archive_path)
+        )
+        is_ranged = (
+            g.DOWNLOAD_CONNECTIONS > 1
+            and not is_cached
+            and ranged_download.supports_ranges(headers, sizeb)
+        )
+        if is_ranged:
+            try:
+                ranged_download.download_ranged(
+                    link, archive_path, sizeb, g.DOWNLOAD_CONNECTIONS, progress_cb=progress_cb
+                )
+            except ranged_download.RangesNotSupported:
+                app_logger.warn(f"Server ignored range requests, downloading {file_name} again")
+                is_ranged = False
+            else:
+                if cache is not None:
+                    cache.write_object(archive_path, get_string_hash(link))
+        if not is_ranged:
+            download(link, archive_path, cache=cache, progress=progress_cb)
+        if not shared_progress:
+            dl_progress.reset_progress(g.api, g.TASK_ID)
         app_logger.info(f"{file_name} has been successfully downloaded")
 
 
-def download_coco_images(dataset, archive_path, save_path, app_logger):
+def download_and_extract_zip(
+    link, file_name, save_path, progress_message, app_logger, member_filter=None, progress_cb=None
+):
+    """Extracts zip archive while it is being downloaded, the archive is not saved on disk."""
+    shared_progress = progress_cb is not None
+    with requests.get(link, stream=True) as response:
+        response.raise_for_status()
+        sizeb = int(response.headers.get("content-length", 0))
+        if not shared_progress:
+            progress_cb = dl_progress.get_progress_cb(
+                g.api, g.TASK_ID, progress_message, sizeb, is_size=True
+            )
+        zip_stream.extract_zip_stream(
+            response.iter_content(chunk_size=zip_stream.CHUNK_SIZE),
+            save_path,
+            member_filter=member_filter,
+            progress_cb=progress_cb,
+        )
+    if not shared_progress:
+        dl_progress.reset_progress(g.api, g.TASK_ID)
+    app_logger.info(f"{file_name} has been successfully downloaded and extracted")
+
+
+def download_coco_images(
+    dataset, archive_path, save_path, app_logger, progress_cb=None, headers=None
+):
     link = g.images_links[dataset]
     file_name = f"{dataset}.zip"
+    progress_message = f"Download {file_name}"
+    if g.STREAM_DOWNLOADS:
+        prefix = f"{dataset}/"
+
+        def to_images_dir(member_name):
+            if member_name.startswith(prefix):
+                return os.path.join("images", member_name[len(prefix) :])
+            return member_name
+
+        download_and_extract_zip(
+            link, file_name, save_path, progress_message, app_logger, to_images_dir, progress_cb
+        )
+        return
     download_file_from_link(
-        link, file_name, archive_path, f"Download {file_name}", app_logger
+        link, file_name, archive_path, progress_message, app_logger, progress_cb, headers
     )
     shutil.unpack_archive(archive_path, save_path, format="zip")
     os.rename(os.path.join(save_path, dataset), os.path.join(save_path, "images"))
     silent_remove(archive_path)
 
 
-def download_coco_annotations(dataset, archive_path, save_path, app_logger):
-    link = None
-    file_name = None
-    ann_dir = os.path.join(save_path, "annotations")
+def get_annotations_archive_name(dataset):
     if dataset in ["train2014", "val2014"]:
-        if os.path.exists(ann_dir):
-            return
-        link = g.annotations_links["trainval2014"]
-        file_name = "trainval2014.zip"
-    elif dataset in ["train2017", "val2017"]:
-        if os.path.exists(ann_dir):
-            return
-        link = g.annotations_links["trainval2017"]
-        file_name = "trainval2017.zip"
+        return "trainval2014"
+    if dataset in ["train2017", "val2017"]:
+        return "trainval2017"
+    return None
+
+
+def extract_coco_annotations(archive_path, datasets, app_logger):
+    """
+    Extracts only instances (and captions if enabled) annotation files of the given datasets
+    from the annotations archive, members are found in the zip central directory.
+    """
+    with zipfile.ZipFile(archive_path) as archive:
+        members = set(archive.namelist())
+        for dataset in datasets:
+            dataset_dir = os.path.join(g.COCO_BASE_DIR, dataset)
+            tmp_ann_dir = os.path.join(dataset_dir, "annotations.tmp")
+            mkdir(tmp_ann_dir, remove_content_if_exists=True)
+            file_names = [f"instances_{dataset}.json"]
+            if g.INCLUDE_CAPTIONS:
+                file_names.append(f"captions_{dataset}.json")
+            for file_name in file_names:
+                member = f"annotations/{file_name}"
+                if member not in members:
+                    app_logger.warn(f"{member} not found in {basename(archive_path)}")
+                    continue
+                dst_path = os.path.join(tmp_ann_dir, file_name)
+                with archive.open(member) as src, open(dst_path, "wb") as dst:
+                    shutil.copyfileobj(src, dst, zip_stream.CHUNK_SIZE)
+            os.rename(tmp_ann_dir, os.path.join(dataset_dir, "annotations"))
+
+
+def get_annotations_archives(datasets):
+    """Groups datasets by annotations archives, datasets with downloaded annotations are skipped."""
+    archives_datasets = {}
+    for dataset in datasets:
+        archive_name = get_annotations_archive_name(dataset)
+        ann_dir = os.path.join(g.COCO_BASE_DIR, dataset, "annotations")
+        if archive_name is None or os.path.exists(ann_dir):
+            continue
+        archives_datasets.setdefault(archive_name, []).append(dataset)
+    return archives_datasets
+
+
+def get_annotations_archive_path(archive_name):
+    return os.path.join(g.COCO_BASE_DIR, f"annotations_{archive_name}.zip")
+
+
+def download_coco_annotations(archive_name, datasets, app_logger, progress_cb=None, headers=None):
+    """Downloads the annotations archive once for all selected datasets of the same year."""
+    link = g.annotations_links[archive_name]
+    file_name = f"{archive_name}.zip"
+    archive_path = get_annotations_archive_path(archive_name)
     download_file_from_link(
-        link, file_name, archive_path, f"Download {file_name}", app_logger
+        link, file_name, archive_path, f"Download {file_name}", app_logger, progress_cb, headers
     )
-    shutil.unpack_archive(archive_path, save_path, format="zip")
-    for file in os.listdir(ann_dir):
-        if file != f"instances_{dataset}.json" and file != f"captions_{dataset}.json":
-            silent_remove(os.path.join(ann_dir, file))
+    extract_coco_annotations(archive_path, datasets, app_logger)
     silent_remove(archive_path)
 
 
+def run_download_task(key, func, args, app_logger, progress_cb, headers):
+    func(*args, app_logger, progress_cb, headers)
+    g.checkpoint.add_download(key)
+
+
 def download_original_coco_dataset(datasets, app_logger):
+    """
+    Downloads and extracts images archives of the datasets and the shared annotations archives
+    concurrently, the progress of all downloads is reported as a single progress.
+    Archives downloaded and extracted before the restart are skipped.
+    """
+    tasks = []
     for dataset in datasets:
+        if g.checkpoint.is_downloaded(dataset):
+            continue
         dataset_dir = os.path.join(g.COCO_BASE_DIR, dataset)
         mkdir(dataset_dir)
         archive_path = f"{dataset_dir}.zip"
-        download_coco_images(dataset, archive_path, dataset_dir, app_logger)
-        if not dataset.startswith("test"):
-            download_coco_annotations(dataset, archive_path, dataset_dir, app_logger)
+        if g.checkpoint.is_resumed:
+            # the archive or the images may be incomplete
+            silent_remove(archive_path)
+            remove_dir(os.path.join(dataset_dir, "images"))
+            remove_dir(os.path.join(dataset_dir, dataset))
+        images_args = (dataset, archive_path, dataset_dir)
+        tasks.append(
+            (dataset, g.images_links[dataset], archive_path, download_coco_images, images_args)
+        )
+    for archive_name, archive_datasets in get_annotations_archives(datasets).items():
+        archive_path = get_annotations_archive_path(archive_name)
+        if g.checkpoint.is_resumed:
+            silent_remove(archive_path)
+        annotations_args = (archive_name, archive_datasets)
+        link = g.annotations_links[archive_name]
+        tasks.append(
+            (archive_name, link, archive_path, download_coco_annotations, annotations_args)
+        )
+
+    # a single HEAD request per archive, its headers are passed to the download
+    headers = {key: get_download_headers(link) for key, link, _, _, _ in tasks}
+    # already downloaded archives are only extracted
+    total_size = sum(
+        get_download_size(headers[key])
+        for key, _, archive_path, _, _ in tasks
+        if g.STREAM_DOWNLOADS or not file_exists(archive_path)
+    )
+    progress_cb = dl_progress.get_thread_safe_progress_cb(
+        g.api, g.TASK_ID, f"Download {len(tasks)} archives", total_size, is_size=True
+    )
+    workers = parallel.get_workers_count(g.DOWNLOAD_CONCURRENCY, len(tasks))
+    # archives are extracted while the next ones are downloaded, so both are measured together
+    with g.metrics.stage("download") as stage, ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                run_download_task, key, func, args, app_logger, progress_cb, headers[key]
+            )
+            for key, _, _, func, args in tasks
+        ]
+        for future in futures:
+            future.result()
+        stage.items += len(tasks)
+        stage.bytes += total_size
+    dl_progress.reset_progress(g.api, g.TASK_ID)
     return datasets
 
 
-def download_dir_from_supervisely(
-    path_to_remote_dir, dir_path, progress_message, app_logger
-):
+def download_dir_from_supervisely(path_to_remote_dir, dir_path, progress_message, app_logger):
     dir_size = g.api.file.get_directory_size(g.TEAM_ID, path_to_remote_dir)
     if not dir_exists(dir_path):
         progress_upload_cb = dl_progress.get_progress_cb(
             g.api, g.TASK_ID, progress_message, total=dir_size, is_size=True
         )
-        g.api.file.download_directory(
-            g.TEAM_ID, 
-            path_to_remote_dir, 
-            dir_path, 
-            progress_cb=progress_upload_cb
-        )
+        with g.metrics.stage("download") as stage:
+            g.api.file.download_directory(
+                g.TEAM_ID, path_to_remote_dir, dir_path, progress_cb=progress_upload_cb
+            )
+            stage.items += 1
+            stage.bytes += dir_size
 
         app_logger.info(f'Directory "{path_to_remote_dir}" has been successfully downloaded')
 
@@ -97,12 +275,15 @@ def download_file_from_supervisely(
         progress_upload_cb = dl_progress.get_progress_cb(
             g.api, g.TASK_ID, progress_message, total=file_size, is_size=True
         )
-        g.api.file.download(
-            g.TEAM_ID,
-            remote_path,
-            archive_path,
-            progress_cb=progress_upload_cb,
-        )
+        with g.metrics.stage("download") as stage:
+            g.api.file.download(
+                g.TEAM_ID,
+                remote_path,
+                archive_path,
+                progress_cb=progress_upload_cb,
+            )
+            stage.items += 1
+            stage.bytes += file_size
         app_logger.info(f'"{archive_name}" has been successfully downloaded')
 
 
@@ -111,25 +292,47 @@ def download_custom_coco_dataset(remote_path: str, app_logger):
         sly.logger.warn(f"Incorrect path to the custom dataset: {remote_path}")
         return []
 
-
     if g.INPUT_FILE:
         if not g.api.file.exists(g.TEAM_ID, g.INPUT_FILE):
             raise FileNotFoundError(f"File {g.INPUT_FILE} not found in Team Files")
         archive_name = basename(normpath(g.INPUT_FILE))
         archive_path = os.path.join(g.COCO_BASE_DIR, archive_name)
-        download_file_from_supervisely(
-            g.INPUT_FILE, archive_path, archive_name, f'Download "{archive_name}"', app_logger
-        )
-        app_logger.info("Unpacking archive...")
-        sly.fs.unpack_archive(archive_path, g.COCO_BASE_DIR, remove_junk=True)
-        silent_remove(archive_path)
-        coco_listdir = os.listdir(g.COCO_BASE_DIR)
-        assert len(os.listdir(g.COCO_BASE_DIR)) == 1, \
-            "ERROR: Archive must contain only 1 project folder with datasets in COCO format."
-        app_logger.info("Archive has been unpacked.")
+        is_downloaded = g.checkpoint.is_downloaded("input")
+        if not is_downloaded:
+            if g.checkpoint.is_resumed:
+                # the archive or the unpacked files may be incomplete
+                mkdir(g.COCO_BASE_DIR, remove_content_if_exists=True)
+            download_file_from_supervisely(
+                g.INPUT_FILE, archive_path, archive_name, f'Download "{archive_name}"', app_logger
+            )
+        if (
+            g.READ_FROM_ARCHIVE
+            and file_exists(archive_path)
+            and input_source.ArchiveInput.is_supported(archive_path)
+        ):
+            app_logger.info("Reading archive index...")
+            g.input_source = input_source.ArchiveInput(archive_path, g.COCO_BASE_DIR)
+        elif not is_downloaded:
+            if g.READ_FROM_ARCHIVE:
+                app_logger.warn(
+                    "Only zip and uncompressed tar archives can be read directly, "
+                    "the archive will be unpacked."
+                )
+            app_logger.info("Unpacking archive...")
+            with g.metrics.stage("unpack") as stage:
+                stage.bytes += os.path.getsize(archive_path)
+                sly.fs.unpack_archive(archive_path, g.COCO_BASE_DIR, remove_junk=True)
+                stage.items += 1
+            silent_remove(archive_path)
+            app_logger.info("Archive has been unpacked.")
+        g.checkpoint.add_download("input")
+        coco_listdir = g.input_source.listdir(g.COCO_BASE_DIR)
+        assert (
+            len(coco_listdir) == 1
+        ), "ERROR: Archive must contain only 1 project folder with datasets in COCO format."
         g.COCO_BASE_DIR = os.path.join(g.COCO_BASE_DIR, coco_listdir[0])
 
-        coco_listdir = os.listdir(g.COCO_BASE_DIR)
+        coco_listdir = g.input_source.listdir(g.COCO_BASE_DIR)
         if any(basename(normpath(x)) in ["images", "annotations"] for x in coco_listdir):
             g.COCO_BASE_DIR = dirname(normpath(g.COCO_BASE_DIR))
             sly.logger.info(f"COCO_BASE_DIR: {g.COCO_BASE_DIR}")
@@ -139,13 +342,19 @@ def download_custom_coco_dataset(remote_path: str, app_logger):
             raise FileNotFoundError(f"Directory {g.INPUT_DIR} not found in Team Files")
         dir_name = basename(normpath(g.INPUT_DIR))
         dir_path = os.path.join(g.COCO_BASE_DIR, dir_name)
-        download_dir_from_supervisely(g.INPUT_DIR, dir_path, f'Download "{dir_name}"', app_logger)
+        if not g.checkpoint.is_downloaded("input"):
+            # the directory may be incomplete
+            remove_dir(dir_path)
+            download_dir_from_supervisely(
+                g.INPUT_DIR, dir_path, f'Download "{dir_name}"', app_logger
+            )
+            g.checkpoint.add_download("input")
         g.COCO_BASE_DIR = os.path.join(g.COCO_BASE_DIR, dir_name)
         sly.fs.remove_junk_from_dir(g.COCO_BASE_DIR)
     else:
         sly.logger.warn(f"No valid data found in the given path: {remote_path}")
         return []
-    return list(os.listdir(g.COCO_BASE_DIR))
+    return list(g.input_source.listdir(g.COCO_BASE_DIR))
 
 
 def start(app_logger):
@@ -0,0 +1,406 @@
+import json
+import math
+import os
+import re
+import shutil
+import zlib
+from collections import defaultdict
+from typing import List
+
+import supervisely as sly
+from supervisely.io.fs import mkdir
+
+import input_source
+
+INSTANCES_REQUIRED_KEYS = ["annotations", "images", "categories"]
+CAPTIONS_REQUIRED_KEYS = ["annotations"]
+
+STREAM_CHUNK_SIZE = 16 * 1024 * 1024
+# approximate size of annotations (in the source file) loaded into memory at once in streaming mode
+STREAM_BUCKET_SIZE = 64 * 1024 * 1024
+STREAM_MAX_BUCKETS = 512
+
+
+ANN_TYPES = ["bbox", "segmentation", "caption"]
+
+
+class AnnotationsProfile:
+    """
+    Statistics of a COCO annotation file collected in a single pass over annotations and images:
+    annotation types, number of annotations per category and per geometry,
+    histogram of polygon vertex counts (by power of two bins) and images without size.
+    """
+
+    def __init__(self):
+        self.annotations_count = 0
+        self.images_count = 0
+        self.category_counts = defaultdict(int)
+        self.polygons_count = 0
+        self.rle_count = 0
+        self.bbox_count = 0
+        self.captions_count = 0
+        self.vertices_histogram = defaultdict(int)
+        self.images_without_size = []
+        self._found_types = set()
+
+    @property
+    def ann_types(self) -> List[str]:
+        return [ann_type for ann_type in ANN_TYPES if ann_type in self._found_types]
+
+    def add_annotation(self, ann: dict):
+        self.annotations_count += 1
+        if len(self._found_types) < len(ANN_TYPES):
+            self._found_types.update(ann_type for ann_type in ANN_TYPES if ann_type in ann)
+        category_id = ann.get("category_id")
+        if category_id is not None:
+            self.category_counts[category_id] += 1
+        segm = ann.get("segmentation")
+        if type(segm) is dict:
+            if len(segm) > 0:
+                self.rle_count += 1
+        elif type(segm) is list and len(segm) > 0:
+            self.polygons_count += 1
+            polygons = [segm] if type(segm[0]) is not list else segm
+            for polygon in polygons:
+                vertices = len(polygon) // 2
+                self.vertices_histogram[1 << max(vertices - 1, 0).bit_length()] += 1
+        bbox = ann.get("bbox")
+        if bbox is not None and len(bbox) == 4:
+            self.bbox_count += 1
+        if ann.get("caption") is not None:
+            self.captions_count += 1
+
+    def add_image(self, image_info: dict):
+        self.images_count += 1
+        if "height" not in image_info or "width" not in image_info:
+            self.images_without_size.append(image_info.get("id"))
+
+    def to_json(self):
+        return {
+            "annotations": self.annotations_count,
+            "images": self.images_count,
+            "types": self.ann_types,
+            "polygons": self.polygons_count,
+            "rle": self.rle_count,
+            "bboxes": self.bbox_count,
+            "captions": self.captions_count,
+            "annotations_per_category": dict(self.category_counts),
+            "polygon_vertices_histogram": dict(sorted(self.vertices_histogram.items())),
+            "images_without_size": len(self.images_without_size),
+        }
+
+
+def profile_annotations(annotations, images=()) -> AnnotationsProfile:
+    profile = AnnotationsProfile()
+    for ann in annotations:
+        profile.add_annotation(ann)
+    for image_info in images:
+        profile.add_image(image_info)
+    return profile
+
+
+class CocoAnnotations:
+    """
+    Index of a COCO annotation file with only the data the converter needs:
+    categories list, images by id and annotations grouped by image id.
+    """
+
+    def __init__(
+        self, categories, images, img_to_anns, annotations, source=input_source.local_input
+    ):
+        self.source = source
+        self.categories = categories
+        self.images = images
+        self.img_to_anns = img_to_anns
+        self.annotations = annotations
+        sly.logger.info("Getting info about annotation types..")
+        self.profile = profile_annotations(annotations, images.values())
+        self.ann_types = self.profile.ann_types
+
+    def add_captions(self, ann_path):
+        captions = load_coco_annotations(ann_path, CAPTIONS_REQUIRED_KEYS, self.source)
+        self.ann_types += captions.ann_types
+        self.profile.captions_count += captions.profile.captions_count
+        for img_id, ann in self.img_to_anns.items():
+            ann.extend(captions.img_to_anns[img_id])
+
+    def iter_images(self):
+        for img_id, img_info in self.images.items():
+            yield img_id, img_info, self.img_to_anns[img_id]
+
+    def close(self):
+        pass
+
+
+def check_high_level_coco_ann_structure(dataset, required_keys=INSTANCES_REQUIRED_KEYS):
+    if not isinstance(dataset, dict):
+        raise Exception("annotation file must contain a dict")
+    for key in required_keys:
+        if key not in dataset:
+            raise Exception(f"[{key}] field is missing")
+        if not isinstance(dataset[key], list):
+            raise Exception(f"[{key}] field value must be a list of dicts")
+
+
+def load_coco_annotations(
+    ann_path, required_keys=INSTANCES_REQUIRED_KEYS, source=input_source.local_input
+):
+    """Parses the annotation file once, validates its structure and builds the index."""
+    with source.open(ann_path, "r") as f:
+        dataset = json.load(f)
+    check_high_level_coco_ann_structure(dataset, required_keys)
+
+    annotations = dataset.get("annotations", [])
+    img_to_anns = defaultdict(list)
+    for ann in annotations:
+        img_to_anns[ann["image_id"]].append(ann)
+    images = {image["id"]: image for image in dataset.get("images", [])}
+    # the same as COCO.loadCats(COCO.getCatIds())
+    cats = {category["id"]: category for category in dataset.get("categories", [])}
+    categories = [cats[category["id"]] for category in dataset.get("categories", [])]
+    return CocoAnnotations(categories, images, img_to_anns, annotations, source)
+
+
+class JsonStreamReader:
+    """
+    Incremental reader of a JSON file with a top-level object. Items of the list fields
+    are decoded one by one, so the whole file is never loaded into memory.
+    """
+
+    WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+    def __init__(self, f, chunk_size=STREAM_CHUNK_SIZE):
+        self.fields = {}  # field name -> True if the field value is a list
+        self._f = f
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _read_more(self, size):
+        self._buf = self._buf[self._pos :]
+        self._pos = 0
+        chunk = self._f.read(size)
+        if chunk == "":
+            self._eof = True
+            return False
+        self._buf += chunk
+        return True
+
+    def _peek(self):
+        """Skips whitespaces and returns the next char or an empty string at the end of file."""
+        while True:
+            self._pos = self.WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._read_more(self._chunk_size):
+                return ""
+
+    def _expect(self, chars):
+        char = self._peek()
+        if char == "" or char not in chars:
+            raise json.JSONDecodeError(f"Expecting one of '{chars}'", self._buf, self._pos)
+        self._pos += 1
+        return char
+
+    def _decode_value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+                # a number at the end of the buffer may be incomplete
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._read_more(max(self._chunk_size, len(self._buf)))
+
+    def iter_items(self, keys):
+        """Yields (field name, item) for items of the top-level list fields with the given names."""
+        self._expect("{")
+        if self._peek() == "}":
+            return
+        while True:
+            key = self._decode_value()
+            self._expect(":")
+            self.fields[key] = self._peek() == "["
+            if self.fields[key]:
+                self._pos += 1
+                if self._peek() == "]":
+                    self._pos += 1
+                else:
+                    while True:
+                        item = self._decode_value()
+                        if key in keys:
+                            yield key, item
+                        if self._expect(",]") == "]":
+                            break
+            else:
+                self._decode_value()
+            if self._expect(",}") == "}":
+                return
+
+
+class CocoAnnotationStream:
+    """
+    Streaming counterpart of CocoAnnotations for huge annotation files.
+    Annotations are parsed incrementally and spilled to bucket files on disk grouped by image,
+    so only images info, categories and a single bucket of annotations are kept in memory.
+    Images are iterated in the file order as in CocoAnnotations.
+    """
+
+    def __init__(self, spill_dir, buckets_count, source=input_source.local_input):
+        self.source = source
+        self.categories = []
+        self.images = {}
+        self.ann_types = []
+        self.profile = AnnotationsProfile()
+        self._spill_dir = spill_dir
+        self._buckets_count = buckets_count
+        self._positions = None
+        self._images_per_bucket = None
+        self._has_captions = False
+        mkdir(spill_dir, remove_content_if_exists=True)
+
+    def _index_positions(self):
+        self._positions = {img_id: idx for idx, img_id in enumerate(self.images)}
+        self._images_per_bucket = math.ceil(len(self.images) / self._buckets_count)
+
+    def _get_bucket(self, image_id):
+        if self._positions is None:
+            if len(self.images) > 0:
+                # images are listed before annotations: keep the original images order
+                self._index_positions()
+            else:
+                # annotations are listed before images, see _rebucket
+                self._positions = {}
+        if self._images_per_bucket is not None:
+            position = self._positions.get(image_id)
+            if position is None:
+                return None
+            return position // self._images_per_bucket
+        return zlib.crc32(str(image_id).encode("utf-8")) % self._buckets_count
+
+    def _get_bucket_path(self, prefix, bucket):
+        return os.path.join(self._spill_dir, f"{prefix}_{bucket}.jsonl")
+
+    def _spill(self, ann_path, prefix, required_keys, profile: AnnotationsProfile):
+        """Writes annotations of the file to bucket files and collects the profile."""
+        bucket_files = {}
+        try:
+            with self.source.open(ann_path, "r") as f:
+                reader = JsonStreamReader(f)
+                for key, item in reader.iter_items(INSTANCES_REQUIRED_KEYS):
+                    if key == "annotations":
+                        profile.add_annotation(item)
+                        bucket = self._get_bucket(item["image_id"])
+                        if bucket is None:
+                            continue
+                        if bucket not in bucket_files:
+                            bucket_files[bucket] = open(self._get_bucket_path(prefix, bucket), "w")
+                        bucket_files[bucket].write(json.dumps(item) + "\n")
+                    elif key == "images" and prefix == "instances":
+                        self.images[item["id"]] = item
+                        profile.add_image(item)
+                    elif key == "categories" and prefix == "instances":
+                        self.categories.append(item)
+            fields = {key: [] if is_list else None for key, is_list in reader.fields.items()}
+            check_high_level_coco_ann_structure(fields, required_keys)
+        finally:
+            for bucket_file in bucket_files.values():
+                bucket_file.close()
+
+    def _rebucket(self, prefix):
+        """
+        Moves annotations spilled to buckets by image id hash (annotations are listed before
+        images in the file) to buckets by image position, so images are iterated in the file order.
+        """
+        hashed_paths = []
+        for bucket in range(self._buckets_count):
+            bucket_path = self._get_bucket_path(prefix, bucket)
+            if os.path.exists(bucket_path):
+                hashed_path = f"{bucket_path}.hashed"
+                os.replace(bucket_path, hashed_path)
+                hashed_paths.append(hashed_path)
+        self._index_positions()
+        bucket_files = {}
+        try:
+            for hashed_path in hashed_paths:
+                with open(hashed_path, "r") as f:
+                    for line in f:
+                        bucket = self._get_bucket(json.loads(line)["image_id"])
+                        if bucket is None:
+                            continue
+                        if bucket not in bucket_files:
+                            bucket_files[bucket] = open(self._get_bucket_path(prefix, bucket), "w")
+                        bucket_files[bucket].write(line)
+                os.remove(hashed_path)
+        finally:
+            for bucket_file in bucket_files.values():
+                bucket_file.close()
+
+    def load(self, ann_path):
+        self._spill(ann_path, "instances", INSTANCES_REQUIRED_KEYS, self.profile)
+        if self._images_per_bucket is None and len(self.images) > 0:
+            self._rebucket("instances")
+        self.ann_types = self.profile.ann_types
+        # the same as COCO.loadCats(COCO.getCatIds())
+        cats = {category["id"]: category for category in self.categories}
+        self.categories = [cats[category["id"]] for category in self.categories]
+
+    def add_captions(self, ann_path):
+        captions_profile = AnnotationsProfile()
+        try:
+            self._spill(ann_path, "captions", CAPTIONS_REQUIRED_KEYS, captions_profile)
+        except Exception:
+            for bucket in range(self._buckets_count):
+                sly.fs.silent_remove(self._get_bucket_path("captions", bucket))
+            raise
+        self.ann_types += captions_profile.ann_types
+        self.profile.captions_count += captions_profile.captions_count
+        self._has_captions = True
+
+    def _read_bucket(self, prefix, bucket):
+        img_to_anns = defaultdict(list)
+        bucket_path = self._get_bucket_path(prefix, bucket)
+        if os.path.exists(bucket_path):
+            with open(bucket_path, "r") as f:
+                for line in f:
+                    ann = json.loads(line)
+                    img_to_anns[ann["image_id"]].append(ann)
+        return img_to_anns
+
+    def iter_images(self):
+        if len(self.images) == 0:
+            return
+        image_ids = list(self.images)
+        size = self._images_per_bucket
+        buckets_images = [image_ids[i * size : (i + 1) * size] for i in range(self._buckets_count)]
+
+        for bucket, bucket_images in enumerate(buckets_images):
+            img_to_anns = self._read_bucket("instances", bucket)
+            if self._has_captions:
+                img_captions = self._read_bucket("captions", bucket)
+                for img_id, ann in img_to_anns.items():
+                    ann.extend(img_captions[img_id])
+            for img_id in bucket_images:
+                yield img_id, self.images[img_id], img_to_anns[img_id]
+
+    def close(self):
+        shutil.rmtree(self._spill_dir, ignore_errors=True)
+
+
+def stream_coco_annotations(ann_path, spill_dir, source=input_source.local_input):
+    """Loads the annotation file in streaming mode, see CocoAnnotationStream."""
+    buckets_count = math.ceil(source.get_size(ann_path) / STREAM_BUCKET_SIZE)
+    buckets_count = min(max(buckets_count, 1), STREAM_MAX_BUCKETS)
+    stream = CocoAnnotationStream(spill_dir, buckets_count, source)
+    try:
+        stream.load(ann_path)
+    except Exception:
+        stream.close()
+        raise
+    return stream
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import zipfile
+
+import supervisely as sly
+from supervisely.io.fs import silent_remove
+
+# changes of the stored data or of the conversion results invalidate old entries
+CACHE_VERSION = 1
+HASH_CHUNK_SIZE = 1024 * 1024
+ENTRY_EXT = ".zip"
+INFO_MEMBER = "info.json"
+ANN_PREFIX = "ann/"
+
+
+def get_file_digest(source, path):
+    file_hash = hashlib.sha256()
+    with source.open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def get_dataset_key(source, dataset, ann_paths, options, meta: sly.ProjectMeta, image_names):
+    """
+    Returns the cache key of the dataset conversion: digests of the annotation files,
+    conversion options, the project meta before the dataset and names of the image files.
+    """
+    key = {
+        "version": CACHE_VERSION,
+        "dataset": dataset,
+        "annotations": [get_file_digest(source, path) for path in ann_paths],
+        "options": options,
+        "meta": meta.to_json(),
+        "images": sorted(image_names),
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class CacheEntry:
+    """
+    Converted annotations of a dataset in the original images order,
+    the project meta and counters.
+    """
+
+    def __init__(self, path):
+        self._zip = zipfile.ZipFile(path)
+        info = json.loads(self._zip.read(INFO_MEMBER))
+        self.meta = sly.ProjectMeta.from_json(info["meta"])
+        self.counters = info["counters"]
+        self.names = info["names"]
+
+    def read_annotation(self, name):
+        return json.loads(self._zip.read(f"{ANN_PREFIX}{name}"))
+
+    def extract_annotation(self, name, ann_path):
+        """
+        Writes the annotation file without parsing it,
+        zip members are read safely from several threads.
+        """
+        with self._zip.open(f"{ANN_PREFIX}{name}") as src, open(ann_path, "wb") as dst:
+            dst.write(src.read())
+
+    def close(self):
+        self._zip.close()
+
+
+class CacheWriter:
+    """Writes the entry to a temporary file, the entry becomes visible only after commit()."""
+
+    def __init__(self, cache, key):
+        self._cache = cache
+        self._path = cache.get_entry_path(key)
+        self._tmp_path = f"{self._path}.{os.getpid()}.tmp"
+        self._zip = zipfile.ZipFile(self._tmp_path, "w", zipfile.ZIP_DEFLATED, compresslevel=1)
+        self._names = []
+        self.is_complete = True
+
+    def add(self, name, ann):
+        """Adds the annotation json or the annotation file of the converted image."""
+        if isinstance(ann, dict):
+            self._zip.writestr(f"{ANN_PREFIX}{name}", json.dumps(ann))
+        else:
+            self._zip.write(ann, f"{ANN_PREFIX}{name}")
+        self._names.append(name)
+
+    def commit(self, counters, meta: sly.ProjectMeta):
+        if not self.is_complete:
+            # e.g. images converted before the restart, see checkpoint.Checkpoint
+            self.discard()
+            return
+        info = {"meta": meta.to_json(), "counters": counters, "names": self._names}
+        self._zip.writestr(INFO_MEMBER, json.dumps(info))
+        self._zip.close()
+        os.replace(self._tmp_path, self._path)
+        self._cache.evict()
+
+    def discard(self):
+        self._zip.close()
+        silent_remove(self._tmp_path)
+
+
+class ConversionCache:
+    """
+    Converted annotations of datasets in the app cache dir, shared by the app tasks,
+    so unchanged inputs are not converted again. Every entry is a single zip file,
+    least recently used entries are removed when the total size exceeds max_size.
+    """
+
+    def __init__(self, root_dir, max_size):
+        self.root_dir = root_dir
+        self.max_size = max_size
+        os.makedirs(root_dir, exist_ok=True)
+
+    def get_entry_path(self, key):
+        return os.path.join(self.root_dir, f"{key}{ENTRY_EXT}")
+
+    def get(self, key):
+        """Returns CacheEntry or None, the entry is marked as recently used."""
+        path = self.get_entry_path(key)
+        try:
+            entry = CacheEntry(path)
+            os.utime(path)
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            # missing, evicted or damaged entry
+            return None
+        return entry
+
+    def create_writer(self, key):
+        return CacheWriter(self, key)
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.root_dir):
+            if not entry.name.endswith(ENTRY_EXT):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            silent_remove(path)
+            total_size -= size
+            sly.logger.info(f"Conversion cache entry {os.path.basename(path)} has been evicted")
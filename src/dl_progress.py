@@ -1,3 +1,4 @@
+import threading
 from functools import partial
 
 import supervisely as sly
@@ -30,3 +31,15 @@ def get_progress_cb(api, task_id, message, total, is_size=False, func=update_pro
     progress_cb = partial(func, api=api, task_id=task_id, progress=progress)
     progress_cb(0)
     return progress_cb
+
+
+def get_thread_safe_progress_cb(api, task_id, message, total, is_size=False, func=update_progress):
+    """Progress callback shared by several threads (e.g. concurrent downloads)."""
+    progress_cb = get_progress_cb(api, task_id, message, total, is_size=is_size, func=func)
+    lock = threading.Lock()
+
+    def thread_safe_progress_cb(count):
+        with lock:
+            progress_cb(count)
+
+    return thread_safe_progress_cb
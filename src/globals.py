@@ -8,6 +8,10 @@ import supervisely as sly
 from dotenv import load_dotenv
 from supervisely.io.fs import mkdir
 
+from checkpoint import Checkpoint, get_fingerprint, open_checkpoint
+from conversion_cache import ConversionCache
+from input_source import local_input
+from metrics import ImportMetrics
 from workflow import Workflow
 
 if sly.is_development():
@@ -37,22 +41,92 @@ INPUT_DIR = os.environ.get("modal.state.slyFolder")
 INPUT_FILE = os.environ.get("modal.state.slyFile")
 INCLUDE_CAPTIONS = bool(strtobool(os.getenv("modal.state.captions")))
 CONVERT_RLE_TO_BITMAP = bool(strtobool(os.getenv("modal.state.rleToBitmap")))
+# number of processes used to convert images, 0 - use all available CPUs
+CONVERSION_WORKERS = int(os.getenv("modal.state.numWorkers", 1))
+# number of threads encoding bitmaps of a single image, 1 - sequential encoding
+BITMAP_ENCODING_THREADS = int(os.getenv("modal.state.bitmapEncodingThreads", 4))
+# emit annotation json of polygons and rectangles directly instead of creating sly objects
+DIRECT_ANNOTATION_JSON = bool(strtobool(os.getenv("modal.state.directAnnotationJson", "true")))
+# number of threads moving images of datasets without annotations
+IMAGE_THREADS = int(os.getenv("modal.state.imageThreads", 8))
+# check image files before the conversion (format, truncation, size) and write the report
+VERIFY_IMAGES = bool(strtobool(os.getenv("modal.state.verifyImages", "false")))
+# number of processes verifying images, 0 - use all available CPUs
+VERIFICATION_WORKERS = int(os.getenv("modal.state.verificationWorkers", 0))
+# parse annotation files incrementally to keep memory usage independent of the file size
+STREAM_ANNOTATIONS = bool(strtobool(os.getenv("modal.state.streamAnnotations", "false")))
+# number of original COCO archives downloaded and extracted at the same time
+DOWNLOAD_CONCURRENCY = int(os.getenv("modal.state.downloadConcurrency", 2))
+# number of parallel connections used to download original COCO archives by byte ranges
+DOWNLOAD_CONNECTIONS = int(os.getenv("modal.state.downloadConnections", 8))
+# extract original COCO images archives while downloading them, without saving archives on disk
+STREAM_DOWNLOADS = bool(strtobool(os.getenv("modal.state.streamDownloads", "false")))
+# read custom datasets directly from the zip or tar archive in Team Files instead of unpacking it
+READ_FROM_ARCHIVE = bool(strtobool(os.getenv("modal.state.readFromArchive", "false")))
+# "project" - convert all datasets and upload the project at the end,
+# "pipelined" - upload converted images in batches while the next images are being converted
+# "direct" - the same as "pipelined", but images are uploaded from the source folder
+# and annotations are kept in memory, without intermediate Supervisely project on disk
+UPLOAD_MODE = os.getenv("modal.state.uploadMode", "project")
+UPLOAD_MODES = ["project", "pipelined", "direct"]
+if UPLOAD_MODE not in UPLOAD_MODES:
+    raise Exception(
+        f"Unknown upload mode '{UPLOAD_MODE}', available modes: {', '.join(UPLOAD_MODES)}"
+    )
+if READ_FROM_ARCHIVE and UPLOAD_MODE == "project":
+    # every image would be extracted to the local project while the archive is kept
+    sly.logger.warn(
+        "Reading from the archive is supported only in 'pipelined' and 'direct' upload modes, "
+        "the archive will be unpacked."
+    )
+    READ_FROM_ARCHIVE = False
+# persist the import progress, so a restarted task skips finished work, see checkpoint.Checkpoint
+CHECKPOINTS = bool(strtobool(os.getenv("modal.state.checkpoints", "false")))
+# reuse annotations converted by previous tasks for unchanged inputs, see conversion_cache
+CONVERSION_CACHE = bool(strtobool(os.getenv("modal.state.conversionCache", "false")))
+# size limit of the conversion cache in GB, least recently used datasets are removed
+CONVERSION_CACHE_SIZE = float(os.getenv("modal.state.conversionCacheSize", 10))
+# write cProfile stats of the conversion to the metrics dir, see metrics.ImportMetrics
+PROFILE = bool(strtobool(os.getenv("modal.state.profile", "false")))
 
 if SLY_SELECTED_CONTEXT != "ecosystem":
     COCO_MODE = "custom"
 
 OUTPUT_PROJECT_NAME = os.environ.get("modal.state.projectName", "")
 
-STORAGE_DIR = os.path.join(my_app.data_dir, "storage_dir")
-mkdir(STORAGE_DIR, True)
+if CHECKPOINTS:
+    checkpoint = open_checkpoint(my_app.cache_dir, WORKSPACE_ID)
+    STORAGE_DIR = os.path.join(checkpoint.dir, "storage_dir")
+else:
+    checkpoint = Checkpoint(None, get_fingerprint(WORKSPACE_ID))
+    STORAGE_DIR = os.path.join(my_app.data_dir, "storage_dir")
+# source files are kept for the restarted import
+local_input.keep_files = CHECKPOINTS
+
+# downloaded and converted files are reused by the restarted import
+mkdir(STORAGE_DIR, not checkpoint.is_resumed)
 COCO_BASE_DIR = os.path.join(STORAGE_DIR, "coco_base_dir")
 mkdir(COCO_BASE_DIR)
 SLY_BASE_DIR = os.path.join(STORAGE_DIR, "supervisely")
 mkdir(SLY_BASE_DIR)
-
+# the storage dir is not available after the task, reports are also uploaded here
+TEAM_FILES_DIR = f"/import-coco/{TASK_ID}"
+# per-stage timing, throughput and memory usage of the import, see metrics.ImportMetrics
+metrics = ImportMetrics(os.path.join(STORAGE_DIR, "metrics"), profile=PROFILE)
+
+conversion_cache = None
+if CONVERSION_CACHE:
+    conversion_cache = ConversionCache(
+        os.path.join(my_app.cache_dir, "coco_conversion"), int(CONVERSION_CACHE_SIZE * 1024**3)
+    )
+
+# files of the input datasets, see input_source.ArchiveInput
+input_source = local_input
 img_dir = None
 ann_dir = None
 src_img_dir = None
+# files of the current dataset images folder, see input_source.ImageIndex
+image_index = None
 dst_img_dir = None
 
 if COCO_MODE == "original":
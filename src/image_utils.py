@@ -0,0 +1,119 @@
+import os
+import struct
+
+from PIL import Image
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+JPEG_SIGNATURE = b"\xff\xd8"
+# start of frame markers, except DHT (0xC4), JPG (0xC8) and DAC (0xCC)
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# markers without length field: TEM, RST0-RST7, SOI
+JPEG_STANDALONE_MARKERS = {0x01, *range(0xD0, 0xD8), 0xD8}
+END_MARKERS = {"jpeg": b"\xff\xd9", "png": b"IEND"}
+IMAGE_TAIL_SIZE = 1024
+
+
+def _read_png_size(f):
+    # IHDR is always the first chunk: length, type, width, height
+    chunk = f.read(16)
+    if len(chunk) < 16 or chunk[4:8] != b"IHDR":
+        return None
+    width, height = struct.unpack(">II", chunk[8:16])
+    return height, width
+
+
+def _read_jpeg_size(f):
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        code = marker[1]
+        while code == 0xFF:  # fill bytes before the marker code
+            byte = f.read(1)
+            if len(byte) == 0:
+                return None
+            code = byte[0]
+        if code in JPEG_STANDALONE_MARKERS:
+            continue
+        if code in [0xD9, 0xDA]:  # EOI or SOS before the frame header
+            return None
+        length = f.read(2)
+        if len(length) < 2:
+            return None
+        length = struct.unpack(">H", length)[0]
+        if code in JPEG_SOF_MARKERS:
+            frame = f.read(5)
+            if len(frame) < 5:
+                return None
+            _, height, width = struct.unpack(">BHH", frame)
+            # zero height is defined later by DNL marker
+            if height == 0 or width == 0:
+                return None
+            return height, width
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def _read_header(f):
+    """
+    Returns image format ("png", "jpeg" or None for other formats)
+    and (height, width) from the header.
+    """
+    signature = f.read(len(PNG_SIGNATURE))
+    if signature == PNG_SIGNATURE:
+        return "png", _read_png_size(f)
+    if signature[: len(JPEG_SIGNATURE)] == JPEG_SIGNATURE:
+        f.seek(len(JPEG_SIGNATURE))
+        return "jpeg", _read_jpeg_size(f)
+    return None, None
+
+
+def read_image_size_from_header(path):
+    """
+    Returns (height, width) of JPEG or PNG image read from the file header
+    without decoding the image, None for other formats or unexpected headers.
+    """
+    with open(path, "rb") as f:
+        return _read_header(f)[1]
+
+
+def get_image_size(path):
+    """Returns (height, width) of the image, PIL is used for formats other than JPEG and PNG."""
+    img_size = read_image_size_from_header(path)
+    if img_size is None:
+        with Image.open(path) as im:
+            width, height = im.size
+        img_size = (height, width)
+    return img_size
+
+
+def _has_end_marker(f, marker):
+    # some encoders write padding after the end marker
+    f.seek(0, os.SEEK_END)
+    f.seek(max(f.tell() - IMAGE_TAIL_SIZE, 0))
+    return marker in f.read()
+
+
+def check_image(f, expected_size=None):
+    """
+    Checks the image in the binary file object without decoding it: the header is parsed,
+    JPEG and PNG files are checked for the end marker (truncated files)
+    and the image size is compared with the expected (height, width).
+    Returns the image size (None if it can't be read) and the list of found problems.
+    """
+    problems = []
+    image_format, img_size = _read_header(f)
+    if image_format is None:
+        f.seek(0)
+        try:
+            with Image.open(f) as im:
+                width, height = im.size
+            img_size = (height, width)
+        except Exception:
+            problems.append("unknown_format")
+    elif img_size is None:
+        problems.append("corrupted_header")
+    elif not _has_end_marker(f, END_MARKERS[image_format]):
+        problems.append("truncated")
+    if img_size is not None and expected_size is not None and tuple(expected_size) != img_size:
+        problems.append("size_mismatch")
+    return img_size, problems
@@ -0,0 +1,115 @@
+import os
+from collections import Counter
+
+import supervisely as sly
+
+import globals as g
+import image_utils
+import parallel
+import team_files
+
+VERIFICATION_CHUNK_SIZE = 64
+REPORT_LOG_LIMIT = 20
+
+
+def verify_image(task):
+    """Returns the report item of the image with problems or None if the image is correct."""
+    img_id, image_name, path, expected_size = task
+    try:
+        with g.input_source.open(path, "rb") as f:
+            img_size, problems = image_utils.check_image(f, expected_size)
+    except OSError:
+        img_size, problems = None, ["unreadable"]
+    if len(problems) == 0:
+        return None
+    return {
+        "image_id": img_id,
+        "file_name": image_name,
+        "problems": problems,
+        "size": img_size,
+        "expected_size": expected_size,
+    }
+
+
+def verify_images_chunk(tasks):
+    """Runs in a worker process. Returns number of checked images and report items."""
+    return len(tasks), [item for item in map(verify_image, tasks) if item is not None]
+
+
+def verify_images(dataset, tasks, images_count):
+    """
+    Checks images of the dataset in a process pool without decoding them,
+    see image_utils.check_image.
+    tasks are (image id, file name, path, expected (height, width) or None).
+    The report is written to the storage dir and uploaded to Team Files, the summary is logged.
+    Images are not skipped.
+    """
+    progress = sly.Progress(f"Verifying images: {dataset}", images_count, min_report_percent=5)
+    pool = None
+    workers = parallel.get_workers_count(g.VERIFICATION_WORKERS, images_count)
+    if workers > 1:
+        pool = parallel.get_process_pool(workers)
+    chunks = parallel.chunked(tasks, VERIFICATION_CHUNK_SIZE)
+    if pool is None:
+        results = map(verify_images_chunk, chunks)
+    else:
+        results = parallel.imap_ordered(pool, verify_images_chunk, chunks, max_pending=workers * 2)
+
+    items = []
+    try:
+        for checked_count, chunk_items in results:
+            items.extend(chunk_items)
+            progress.iters_done_report(checked_count)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    report = {
+        "dataset": dataset,
+        "checked": images_count,
+        "invalid": len(items),
+        "problems": dict(Counter(problem for item in items for problem in item["problems"])),
+        "images": items,
+    }
+    report_path = os.path.join(g.STORAGE_DIR, "verification", f"{dataset}.json")
+    sly.fs.mkdir(os.path.dirname(report_path))
+    sly.json.dump_json_file(report, report_path)
+    team_files_path = team_files.upload_report(
+        g.api, g.TEAM_ID, report_path, f"{g.TEAM_FILES_DIR}/verification/{dataset}.json"
+    )
+    if len(items) > 0:
+        sly.logger.warn(
+            f"{len(items)} of {images_count} images of {dataset} dataset failed verification",
+            extra={
+                "problems": report["problems"],
+                "images": items[:REPORT_LOG_LIMIT],
+                "report_path": team_files_path or report_path,
+            },
+        )
+    else:
+        sly.logger.info(f"All {images_count} images of {dataset} dataset passed verification")
+    return report
+
+
+def verify_trainval_images(dataset, coco_annotations):
+    """Verifies images assigned to COCO images, sizes are compared with the annotation."""
+    tasks = []
+    for img_id, img_info in coco_annotations.images.items():
+        image_name = img_info.get("file_name")
+        if image_name is None:
+            continue
+        image_name = os.path.basename(image_name)
+        path = g.image_index.get_image_path(image_name, img_id)
+        if path is None:
+            continue
+        expected_size = None
+        if "height" in img_info and "width" in img_info:
+            expected_size = (img_info["height"], img_info["width"])
+        tasks.append((img_id, image_name, path, expected_size))
+    return verify_images(dataset, tasks, len(tasks))
+
+
+def verify_test_images(dataset, images):
+    """Verifies images of the dataset without annotations."""
+    tasks = [(None, image, g.image_index.get_image_path(image), None) for image in images]
+    return verify_images(dataset, tasks, len(tasks))
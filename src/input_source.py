@@ -0,0 +1,328 @@
+import fnmatch
+import glob
+import io
+import os
+import shutil
+import tarfile
+import zipfile
+
+import supervisely as sly
+from supervisely.io.fs import JUNK_FILES, dir_exists, file_exists, get_file_name, silent_remove
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class ImageIndex:
+    """
+    Files of the dataset images folder by basename,
+    collected in a single listing of the folder tree.
+    COCO images are looked up by the basename of "file_name" among the top-level files,
+    a file is assigned to the first COCO image with its basename.
+    """
+
+    def __init__(self, img_dir, files, images_count):
+        self.img_dir = img_dir
+        self.files = files  # basename -> path of the top-level files
+        self.images_count = images_count  # files with supported image extension in the whole tree
+        self._owners = None  # basename -> id of the COCO image the file is assigned to
+
+    def __contains__(self, name):
+        return name in self.files
+
+    def names(self):
+        return list(self.files)
+
+    def assign_images(self, images: dict):
+        """
+        Assigns files to COCO images (id -> image info) in the images order.
+        Returns lists of missing file names and of file names used by more than one image.
+        """
+        self._owners = {}
+        missing, duplicates = [], []
+        for img_id, img_info in images.items():
+            image_name = img_info.get("file_name")
+            if image_name is None:
+                continue
+            image_name = os.path.basename(image_name)
+            if image_name not in self.files:
+                missing.append(image_name)
+            elif image_name in self._owners:
+                duplicates.append(image_name)
+            else:
+                self._owners[image_name] = img_id
+        return missing, duplicates
+
+    def get_image_path(self, image_name, img_id=None):
+        """Returns path of the file or None if it's missing or assigned to another COCO image."""
+        if (
+            img_id is not None
+            and self._owners is not None
+            and self._owners.get(image_name) != img_id
+        ):
+            return None
+        return self.files.get(image_name)
+
+
+class LocalInput:
+    """Input COCO datasets in a local directory."""
+
+    is_local = True
+    # files are hard linked (or copied) instead of moving, so the source stays complete
+    keep_files = False
+
+    def dir_exists(self, path):
+        return dir_exists(path)
+
+    def file_exists(self, path):
+        return file_exists(path)
+
+    def listdir(self, path):
+        return os.listdir(path)
+
+    def list_files(self, dir_path, pattern="*"):
+        """Returns paths matching the glob pattern in the directory (not recursive)."""
+        return glob.glob(os.path.join(dir_path, pattern))
+
+    def list_files_recursively(self, path, valid_extensions=None):
+        return sly.fs.list_files_recursively(path, valid_extensions)
+
+    def index_images(self, img_dir):
+        """Lists the images folder tree once with os.scandir, see ImageIndex."""
+        files, images_count = {}, 0
+        dirs = [img_dir]
+        while len(dirs) > 0:
+            dir_path = dirs.pop()
+            try:
+                entries = list(os.scandir(dir_path))
+            except OSError:
+                # unreadable subfolders are skipped as in os.walk
+                if dir_path == img_dir:
+                    raise
+                continue
+            for entry in entries:
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        dirs.append(entry.path)
+                    continue
+                if dir_path == img_dir and entry.is_file():
+                    files[entry.name] = entry.path
+                if sly.fs.get_file_ext(entry.name) in sly.image.SUPPORTED_IMG_EXTS:
+                    images_count += 1
+        return ImageIndex(img_dir, files, images_count)
+
+    def get_size(self, path):
+        return os.path.getsize(path)
+
+    def open(self, path, mode="r"):
+        return open(path, mode)
+
+    def move(self, path, dst_path):
+        if not self.keep_files:
+            shutil.move(path, dst_path)
+            return
+        silent_remove(dst_path)
+        try:
+            os.link(path, dst_path)
+        except OSError:
+            shutil.copyfile(path, dst_path)
+
+    def get_local_path(self, path, dst_dir):
+        """Local files are used in place, dst_dir is ignored."""
+        return path
+
+    def close(self):
+        pass
+
+
+local_input = LocalInput()
+
+
+class _TarMemberReader(io.RawIOBase):
+    """Reader of a member of uncompressed tar archive, safe to use from several threads."""
+
+    def __init__(self, fd, offset, size):
+        self._fd = fd
+        self._offset = offset
+        self._size = size
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self._size
+        self._pos = max(offset, 0)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._size - self._pos)
+        if size <= 0:
+            return 0
+        data = os.pread(self._fd, size, self._offset + self._pos)
+        buffer[: len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+
+class ArchiveInput:
+    """
+    Input COCO datasets inside a zip or uncompressed tar archive, files are read straight
+    from the archive members instead of extracting the whole archive.
+    Paths are the same as if the archive was extracted to root_dir.
+    The zip central directory (or tar headers) is used as the files index.
+    """
+
+    is_local = False
+
+    def __init__(self, archive_path, root_dir, remove_on_close=True):
+        self.archive_path = archive_path
+        self.root_dir = root_dir
+        self._remove_on_close = remove_on_close
+        self._is_zip = zipfile.is_zipfile(archive_path)
+        self._files = {}  # member path -> zip member name or (tar data offset, size)
+        self._children = {"": set()}
+        self._handles = {}  # process id -> opened archive
+        if self._is_zip:
+            with zipfile.ZipFile(archive_path) as archive:
+                for info in archive.infolist():
+                    self._add_member(info.filename, info.is_dir(), info.filename)
+        else:
+            with tarfile.open(archive_path, "r:") as archive:
+                for info in archive:
+                    if info.isdir():
+                        self._add_member(info.name, True, None)
+                    elif info.isfile() and not info.issparse():
+                        self._add_member(info.name, False, (info.offset_data, info.size))
+
+    @staticmethod
+    def is_supported(archive_path):
+        if zipfile.is_zipfile(archive_path):
+            return True
+        try:
+            with tarfile.open(archive_path, "r:"):
+                return True
+        except tarfile.TarError:
+            return False
+
+    def _add_member(self, name, is_dir, member):
+        parts = [part for part in name.replace("\\", "/").split("/") if part not in ["", "."]]
+        if len(parts) == 0 or ".." in parts:
+            return
+        # the same as sly.fs.remove_junk_from_dir
+        if any(get_file_name(part) in JUNK_FILES for part in parts):
+            return
+        for idx in range(len(parts)):
+            parent = "/".join(parts[:idx])
+            self._children.setdefault(parent, set()).add(parts[idx])
+            if idx < len(parts) - 1 or is_dir:
+                self._children.setdefault("/".join(parts[: idx + 1]), set())
+        if not is_dir:
+            self._files["/".join(parts)] = member
+
+    def _get_member_path(self, path):
+        rel_path = os.path.relpath(os.path.abspath(path), os.path.abspath(self.root_dir))
+        if rel_path == ".":
+            return ""
+        if rel_path.startswith(".."):
+            return None
+        return rel_path.replace(os.sep, "/")
+
+    def _get_handle(self):
+        # handles are not shared with forked conversion workers
+        pid = os.getpid()
+        if pid not in self._handles:
+            if self._is_zip:
+                self._handles[pid] = zipfile.ZipFile(self.archive_path)
+            else:
+                self._handles[pid] = os.open(self.archive_path, os.O_RDONLY)
+        return self._handles[pid]
+
+    def dir_exists(self, path):
+        return self._get_member_path(path) in self._children
+
+    def file_exists(self, path):
+        return self._get_member_path(path) in self._files
+
+    def listdir(self, path):
+        member_path = self._get_member_path(path)
+        if member_path not in self._children:
+            raise FileNotFoundError(f"No such directory in the archive: {path}")
+        return sorted(self._children[member_path])
+
+    def list_files(self, dir_path, pattern="*"):
+        member_path = self._get_member_path(dir_path)
+        return [
+            os.path.join(dir_path, name)
+            for name in self._children.get(member_path, [])
+            if not name.startswith(".") and fnmatch.fnmatchcase(name, pattern)
+        ]
+
+    def list_files_recursively(self, path, valid_extensions=None):
+        member_path = self._get_member_path(path)
+        prefix = "" if member_path == "" else f"{member_path}/"
+        return [
+            os.path.join(self.root_dir, *name.split("/"))
+            for name in self._files
+            if name.startswith(prefix)
+            and (valid_extensions is None or sly.fs.get_file_ext(name) in valid_extensions)
+        ]
+
+    def index_images(self, img_dir):
+        """Builds ImageIndex from the archive members index."""
+        member_path = self._get_member_path(img_dir)
+        prefix = "" if member_path == "" else f"{member_path}/"
+        files = {
+            name: os.path.join(img_dir, name)
+            for name in sorted(self._children.get(member_path, []))
+            if f"{prefix}{name}" in self._files
+        }
+        images_count = len(self.list_files_recursively(img_dir, sly.image.SUPPORTED_IMG_EXTS))
+        return ImageIndex(img_dir, files, images_count)
+
+    def get_size(self, path):
+        member = self._files[self._get_member_path(path)]
+        if self._is_zip:
+            return self._get_handle().getinfo(member).file_size
+        return member[1]
+
+    def open(self, path, mode="r"):
+        member = self._files.get(self._get_member_path(path))
+        if member is None:
+            raise FileNotFoundError(f"No such file in the archive: {path}")
+        if self._is_zip:
+            f = self._get_handle().open(member)
+        else:
+            f = io.BufferedReader(_TarMemberReader(self._get_handle(), *member), COPY_CHUNK_SIZE)
+        if "b" not in mode:
+            return io.TextIOWrapper(f, encoding="utf-8")
+        return f
+
+    def move(self, path, dst_path):
+        """Extracts the file, the archive is not modified."""
+        with self.open(path, "rb") as src, open(dst_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+
+    def get_local_path(self, path, dst_dir):
+        """Extracts the file to dst_dir and returns its local path."""
+        dst_path = os.path.join(dst_dir, os.path.basename(path))
+        self.move(path, dst_path)
+        return dst_path
+
+    def close(self):
+        handle = self._handles.pop(os.getpid(), None)
+        if handle is not None:
+            if self._is_zip:
+                handle.close()
+            else:
+                os.close(handle)
+        if self._remove_on_close:
+            silent_remove(self.archive_path)
@@ -1,47 +1,71 @@
 import os
-import sys
 
 import supervisely as sly
-from pycocotools.coco import COCO
-from supervisely.io.fs import dir_exists
 
 import coco_converter
 import coco_downloader
+import coco_loader
 import globals as g
-
-
-class HiddenCocoPrints:
-    def __enter__(self):
-        self._original_stdout = sys.stdout
-        sys.stdout = open(os.devnull, "w")
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        sys.stdout.close()
-        sys.stdout = self._original_stdout
+import team_files
+import uploader
 
 
 @g.my_app.callback("import_coco")
 @sly.timeit
 def import_coco(api: sly.Api, task_id, context, state, app_logger):
+    try:
+        import_datasets(api, task_id, app_logger)
+    finally:
+        # metrics of failed imports are written too
+        report_path = g.metrics.write_report()
+        team_files.upload_report(
+            api, g.TEAM_ID, report_path, f"{g.TEAM_FILES_DIR}/metrics/report.json"
+        )
+    if g.checkpoint.dir is not None:
+        # files of the finished import are removed from the app cache
+        sly.fs.remove_dir(g.checkpoint.dir)
+    g.my_app.stop()
+
+
+def import_datasets(api: sly.Api, task_id, app_logger):
     project_name, coco_datasets = coco_downloader.start(app_logger)
+    pipeline = None
+    # images are extracted from the archive to the local project even in "direct" mode
+    write_local_images = g.UPLOAD_MODE != "direct" or not g.input_source.is_local
+    if g.UPLOAD_MODE in ["pipelined", "direct"]:
+        pipeline = uploader.PipelinedUploader(
+            api,
+            g.WORKSPACE_ID,
+            project_name,
+            remove_files=write_local_images,
+            checkpoint=g.checkpoint,
+            metrics=g.metrics,
+        )
+    path_to_meta = os.path.join(g.SLY_BASE_DIR, "meta.json")
+    if g.checkpoint.is_resumed and os.path.exists(path_to_meta):
+        g.META = sly.ProjectMeta.from_json(sly.json.load_json_file(path_to_meta))
     total_images = 0
     for dataset in coco_datasets:
         current_dataset_images_cnt = 0
+        if dataset in g.checkpoint.finished:
+            sly.logger.info(f"Dataset {dataset} has been converted before the restart.")
+            total_images += g.checkpoint.finished[dataset]
+            continue
         sly.logger.info(f"Start processing {dataset} dataset...")
         coco_dataset_dir = os.path.join(g.COCO_BASE_DIR, dataset)
         g.src_img_dir = os.path.join(coco_dataset_dir, "images")
-        if not dir_exists(coco_dataset_dir):
+        if not g.input_source.dir_exists(coco_dataset_dir):
             app_logger.info(f"File {coco_dataset_dir} has been skipped.")
             continue
         coco_ann_dir = os.path.join(coco_dataset_dir, "annotations")
-        if not dir_exists(coco_ann_dir):
-            if dir_exists(os.path.join(coco_dataset_dir, "annotation")):
+        if not g.input_source.dir_exists(coco_ann_dir):
+            if g.input_source.dir_exists(os.path.join(coco_dataset_dir, "annotation")):
                 coco_ann_dir = os.path.join(coco_dataset_dir, "annotation")
             else:
                 app_logger.warn(f"Not found 'annotations' folder")
-        if not dir_exists(g.src_img_dir):
+        if not g.input_source.dir_exists(g.src_img_dir):
             app_logger.warn("Not found 'images' folder.")
-            imgs_list = sly.fs.list_files_recursively(
+            imgs_list = g.input_source.list_files_recursively(
                 coco_dataset_dir, sly.image.SUPPORTED_IMG_EXTS
             )
             if len(imgs_list) > 0:
@@ -55,8 +79,10 @@ def import_coco(api: sly.Api, task_id, context, state, app_logger):
             else:
                 continue
 
-        images = sly.fs.list_files_recursively(g.src_img_dir, sly.image.SUPPORTED_IMG_EXTS)
-        if len(images) == 0:
+        with g.metrics.stage("index_images", dataset) as stage:
+            g.image_index = g.input_source.index_images(g.src_img_dir)
+            stage.items += g.image_index.images_count
+        if g.image_index.images_count == 0:
             app_logger.warn(
                 f"Folder '{g.src_img_dir}' has no images at this level. Read the application overview."
             )
@@ -65,107 +91,141 @@ def import_coco(api: sly.Api, task_id, context, state, app_logger):
         coco_instances_ann_path, coco_captions_ann_path = coco_converter.get_ann_path(
             ann_dir=coco_ann_dir, dataset_name=dataset, is_original=g.is_original
         )
-        if coco_instances_ann_path is not None:
+        cache_key, cache_entry = None, None
+        if coco_instances_ann_path is not None and g.conversion_cache is not None:
+            cache_key = coco_converter.get_conversion_cache_key(
+                dataset, coco_instances_ann_path, coco_captions_ann_path
+            )
+            # images of cached datasets are not verified
+            if not g.VERIFY_IMAGES:
+                cache_entry = g.conversion_cache.get(cache_key)
+        if cache_entry is not None:
+            sly.logger.info(f"Dataset {dataset} is found in the conversion cache.")
+            if write_local_images:
+                sly_dataset_dir = coco_converter.create_sly_dataset_dir(dataset_name=dataset)
+                g.img_dir = os.path.join(sly_dataset_dir, "img")
+                g.ann_dir = os.path.join(sly_dataset_dir, "ann")
             try:
-                coco_instances_file_name = os.path.basename(coco_instances_ann_path)
-                coco_converter.check_high_level_coco_ann_structure(coco_instances_ann_path)
-                with HiddenCocoPrints():
-                    coco_instances = COCO(annotation_file=coco_instances_ann_path)
-            except Exception as e:
-                raise Exception(
-                    f"Incorrect instances annotation file {coco_instances_file_name}: {repr(e)}"
-                ) from e
-
-            categories = coco_instances.loadCats(ids=coco_instances.getCatIds())
-            coco_images = coco_instances.imgs
-            coco_anns = coco_instances.imgToAnns
-
-            types = coco_converter.get_ann_types(coco=coco_instances)
-
-            if coco_captions_ann_path is not None and sly.fs.file_exists(coco_captions_ann_path):
+                counters, meta = coco_converter.convert_cached_dataset(
+                    dataset=dataset, entry=cache_entry, uploader=pipeline
+                )
+            finally:
+                cache_entry.close()
+        elif coco_instances_ann_path is not None:
+            with g.metrics.stage("load_annotations", dataset) as stage:
                 try:
-                    coco_captions = COCO(annotation_file=coco_captions_ann_path)
-                    types += coco_converter.get_ann_types(coco=coco_captions)
-                    for img_id, ann in coco_instances.imgToAnns.items():
-                        ann.extend(coco_captions.imgToAnns[img_id])
-                except:
-                    coco_captions = None
+                    coco_instances_file_name = os.path.basename(coco_instances_ann_path)
+                    stage.bytes += g.input_source.get_size(coco_instances_ann_path)
+                    if g.STREAM_ANNOTATIONS:
+                        coco_instances = coco_loader.stream_coco_annotations(
+                            coco_instances_ann_path,
+                            spill_dir=os.path.join(g.STORAGE_DIR, "annotations_spill", dataset),
+                            source=g.input_source,
+                        )
+                    else:
+                        coco_instances = coco_loader.load_coco_annotations(
+                            coco_instances_ann_path, source=g.input_source
+                        )
+                except Exception as e:
+                    raise Exception(
+                        f"Incorrect instances annotation file {coco_instances_file_name}: {repr(e)}"
+                    ) from e
+
+                if coco_captions_ann_path is not None and g.input_source.file_exists(
+                    coco_captions_ann_path
+                ):
+                    try:
+                        coco_instances.add_captions(coco_captions_ann_path)
+                        stage.bytes += g.input_source.get_size(coco_captions_ann_path)
+                    except:
+                        pass
+                stage.items += len(coco_instances.images)
+
+            categories = coco_instances.categories
+            types = coco_instances.ann_types
+            sly.logger.info(
+                f"Annotations profile of {dataset} dataset", extra=coco_instances.profile.to_json()
+            )
 
-            sly_dataset_dir = coco_converter.create_sly_dataset_dir(dataset_name=dataset)
-            g.img_dir = os.path.join(sly_dataset_dir, "img")
-            g.ann_dir = os.path.join(sly_dataset_dir, "ann")
+            if write_local_images:
+                sly_dataset_dir = coco_converter.create_sly_dataset_dir(dataset_name=dataset)
+                g.img_dir = os.path.join(sly_dataset_dir, "img")
+                g.ann_dir = os.path.join(sly_dataset_dir, "ann")
 
             meta = coco_converter.get_sly_meta_from_coco(
                 coco_categories=categories, dataset_name=dataset, ann_types=types
             )
 
-            ds_progress = sly.Progress(
-                message=f"Converting dataset: {dataset}",
-                total_cnt=len(coco_images),
-                min_report_percent=1,
+            cache_writer = None
+            if cache_key is not None:
+                cache_writer = g.conversion_cache.create_writer(cache_key)
+            counters, meta = coco_converter.convert_trainval_dataset(
+                dataset=dataset,
+                meta=meta,
+                coco_categories=categories,
+                coco_annotations=coco_instances,
+                uploader=pipeline,
+                cache_writer=cache_writer,
             )
-            incorrect_anns = 0
-            skipped_images = 0
-
-            for img_id, img_info in coco_images.items():
-                image_name = img_info.get("file_name")
-                if image_name is None:
-                    incorrect_anns += 1
-                    ds_progress.iter_done_report()
-                    continue
-                if "/" in image_name:
-                    image_name = os.path.basename(image_name)
-                if not sly.fs.file_exists(os.path.join(g.src_img_dir, image_name)):
-                    skipped_images += 1
-                    ds_progress.iter_done_report()
-                    continue
-                img_ann = coco_anns[img_id]
-                img_size = coco_converter.get_image_size_from_coco_annotation(img_info, img_id)
-                ann, meta = coco_converter.create_sly_ann_from_coco_annotation(
-                    meta=meta,
-                    coco_categories=categories,
-                    coco_ann=img_ann,
-                    image_size=img_size,
-                )
-                coco_converter.move_trainvalds_to_sly_dataset(
-                    dataset=dataset, coco_image=img_info, ann=ann
+            coco_instances.close()
+        if coco_instances_ann_path is not None:
+            current_dataset_images_cnt += counters["converted"]
+            if counters["incorrect"] > 0:
+                app_logger.warn(
+                    f"{counters['incorrect']} images skipped because of incorrect annotation."
                 )
-                current_dataset_images_cnt += 1
-
-                ds_progress.iter_done_report()
-            if incorrect_anns > 0:
-                app_logger.warn(f"{skipped_images} images skipped because of incorrect annotation.")
-            if skipped_images > 0:
-                app_logger.warn(f"{skipped_images} images skipped because of missing files.")
+            if counters["skipped"] > 0:
+                app_logger.warn(f"{counters['skipped']} images skipped because of missing files.")
         else:
-            coco_converter.get_sly_meta_from_coco(coco_categories=[], dataset_name=dataset)
-            sly_dataset_dir = coco_converter.create_sly_dataset_dir(dataset_name=dataset)
-            g.dst_img_dir = os.path.join(sly_dataset_dir, "img")
-            g.ann_dir = os.path.join(sly_dataset_dir, "ann")
+            meta = coco_converter.get_sly_meta_from_coco(coco_categories=[], dataset_name=dataset)
+            if write_local_images:
+                sly_dataset_dir = coco_converter.create_sly_dataset_dir(dataset_name=dataset)
+                g.dst_img_dir = os.path.join(sly_dataset_dir, "img")
+                g.ann_dir = os.path.join(sly_dataset_dir, "ann")
             current_dataset_images_cnt = coco_converter.move_testds_to_sly_dataset(
-                dataset=dataset, image_cnt=current_dataset_images_cnt
+                dataset=dataset, image_cnt=current_dataset_images_cnt, meta=meta, uploader=pipeline
             )
         if current_dataset_images_cnt == 0:
             coco_converter.remove_empty_sly_dataset_dir(dataset_name=dataset)
         else:
             sly.logger.info(f"Dataset {dataset} has been successfully converted.")
             total_images += current_dataset_images_cnt
+        # in pipelined modes the dataset is finished when all its images are uploaded
+        if pipeline is None:
+            g.checkpoint.finish_dataset(dataset, current_dataset_images_cnt)
+        else:
+            pipeline.finish_dataset(dataset, current_dataset_images_cnt)
+        g.metrics.finish_dataset(dataset)
+        g.metrics.log_dataset_summary(dataset)
+
+    if pipeline is not None:
+        pipeline.close()
+    g.input_source.close()
 
     if len(coco_datasets) == 0 or total_images == 0:
         msg = "Not found COCO format datasets in the input directory"
         description = "Please, read the application overview."
         sly.logger.error(msg)
         api.task.set_output_error(task_id, msg, description)
-    else:
-        project_id, _ = sly.upload_project(
-            dir=g.SLY_BASE_DIR,
-            api=api,
-            workspace_id=g.WORKSPACE_ID,
-            project_name=project_name,
-            log_progress=True,
+    elif pipeline is not None:
+        g.workflow.add_output(pipeline.project_id)
+    elif g.CHECKPOINTS:
+        project_id = uploader.upload_local_project(
+            api, g.WORKSPACE_ID, project_name, g.SLY_BASE_DIR, g.checkpoint, metrics=g.metrics
         )
         g.workflow.add_output(project_id)
-    g.my_app.stop()
+    else:
+        with g.metrics.stage("upload") as stage:
+            project_id, _ = sly.upload_project(
+                dir=g.SLY_BASE_DIR,
+                api=api,
+                workspace_id=g.WORKSPACE_ID,
+                project_name=project_name,
+                log_progress=True,
+            )
+            stage.items += total_images
+        g.workflow.add_output(project_id)
+    g.checkpoint.remove()
 
 
 def main():
@@ -0,0 +1,310 @@
+import cProfile
+import heapq
+import itertools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import supervisely as sly
+
+SLOWEST_LIMIT = 10
+SUMMARY_FUNCTIONS_LIMIT = 5
+SUMMARY_SLOWEST_LIMIT = 3
+SLOWEST_IMAGE_FIELDS = ["image_id", "file_name", "objects"]
+SLOWEST_OBJECT_FIELDS = ["annotation_id", "image_id", "category_id", "kind"]
+
+
+def get_peak_rss():
+    """Peak resident set size in bytes of the process and of its finished child processes."""
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return {
+        "main": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+        "workers": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale,
+    }
+
+
+class Slowest:
+    """The slowest items, item fields are stored as tuples and converted to dicts in to_json()."""
+
+    def __init__(self, fields, limit=SLOWEST_LIMIT):
+        self.fields = fields
+        self.limit = limit
+        self._heap = []
+        self._counter = itertools.count()
+
+    def add(self, seconds, *values):
+        if len(self._heap) < self.limit:
+            heapq.heappush(self._heap, (seconds, next(self._counter), values))
+        elif seconds > self._heap[0][0]:
+            heapq.heapreplace(self._heap, (seconds, next(self._counter), values))
+
+    def extend(self, items):
+        for seconds, values in items:
+            self.add(seconds, *values)
+
+    def items(self):
+        return [(seconds, values) for seconds, _, values in sorted(self._heap, reverse=True)]
+
+    def to_json(self):
+        return [
+            {"seconds": seconds, **dict(zip(self.fields, values))}
+            for seconds, values in self.items()
+        ]
+
+
+class StageMetrics:
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+        self.items = 0
+        self.bytes = 0
+
+    def to_json(self):
+        return {
+            "seconds": self.seconds,
+            "calls": self.calls,
+            "items": self.items,
+            "bytes": self.bytes,
+            "items_per_second": self.items / self.seconds if self.seconds > 0 else None,
+            "bytes_per_second": self.bytes / self.seconds if self.seconds > 0 else None,
+        }
+
+
+class LocalMetrics:
+    """
+    Time of the hot functions and the slowest images and objects collected in the current
+    process (e.g. a conversion worker) since the last pop, see ImportMetrics.pop_local.
+    """
+
+    def __init__(self):
+        self.functions = {}  # name -> [seconds, calls]
+        self.slowest_images = Slowest(SLOWEST_IMAGE_FIELDS)
+        self.slowest_objects = Slowest(SLOWEST_OBJECT_FIELDS)
+
+    def to_tuple(self):
+        """Picklable data passed from the worker process."""
+        return self.functions, self.slowest_images.items(), self.slowest_objects.items()
+
+
+class ImportMetrics:
+    """
+    Metrics of the import run: wall time, processed items and bytes of every stage (per dataset
+    for the dataset stages), time of the hot functions inside the conversion (summed over workers),
+    the slowest images and objects and peak memory usage.
+    The report is written to report_dir, if profile is True, cProfile stats of the profiled blocks
+    are written to report_dir/profiles for every process.
+    """
+
+    def __init__(self, report_dir, profile=False):
+        self.report_dir = report_dir
+        self.profile = profile
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._stages = {}  # (dataset or None, stage name) -> StageMetrics
+        self._functions = {}  # dataset -> function name -> [seconds, calls]
+        self._slowest_images = {}  # dataset -> Slowest
+        self._slowest_objects = {}  # dataset -> Slowest
+        self._peak_rss = {}  # dataset -> peak RSS after the dataset
+        self._local = LocalMetrics()
+        self._profilers = {}
+        # the lock may be held by the upload thread while conversion workers are forked
+        os.register_at_fork(after_in_child=self._reset_in_child)
+
+    def _reset_in_child(self):
+        self._lock = threading.Lock()
+        self._local = LocalMetrics()
+        self._profilers = {}
+
+    def _get_stage(self, name, dataset):
+        key = (dataset, name)
+        if key not in self._stages:
+            self._stages[key] = StageMetrics()
+        return self._stages[key]
+
+    @contextmanager
+    def stage(self, name, dataset=None):
+        """Measures wall time of the block, items and bytes are added to the yielded stage."""
+        with self._lock:
+            stage = self._get_stage(name, dataset)
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                stage.seconds += elapsed
+                stage.calls += 1
+
+    def add(self, name, dataset=None, seconds=0.0, items=0, bytes=0):
+        """Adds metrics of the stage measured outside of stage(), e.g. in the upload thread."""
+        with self._lock:
+            stage = self._get_stage(name, dataset)
+            stage.seconds += seconds
+            stage.calls += 1
+            stage.items += items
+            stage.bytes += bytes
+
+    @contextmanager
+    def timer(self, name):
+        """Measures time of the hot function call in the current process."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                function = self._local.functions.setdefault(name, [0.0, 0])
+                function[0] += elapsed
+                function[1] += 1
+
+    def add_image_time(self, seconds, image_id, file_name, objects):
+        self._local.slowest_images.add(seconds, image_id, file_name, objects)
+
+    def add_object_time(self, seconds, annotation_id, image_id, category_id, kind):
+        self._local.slowest_objects.add(seconds, annotation_id, image_id, category_id, kind)
+
+    def pop_local(self):
+        """Returns metrics collected in the current process since the last pop, see merge_local."""
+        with self._lock:
+            local, self._local = self._local, LocalMetrics()
+        return local.to_tuple()
+
+    def merge_local(self, dataset, local):
+        functions, slowest_images, slowest_objects = local
+        with self._lock:
+            dataset_functions = self._functions.setdefault(dataset, {})
+            for name, (seconds, calls) in functions.items():
+                function = dataset_functions.setdefault(name, [0.0, 0])
+                function[0] += seconds
+                function[1] += calls
+            self._slowest_images.setdefault(dataset, Slowest(SLOWEST_IMAGE_FIELDS)).extend(
+                slowest_images
+            )
+            self._slowest_objects.setdefault(dataset, Slowest(SLOWEST_OBJECT_FIELDS)).extend(
+                slowest_objects
+            )
+
+    def finish_dataset(self, dataset):
+        self._peak_rss[dataset] = get_peak_rss()
+
+    @contextmanager
+    def profiled(self, name):
+        """
+        Profiles the block with cProfile if profiling is enabled. Stats of all calls with the same
+        name are accumulated in the process and written to profiles/<name>_<pid>.prof.
+        """
+        if not self.profile:
+            yield
+            return
+        key = (name, os.getpid())
+        profiler = self._profilers.setdefault(key, cProfile.Profile())
+        try:
+            profiler.enable()
+        except ValueError:
+            # another profiler is active, e.g. the block is nested in another profiled block
+            yield
+            return
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiles_dir = os.path.join(self.report_dir, "profiles")
+            os.makedirs(profiles_dir, exist_ok=True)
+            profiler.dump_stats(os.path.join(profiles_dir, f"{name}_{os.getpid()}.prof"))
+
+    def to_json(self):
+        with self._lock:
+            datasets = {}
+            for (dataset, name), stage in self._stages.items():
+                if dataset is not None:
+                    datasets.setdefault(dataset, {"stages": {}})["stages"][name] = stage.to_json()
+            for dataset in datasets:
+                functions = self._functions.get(dataset, {})
+                datasets[dataset]["functions"] = {
+                    name: {"seconds": seconds, "calls": calls}
+                    for name, (seconds, calls) in sorted(
+                        functions.items(), key=lambda item: item[1][0], reverse=True
+                    )
+                }
+                for key, slowest in [
+                    ("slowest_images", self._slowest_images),
+                    ("slowest_objects", self._slowest_objects),
+                ]:
+                    datasets[dataset][key] = (
+                        slowest[dataset].to_json() if dataset in slowest else []
+                    )
+                datasets[dataset]["peak_rss_bytes"] = self._peak_rss.get(dataset)
+            return {
+                "total_seconds": time.perf_counter() - self._start,
+                "peak_rss_bytes": get_peak_rss(),
+                "stages": {
+                    name: stage.to_json()
+                    for (dataset, name), stage in self._stages.items()
+                    if dataset is None
+                },
+                "datasets": datasets,
+            }
+
+    def log_dataset_summary(self, dataset, report=None):
+        if report is None:
+            report = self.to_json()
+        dataset_report = report["datasets"].get(dataset)
+        if dataset_report is None:
+            return
+        sly.logger.info(
+            f"Metrics of {dataset} dataset",
+            extra={
+                "stages": {
+                    name: {
+                        "seconds": round(stage["seconds"], 3),
+                        "items_per_second": round(stage["items_per_second"] or 0, 1),
+                    }
+                    for name, stage in dataset_report["stages"].items()
+                },
+                "functions": {
+                    name: round(function["seconds"], 3)
+                    for name, function in list(dataset_report["functions"].items())[
+                        :SUMMARY_FUNCTIONS_LIMIT
+                    ]
+                },
+                "slowest_images": dataset_report["slowest_images"][:SUMMARY_SLOWEST_LIMIT],
+                "peak_rss_mb": {
+                    name: round(value / 1024**2)
+                    for name, value in (dataset_report["peak_rss_bytes"] or {}).items()
+                },
+            },
+        )
+
+    def write_report(self):
+        """Writes the report json and logs its summary, returns the report path."""
+        report = self.to_json()
+        os.makedirs(self.report_dir, exist_ok=True)
+        report_path = os.path.join(self.report_dir, "report.json")
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=4)
+        sly.logger.info(
+            "Import metrics",
+            extra={
+                "total_seconds": round(report["total_seconds"], 3),
+                "stages": {
+                    name: round(stage["seconds"], 3) for name, stage in report["stages"].items()
+                },
+                "datasets": {
+                    dataset: {
+                        name: round(stage["seconds"], 3)
+                        for name, stage in dataset_report["stages"].items()
+                    }
+                    for dataset, dataset_report in report["datasets"].items()
+                },
+                "peak_rss_mb": {
+                    name: round(value / 1024**2) for name, value in report["peak_rss_bytes"].items()
+                },
+                "report_path": report_path,
+            },
+        )
+        return report_path
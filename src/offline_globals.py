@@ -0,0 +1,54 @@
+import os
+import sys
+import types
+
+# settings of the app globals module which are read by the converter modules,
+# values are the app defaults
+DEFAULT_SETTINGS = {
+    "INCLUDE_CAPTIONS": False,
+    "CONVERT_RLE_TO_BITMAP": False,
+    "CONVERSION_WORKERS": 1,
+    "BITMAP_ENCODING_THREADS": 4,
+    "DIRECT_ANNOTATION_JSON": True,
+    "IMAGE_THREADS": 8,
+    "VERIFY_IMAGES": False,
+    "VERIFICATION_WORKERS": 0,
+    "STREAM_ANNOTATIONS": False,
+    "DOWNLOAD_CONNECTIONS": 8,
+    "STREAM_DOWNLOADS": False,
+    "READ_FROM_ARCHIVE": False,
+    "UPLOAD_MODE": "project",
+}
+
+
+def install_globals(work_dir=None, fingerprint="offline", **settings):
+    """
+    The app globals module starts a Supervisely task on import, tests and benchmarks
+    install a module with the same names instead, so the converter modules run offline.
+    Settings are the app defaults updated with the passed ones, the storage dirs are
+    created under work_dir if it's passed.
+    """
+    unknown = set(settings) - set(DEFAULT_SETTINGS)
+    if len(unknown) > 0:
+        raise ValueError(f"Unknown settings: {sorted(unknown)}")
+
+    g = types.ModuleType("globals")
+    for name, value in {**DEFAULT_SETTINGS, **settings}.items():
+        setattr(g, name, value)
+    g.META = None
+    g.conflict_classes = []
+    g.STORAGE_DIR = work_dir
+    g.SLY_BASE_DIR = os.path.join(work_dir, "supervisely") if work_dir is not None else None
+    g.conversion_cache = None
+    g.img_dir = g.ann_dir = g.src_img_dir = g.dst_img_dir = g.image_index = None
+    sys.modules["globals"] = g
+
+    import checkpoint
+    import input_source
+    import metrics
+
+    g.input_source = input_source.local_input
+    g.checkpoint = checkpoint.Checkpoint(None, fingerprint)
+    metrics_dir = os.path.join(work_dir, "metrics") if work_dir is not None else None
+    g.metrics = metrics.ImportMetrics(metrics_dir)
+    return g
@@ -0,0 +1,54 @@
+import multiprocessing as mp
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import supervisely as sly
+
+
+def get_workers_count(workers, tasks_count=None):
+    if workers is None or workers <= 0:
+        workers = os.cpu_count() or 1
+    if tasks_count is not None:
+        workers = min(workers, tasks_count)
+    return max(workers, 1)
+
+
+def get_process_pool(workers, initializer=None, initargs=()):
+    """
+    Returns a process pool with forked workers (they inherit the app state and loaded annotations)
+    or None if "fork" start method is not available on the current platform.
+    """
+    if "fork" not in mp.get_all_start_methods():
+        sly.logger.warn("Process pool is not available on this platform, sequential mode is used.")
+        return None
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=mp.get_context("fork"),
+        initializer=initializer,
+        initargs=initargs,
+    )
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+
+def imap_ordered(executor, func, iterable, max_pending):
+    """
+    Same as executor.map, but results are yielded in the input order
+    and no more than max_pending tasks are submitted at the same time.
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while len(pending) > 0:
+        yield pending.popleft().result()
@@ -0,0 +1,162 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import supervisely as sly
+from supervisely.io.fs import silent_remove
+
+DOWNLOAD_PART_SIZE = 32 * 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_TIMEOUT = 60
+
+
+def supports_ranges(headers, sizeb):
+    return sizeb > 0 and headers.get("accept-ranges", "").lower() == "bytes"
+
+
+class RangesNotSupported(Exception):
+    """The server answered a range request with the whole file."""
+
+
+class RangedDownload:
+    """
+    Downloads a file by byte ranges over several connections. Ranges are written to
+    "<path>.partial" and finished ranges are recorded in the "<path>.partial.json" state file,
+    so an interrupted download is resumed from the finished ranges as long as these files are kept
+    (the app storage dir is cleaned at startup unless checkpoints are enabled).
+    The file is moved to the target path after its size is verified.
+    RangesNotSupported is raised if the server ignores range requests.
+    """
+
+    def __init__(self, link, path, sizeb, part_size=DOWNLOAD_PART_SIZE, headers=None):
+        self.link = link
+        self.path = path
+        self.sizeb = sizeb
+        self.part_size = part_size
+        self.headers = headers or {}
+        self.partial_path = f"{path}.partial"
+        self.state_path = f"{path}.partial.json"
+        self.parts_count = max((sizeb + part_size - 1) // part_size, 1)
+        self._done_parts = set()
+        self._lock = threading.Lock()
+        self._progress_cb = None
+        self._reported = 0
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path) or not os.path.exists(self.partial_path):
+            return
+        try:
+            with open(self.state_path, "r") as f:
+                state = json.load(f)
+        except ValueError:
+            return
+        if (
+            state.get("link") == self.link
+            and state.get("size") == self.sizeb
+            and state.get("part_size") == self.part_size
+            and os.path.getsize(self.partial_path) == self.sizeb
+        ):
+            self._done_parts = set(state.get("done_parts", []))
+
+    def _save_state(self):
+        state = {
+            "link": self.link,
+            "size": self.sizeb,
+            "part_size": self.part_size,
+            "done_parts": sorted(self._done_parts),
+        }
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _report(self, count):
+        if self._progress_cb is not None:
+            with self._lock:
+                self._reported += count
+                self._progress_cb(count)
+
+    def _get_part_range(self, part):
+        start = part * self.part_size
+        return start, min(start + self.part_size, self.sizeb)
+
+    def _download_part(self, fd, part):
+        start, end = self._get_part_range(part)
+        for attempt in range(DOWNLOAD_RETRIES):
+            offset = start
+            try:
+                headers = {**self.headers, "Range": f"bytes={start}-{end - 1}"}
+                with requests.get(
+                    self.link, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT
+                ) as response:
+                    response.raise_for_status()
+                    if response.status_code != 206:
+                        raise RangesNotSupported(
+                            f"Server ignored the range request for {self.link}"
+                        )
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        chunk = chunk[: end - offset]
+                        os.pwrite(fd, chunk, offset)
+                        offset += len(chunk)
+                        self._report(len(chunk))
+                        if offset == end:
+                            break
+                if offset != end:
+                    raise RuntimeError(f"Incomplete range {start}-{end - 1} of {self.link}")
+                break
+            except (requests.exceptions.RequestException, RuntimeError) as e:
+                # bytes of the failed attempt are downloaded again
+                self._report(-(offset - start))
+                if attempt == DOWNLOAD_RETRIES - 1:
+                    raise
+                sly.logger.warn(f"Retrying download of range {start}-{end - 1}: {repr(e)}")
+        with self._lock:
+            self._done_parts.add(part)
+            self._save_state()
+
+    def run(self, connections, progress_cb=None):
+        self._progress_cb = progress_cb
+        self._load_state()
+        if len(self._done_parts) == 0:
+            with open(self.partial_path, "wb") as f:
+                f.truncate(self.sizeb)
+        else:
+            sly.logger.info(
+                f"Resuming download: {len(self._done_parts)} of {self.parts_count} parts are ready"
+            )
+            done_ranges = map(self._get_part_range, self._done_parts)
+            self._report(sum(end - start for start, end in done_ranges))
+
+        parts = [part for part in range(self.parts_count) if part not in self._done_parts]
+        fd = os.open(self.partial_path, os.O_WRONLY)
+        try:
+            with ThreadPoolExecutor(max_workers=max(min(connections, len(parts)), 1)) as executor:
+                for future in [executor.submit(self._download_part, fd, part) for part in parts]:
+                    future.result()
+        except RangesNotSupported:
+            # the file is downloaded again by a single request
+            self._report(-self._reported)
+            silent_remove(self.state_path)
+            silent_remove(self.partial_path)
+            raise
+        finally:
+            os.close(fd)
+
+        if (
+            len(self._done_parts) != self.parts_count
+            or os.path.getsize(self.partial_path) != self.sizeb
+        ):
+            raise RuntimeError(
+                f"Downloaded file size does not match the expected size: {self.link}"
+            )
+        os.replace(self.partial_path, self.path)
+        silent_remove(self.state_path)
+        return self.path
+
+
+def download_ranged(link, path, sizeb, connections, progress_cb=None):
+    """Downloads the file in parallel byte ranges, see RangedDownload."""
+    return RangedDownload(link, path, sizeb).run(connections, progress_cb)
@@ -0,0 +1,15 @@
+import supervisely as sly
+
+
+def upload_report(api, team_id, local_path, remote_path):
+    """
+    Uploads the report file, so it's available after the task is finished.
+    Returns the Team Files path or None, upload errors are only logged.
+    """
+    try:
+        api.file.upload(team_id, local_path, remote_path)
+    except Exception as e:
+        sly.logger.warn(f"Failed to upload the report to Team Files: {repr(e)}")
+        return None
+    sly.logger.info(f"Report is uploaded to Team Files: {remote_path}")
+    return remote_path
@@ -0,0 +1,217 @@
+import os
+import queue
+import threading
+import time
+
+import supervisely as sly
+from supervisely.io.fs import silent_remove
+
+UPLOAD_BATCH_SIZE = 100
+# max number of batches waiting for upload
+UPLOAD_QUEUE_SIZE = 4
+
+
+class PipelinedUploader:
+    """
+    Uploads converted images and annotations to the output project in batches.
+    Batches are uploaded in a background thread, so the conversion of the next images
+    overlaps with network I/O. Annotations are passed as paths to json files or as json dicts.
+    If remove_files is True, local files of the uploaded batches are removed.
+    The project and datasets are created on the first uploaded batch.
+    If checkpoint is passed, uploaded images are recorded to it and the project of the previous run
+    is reused, images uploaded after the last recorded batch are removed from it.
+    finish_dataset records the dataset as finished after all its added images are uploaded.
+    If metrics are passed, time and size of the uploaded batches are added to the "upload" stage
+    of their datasets, see metrics.ImportMetrics.
+    """
+
+    def __init__(
+        self,
+        api: sly.Api,
+        workspace_id,
+        project_name,
+        batch_size=UPLOAD_BATCH_SIZE,
+        queue_size=UPLOAD_QUEUE_SIZE,
+        remove_files=True,
+        checkpoint=None,
+        metrics=None,
+    ):
+        self.api = api
+        self.workspace_id = workspace_id
+        self.project_name = project_name
+        self.project_id = None
+        self.uploaded_images_cnt = 0
+        self._batch_size = batch_size
+        self._remove_files = remove_files
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._batch = []
+        self._batch_dataset = None
+        self._meta = None
+        self._uploaded_meta_json = None
+        self._dataset_ids = {}
+        self._dataset_names = {}
+        self._error = None
+        self._checkpoint = checkpoint
+        self._metrics = metrics
+        if checkpoint is not None and checkpoint.project_id is not None:
+            self._restore_project()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def add_item(self, dataset_name, name, img_path, ann, meta: sly.ProjectMeta):
+        if self._batch_dataset is not None and self._batch_dataset != dataset_name:
+            self.flush()
+        names = self._dataset_names.setdefault(dataset_name, set())
+        if name in names:
+            sly.logger.warn(f"Image '{name}' is already uploaded to dataset '{dataset_name}'")
+            return
+        names.add(name)
+        self._meta = meta
+        self._batch_dataset = dataset_name
+        self._batch.append((name, img_path, ann))
+        if len(self._batch) >= self._batch_size:
+            self.flush()
+
+    def flush(self):
+        if len(self._batch) == 0:
+            return
+        self._put((self._upload_batch, (self._batch_dataset, self._batch, self._meta)))
+        self._batch = []
+
+    def finish_dataset(self, dataset_name, images_count):
+        self.flush()
+        if self._checkpoint is not None:
+            self._put((self._checkpoint.finish_dataset, (dataset_name, images_count)))
+
+    def close(self):
+        """Uploads the remaining items, waits for the upload thread and returns the project id."""
+        self.flush()
+        self._put(None)
+        self._thread.join()
+        self._raise_if_failed()
+        return self.project_id
+
+    def _raise_if_failed(self):
+        if self._error is not None:
+            raise RuntimeError("Failed to upload converted images") from self._error
+
+    def _put(self, task):
+        while True:
+            self._raise_if_failed()
+            try:
+                self._queue.put(task, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def _run(self):
+        try:
+            while True:
+                task = self._queue.get()
+                if task is None:
+                    return
+                func, args = task
+                func(*args)
+        except Exception as e:
+            self._error = e
+
+    def _restore_project(self):
+        project = self.api.project.get_info_by_id(self._checkpoint.project_id)
+        if project is None:
+            sly.logger.warn(
+                f"Project {self._checkpoint.project_id} of the previous run is not found, "
+                "all images will be uploaded to a new project"
+            )
+            self._checkpoint.reset_uploads()
+            return
+        self.project_id, self.project_name = project.id, project.name
+        for dataset_name, dataset_id in self._checkpoint.dataset_ids.items():
+            # images of the batch interrupted by the restart are uploaded again
+            uploaded = self._checkpoint.uploaded.get(dataset_name, set())
+            unrecorded = [
+                image.id
+                for image in self.api.image.get_list(dataset_id)
+                if image.name not in uploaded
+            ]
+            if len(unrecorded) > 0:
+                self.api.image.remove_batch(unrecorded)
+            self._dataset_ids[dataset_name] = dataset_id
+        sly.logger.info(f"Continue uploading to the project {project.name} (id: {project.id})")
+
+    def _get_dataset_id(self, dataset_name):
+        if self.project_id is None:
+            project = self.api.project.create(
+                self.workspace_id, self.project_name, change_name_if_conflict=True
+            )
+            self.project_id, self.project_name = project.id, project.name
+            if self._checkpoint is not None:
+                self._checkpoint.set_project(project.id)
+        if dataset_name not in self._dataset_ids:
+            dataset = self.api.dataset.create(
+                self.project_id, dataset_name, change_name_if_conflict=True
+            )
+            self._dataset_ids[dataset_name] = dataset.id
+            if self._checkpoint is not None:
+                self._checkpoint.set_dataset_id(dataset_name, dataset.id)
+        return self._dataset_ids[dataset_name]
+
+    def _upload_batch(self, dataset_name, batch, meta: sly.ProjectMeta):
+        start = time.perf_counter()
+        dataset_id = self._get_dataset_id(dataset_name)
+        meta_json = meta.to_json()
+        if meta_json != self._uploaded_meta_json:
+            self.api.project.update_meta(self.project_id, meta_json)
+            self._uploaded_meta_json = meta_json
+
+        names, img_paths, anns = map(list, zip(*batch))
+        if self._metrics is not None:
+            images_size = sum(os.path.getsize(img_path) for img_path in img_paths)
+        img_infos = self.api.image.upload_paths(dataset_id, names, img_paths)
+        img_ids = [img_info.id for img_info in img_infos]
+        if isinstance(anns[0], dict):
+            self.api.annotation.upload_jsons(img_ids, anns)
+        else:
+            self.api.annotation.upload_paths(img_ids, anns)
+        if self._checkpoint is not None:
+            self._checkpoint.add_uploaded(dataset_name, names)
+        if self._remove_files:
+            for img_path, ann in zip(img_paths, anns):
+                silent_remove(img_path)
+                if not isinstance(ann, dict):
+                    silent_remove(ann)
+        if self._metrics is not None:
+            self._metrics.add(
+                "upload", dataset_name, time.perf_counter() - start, len(batch), images_size
+            )
+
+        self.uploaded_images_cnt += len(batch)
+        sly.logger.info(
+            f"{self.uploaded_images_cnt} images have been uploaded to the project",
+            extra={"dataset": dataset_name, "batch_size": len(batch)},
+        )
+
+
+def upload_local_project(
+    api: sly.Api, workspace_id, project_name, project_dir, checkpoint, metrics=None
+):
+    """
+    Uploads the local Supervisely project with PipelinedUploader,
+    so the upload is resumed from the checkpoint after the restart.
+    Returns the project id.
+    """
+    project = sly.Project(project_dir, sly.OpenMode.READ)
+    pipeline = PipelinedUploader(
+        api,
+        workspace_id,
+        project_name,
+        remove_files=False,
+        checkpoint=checkpoint,
+        metrics=metrics,
+    )
+    for dataset in project.datasets:
+        for item_name in dataset:
+            if checkpoint.is_uploaded(dataset.name, item_name):
+                continue
+            img_path, ann_path = dataset.get_item_paths(item_name)
+            pipeline.add_item(dataset.name, item_name, img_path, ann_path, meta=project.meta)
+    return pipeline.close()
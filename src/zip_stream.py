@@ -0,0 +1,186 @@
+import os
+import struct
+import zlib
+
+LOCAL_FILE_HEADER = 0x04034B50
+DATA_DESCRIPTOR = 0x08074B50
+CENTRAL_DIRECTORY_SIGNATURES = [
+    0x02014B50,  # central directory file header
+    0x06054B50,  # end of central directory
+    0x06064B50,  # zip64 end of central directory
+    0x05054B50,  # digital signature
+]
+ZIP64_EXTRA_FIELD = 0x0001
+ZIP64_LIMIT = 0xFFFFFFFF
+STORED = 0
+DEFLATED = 8
+FLAG_ENCRYPTED = 0x1
+FLAG_DATA_DESCRIPTOR = 0x8
+FLAG_UTF8 = 0x800
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class ChunksReader:
+    """File-like reader over an iterator of bytes chunks (e.g. response.iter_content())."""
+
+    def __init__(self, chunks, progress_cb=None):
+        self._chunks = iter(chunks)
+        self._progress_cb = progress_cb
+        self._buf = b""
+        self._pos = 0
+
+    def _fill(self):
+        while self._pos >= len(self._buf):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return False
+            if self._progress_cb is not None:
+                self._progress_cb(len(chunk))
+            self._buf, self._pos = chunk, 0
+        return True
+
+    def read(self, size):
+        """Returns up to size bytes, empty bytes at the end of stream."""
+        if not self._fill():
+            return b""
+        data = self._buf[self._pos : self._pos + size]
+        self._pos += len(data)
+        return data
+
+    def read_exact(self, size):
+        parts = []
+        while size > 0:
+            data = self.read(size)
+            if len(data) == 0:
+                raise ValueError("Incorrect zip stream: unexpected end of data")
+            parts.append(data)
+            size -= len(data)
+        return b"".join(parts)
+
+    def unread(self, data):
+        self._buf = data + self._buf[self._pos :]
+        self._pos = 0
+
+    def drain(self):
+        while self._fill():
+            self._pos = len(self._buf)
+
+
+def get_member_dst_path(dst_dir, member_name):
+    """Returns path of the member inside dst_dir, members outside of it are rejected."""
+    dst_dir = os.path.abspath(dst_dir)
+    dst_path = os.path.abspath(os.path.join(dst_dir, member_name))
+    if os.path.isabs(member_name) or os.path.commonpath([dst_dir, dst_path]) != dst_dir:
+        raise ValueError(f"Incorrect zip member path: {member_name}")
+    return dst_path
+
+
+def _parse_zip64_sizes(extra, usize, csize):
+    pos = 0
+    while pos + 4 <= len(extra):
+        field_id, field_size = struct.unpack("<HH", extra[pos : pos + 4])
+        if field_id == ZIP64_EXTRA_FIELD:
+            values = extra[pos + 4 : pos + 4 + field_size]
+            offset = 0
+            if usize == ZIP64_LIMIT:
+                usize = struct.unpack("<Q", values[offset : offset + 8])[0]
+                offset += 8
+            if csize == ZIP64_LIMIT:
+                csize = struct.unpack("<Q", values[offset : offset + 8])[0]
+            return usize, csize, True
+        pos += 4 + field_size
+    return usize, csize, False
+
+
+def _copy_member_data(reader: ChunksReader, method, csize, has_data_descriptor, dst_file):
+    """Copies (and decompresses) member data. Returns crc32 and size of uncompressed data."""
+    crc, size = 0, 0
+    remaining = None if has_data_descriptor else csize
+    decompressor = zlib.decompressobj(-15) if method == DEFLATED else None
+    while True:
+        if decompressor is not None and decompressor.eof:
+            if len(decompressor.unused_data) > 0:
+                reader.unread(decompressor.unused_data)
+            break
+        if remaining == 0:
+            if decompressor is not None:
+                raise ValueError("Incorrect zip stream: truncated compressed data")
+            break
+        data = reader.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+        if len(data) == 0:
+            raise ValueError("Incorrect zip stream: unexpected end of data")
+        if remaining is not None:
+            remaining -= len(data)
+        if decompressor is not None:
+            data = decompressor.decompress(data)
+        crc = zlib.crc32(data, crc)
+        size += len(data)
+        if dst_file is not None:
+            dst_file.write(data)
+    return crc, size
+
+
+def extract_zip_stream(chunks, dst_dir, member_filter=None, progress_cb=None):
+    """
+    Extracts zip archive from the iterator of bytes chunks without saving the archive on disk:
+    members are read one by one using local file headers, the central directory is not needed.
+    member_filter(name) returns the relative output path of the member or None to skip it.
+    Supports stored and deflated members, data descriptors and zip64.
+    Returns the list of extracted files.
+    """
+    reader = ChunksReader(chunks, progress_cb)
+    extracted = []
+    while True:
+        signature = reader.read(4)
+        if len(signature) == 0:
+            break
+        if len(signature) < 4:
+            signature += reader.read_exact(4 - len(signature))
+        signature = struct.unpack("<I", signature)[0]
+        if signature in CENTRAL_DIRECTORY_SIGNATURES:
+            reader.drain()
+            break
+        if signature != LOCAL_FILE_HEADER:
+            raise ValueError("Incorrect zip stream: local file header expected")
+
+        header = struct.unpack("<HHHHHIIIHH", reader.read_exact(26))
+        _, flags, method, _, _, crc, csize, usize, name_len, extra_len = header
+        name = reader.read_exact(name_len).decode("utf-8" if flags & FLAG_UTF8 else "cp437")
+        usize, csize, is_zip64 = _parse_zip64_sizes(reader.read_exact(extra_len), usize, csize)
+        has_data_descriptor = bool(flags & FLAG_DATA_DESCRIPTOR)
+        if flags & FLAG_ENCRYPTED:
+            raise ValueError(f"Encrypted zip member is not supported: {name}")
+        if method not in [STORED, DEFLATED]:
+            raise ValueError(f"Compression method {method} is not supported: {name}")
+        if method == STORED and has_data_descriptor:
+            raise ValueError(f"Stored zip member with data descriptor is not supported: {name}")
+
+        dst_name = name if member_filter is None else member_filter(name)
+        dst_path = None
+        if dst_name is not None:
+            dst_path = get_member_dst_path(dst_dir, dst_name)
+        if dst_path is not None and name.endswith("/"):
+            os.makedirs(dst_path, exist_ok=True)
+            dst_path = None
+        if dst_path is not None:
+            os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+            with open(dst_path, "wb") as dst_file:
+                actual_crc, actual_size = _copy_member_data(
+                    reader, method, csize, has_data_descriptor, dst_file
+                )
+            extracted.append(dst_path)
+        else:
+            actual_crc, actual_size = _copy_member_data(
+                reader, method, csize, has_data_descriptor, None
+            )
+
+        if has_data_descriptor:
+            crc = struct.unpack("<I", reader.read_exact(4))[0]
+            if crc == DATA_DESCRIPTOR:
+                crc = struct.unpack("<I", reader.read_exact(4))[0]
+            sizes_format = "<QQ" if is_zip64 else "<II"
+            usize = struct.unpack(sizes_format, reader.read_exact(struct.calcsize(sizes_format)))[1]
+        if actual_crc != crc or actual_size != usize:
+            raise ValueError(f"Incorrect zip stream: bad CRC or size of member {name}")
+    return extracted
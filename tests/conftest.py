@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC_DIR)
+
+from offline_globals import install_globals  # noqa: E402
+
+install_globals(
+    fingerprint="tests",
+    INCLUDE_CAPTIONS=True,
+    BITMAP_ENCODING_THREADS=1,
+    IMAGE_THREADS=1,
+)
+
+
+@pytest.fixture
+def g(monkeypatch):
+    """The globals module, settings changed by the test are restored after it."""
+    module = sys.modules["globals"]
+    for name in list(vars(module)):
+        if name.isupper() or name in ["conflict_classes"]:
+            monkeypatch.setattr(module, name, getattr(module, name))
+    monkeypatch.setattr(module, "conflict_classes", [])
+    return module
@@ -0,0 +1,55 @@
+import os
+
+from checkpoint import Checkpoint, open_checkpoint
+
+
+def test_in_memory_checkpoint_does_not_record_images():
+    checkpoint = Checkpoint(None, "fingerprint")
+    checkpoint.add_converted("ds", ["a.jpg"])
+    checkpoint.add_uploaded("ds", ["b.jpg"])
+    assert checkpoint.converted == {} and checkpoint.uploaded == {}
+    assert not checkpoint.is_converted("ds", "a.jpg")
+    assert not checkpoint.is_uploaded("ds", "b.jpg")
+
+
+def test_checkpoint_is_resumed(tmp_path):
+    path = str(tmp_path / "checkpoint.jsonl")
+    checkpoint = Checkpoint(path, "fingerprint")
+    checkpoint.add_converted("ds", ["a.jpg"])
+    checkpoint.add_uploaded("ds", ["b.jpg"])
+    checkpoint.finish_dataset("ds", 2)
+    # the task was killed while writing the record
+    with open(path, "a") as f:
+        f.write('{"event": "conv')
+
+    resumed = Checkpoint(path, "fingerprint")
+    assert resumed.is_resumed
+    assert resumed.is_converted("ds", "a.jpg") and resumed.is_converted("ds", "b.jpg")
+    assert resumed.is_uploaded("ds", "b.jpg") and not resumed.is_uploaded("ds", "a.jpg")
+    assert resumed.finished == {"ds": 2}
+    resumed.add_converted("ds", ["c.jpg"])
+    assert Checkpoint(path, "fingerprint").is_converted("ds", "c.jpg")
+    assert not Checkpoint(path, "other").is_resumed
+
+
+def test_checkpoint_is_resumed_from_the_cache_dir(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "apps_cache")
+    monkeypatch.setenv("modal.state.cocoDataset", "custom")
+    monkeypatch.setenv("modal.state.uploadMode", "pipelined")
+    checkpoint = open_checkpoint(cache_dir, 1)
+    assert not checkpoint.is_resumed
+    assert os.path.dirname(checkpoint.dir) == os.path.join(cache_dir, "coco_import_checkpoints")
+    checkpoint.add_download("input")
+    # the downloaded input is kept next to the manifest
+    os.makedirs(os.path.join(checkpoint.dir, "storage_dir"))
+    open(os.path.join(checkpoint.dir, "storage_dir", "input.zip"), "w").close()
+
+    # the new task of the same import has another data dir, but the same app cache dir
+    resumed = open_checkpoint(cache_dir, 1)
+    assert resumed.is_resumed and resumed.is_downloaded("input")
+    assert os.path.exists(os.path.join(resumed.dir, "storage_dir", "input.zip"))
+
+    monkeypatch.setenv("modal.state.uploadMode", "direct")
+    other = open_checkpoint(cache_dir, 1)
+    assert not other.is_resumed and other.dir != checkpoint.dir
+    assert not open_checkpoint(cache_dir, 2).is_resumed
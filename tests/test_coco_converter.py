@@ -0,0 +1,463 @@
+from copy import deepcopy
+
+import cv2
+import numpy as np
+import pytest
+import supervisely as sly
+
+import coco_converter
+import coco_loader
+import input_source
+
+IMAGE_SIZE = (100, 120)
+
+
+def make_annotations(objects_by_image, categories):
+    """CocoAnnotations of images named <id>.jpg with the given objects."""
+    images = {
+        img_id: {"id": img_id, "file_name": f"{img_id}.jpg", "height": 100, "width": 120}
+        for img_id in objects_by_image
+    }
+    annotations = []
+    for img_id, objects in objects_by_image.items():
+        for object in objects:
+            annotations.append({"id": len(annotations) + 1, "image_id": img_id, **object})
+    img_to_anns = {img_id: [] for img_id in images}
+    for ann in annotations:
+        img_to_anns[ann["image_id"]].append(ann)
+    return coco_loader.CocoAnnotations(categories, images, img_to_anns, annotations)
+
+
+def set_image_index(g, image_ids):
+    files = {f"{img_id}.jpg": f"/images/{img_id}.jpg" for img_id in image_ids}
+    g.image_index = input_source.ImageIndex("/images", files, len(files))
+
+
+def rle(top, left, height, width):
+    """Uncompressed COCO RLE of a rectangle mask."""
+    image_height, image_width = IMAGE_SIZE
+    counts = [left * image_height + top]
+    for col in range(width):
+        counts.append(height)
+        if col < width - 1:
+            counts.append(image_height - height)
+    counts.append(image_height * image_width - sum(counts))
+    return {"size": list(IMAGE_SIZE), "counts": counts}
+
+
+def test_prescan_reports_all_conflicts(g, tmp_path):
+    g.SLY_BASE_DIR = str(tmp_path)
+    g.CONVERT_RLE_TO_BITMAP = True
+    categories = [
+        {"id": 1, "name": "cat"},
+        {"id": 2, "name": "dog"},
+        {"id": 3, "name": "bird"},
+        {"id": 4, "name": "fish"},
+        {"id": 5, "name": "tree"},
+    ]
+    # classes created by the previous datasets
+    meta = sly.ProjectMeta(
+        obj_classes=[
+            sly.ObjClass("cat", sly.Rectangle),
+            sly.ObjClass("cat_bbox", sly.Rectangle),
+            sly.ObjClass("dog", sly.Polygon),
+            sly.ObjClass("dog_bbox", sly.Polygon),
+            sly.ObjClass("bird", sly.Polygon),
+            sly.ObjClass("bird_rle", sly.Polygon),
+            sly.ObjClass("fish", sly.Rectangle),
+            sly.ObjClass("tree", sly.Polygon),
+        ]
+    )
+    polygon = [[10, 10, 50, 10, 50, 50]]
+    coco = make_annotations(
+        {
+            1: [{"category_id": 2, "segmentation": polygon, "bbox": [10, 10, 40, 40]}],
+            2: [{"category_id": 5, "segmentation": rle(5, 5, 10, 10)}],
+            3: [
+                {"category_id": 3, "segmentation": rle(5, 5, 10, 10)},
+                {"category_id": 1, "segmentation": polygon, "bbox": [10, 10, 40, 40]},
+            ],
+            # the image file is missing, so its objects are not converted
+            4: [{"category_id": 4, "segmentation": polygon}],
+        },
+        categories,
+    )
+    set_image_index(g, [1, 2, 3])
+
+    meta = coco_converter.finalize_dataset_meta(meta, categories, coco)
+
+    assert g.conflict_classes == ["dog_bbox", "bird_rle", "cat"]
+    assert meta.get_obj_class("tree_rle").geometry_type is sly.Bitmap
+
+
+CATEGORIES = [{"id": 1, "name": "cat"}, {"id": 2, "name": "dog"}]
+SQUARE = [10, 10, 60, 10, 60, 60, 10, 60]
+HOLE = [20, 20, 30, 20, 30, 30, 20, 30]
+
+
+def normalize_binding_keys(ann_json):
+    """Random binding keys of the labels are replaced with their order of appearance."""
+    keys = {}
+    for label in ann_json["objects"]:
+        key = label.get("instance")
+        if key is not None:
+            label["instance"] = keys.setdefault(key, len(keys))
+    return ann_json
+
+
+def convert(func):
+    try:
+        return normalize_binding_keys(func())
+    except Exception as e:
+        # both paths must fail in the same way
+        return repr(e)
+
+
+@pytest.mark.parametrize("rle_to_bitmap", [False, True])
+@pytest.mark.parametrize(
+    "objects",
+    [
+        pytest.param([{"category_id": 1, "segmentation": [SQUARE, HOLE]}], id="holes"),
+        pytest.param(
+            [
+                {
+                    "category_id": 1,
+                    "segmentation": [SQUARE, [70, 70, 90, 70, 90, 90]],
+                    "bbox": [10, 10, 80, 80],
+                }
+            ],
+            id="multipart",
+        ),
+        pytest.param(
+            [
+                {"category_id": 1, "segmentation": [[100, 10, 150, 10, 150, 50]]},
+                {"category_id": 2, "segmentation": [[-10, -10, 30, -5, 30, 30]]},
+                {"category_id": 2, "bbox": [100, 80, 50, 40]},
+            ],
+            id="out_of_image",
+        ),
+        pytest.param(
+            [
+                {"category_id": 1, "segmentation": [[10, 10, 20, 20]], "bbox": [10, 10, 10, 10]},
+                {"category_id": 2, "segmentation": [SQUARE, [10, 10]]},
+            ],
+            id="less_than_3_points",
+        ),
+        pytest.param(
+            [
+                {"category_id": 1, "bbox": [10, 20, 30, 40]},
+                {"category_id": 2, "bbox": [10.5, 20.25, 30.75, 40.5]},
+                {"category_id": 1, "bbox": [10, 20, 30]},
+                {"category_id": 2, "bbox": []},
+            ],
+            id="int_float_and_ignored_bboxes",
+        ),
+        pytest.param([{"category_id": 1, "bbox": [10, 10, -5, 20]}], id="negative_bbox"),
+        pytest.param([{"category_id": 1, "bbox": [10, 10, "a", 20]}], id="string_bbox"),
+        pytest.param([{"category_id": 1, "bbox": [10, 10, float("nan"), 20]}], id="nan_bbox"),
+        pytest.param(
+            [
+                {"category_id": 1, "segmentation": rle(5, 5, 10, 20), "bbox": []},
+                {"category_id": 2, "segmentation": rle(0, 100, 100, 20), "bbox": [100, 0, 20, 100]},
+                # empty mask
+                {"category_id": 2, "segmentation": {"size": [100, 120], "counts": [12000]}},
+            ],
+            id="rle",
+        ),
+        pytest.param(
+            [
+                {"category_id": 1, "segmentation": [SQUARE], "caption": "a cat"},
+                {"category_id": 2, "bbox": [10, 10, 5, 5], "caption": "a dog"},
+                {"category_id": 3, "caption": "unknown category"},
+            ],
+            id="captions",
+        ),
+    ],
+)
+def test_direct_json_equals_annotation_json(g, tmp_path, objects, rle_to_bitmap):
+    g.SLY_BASE_DIR = str(tmp_path)
+    g.CONVERT_RLE_TO_BITMAP = rle_to_bitmap
+    g.META = sly.ProjectMeta()
+    meta = coco_converter.create_sly_meta_from_coco_categories(
+        CATEGORIES, ["segmentation", "bbox", "caption"]
+    )
+    coco = make_annotations({1: objects}, CATEGORIES)
+    set_image_index(g, [1])
+    meta = coco_converter.finalize_dataset_meta(meta, CATEGORIES, coco)
+    class_registry = coco_converter.ClassRegistry(meta, CATEGORIES)
+    coco_ann = coco.img_to_anns[1]
+
+    direct = convert(
+        lambda: coco_converter.create_sly_ann_json_from_coco_annotation(
+            class_registry, coco_ann, IMAGE_SIZE
+        )
+    )
+    expected = convert(
+        lambda: coco_converter.annotation_to_json(
+            coco_converter.create_sly_ann_from_coco_annotation(class_registry, coco_ann, IMAGE_SIZE)
+        )
+    )
+    assert direct == expected
+
+
+def random_ring(rng, center, radius, vertices, min_radius=0.3):
+    angles = np.sort(rng.uniform(0, 2 * np.pi, vertices))
+    radii = rng.uniform(radius * min_radius, radius, vertices)
+    x = center[0] + radii * np.cos(angles)
+    y = center[1] + radii * np.sin(angles)
+    return np.round(np.stack([x, y], axis=1), 1).tolist()
+
+
+def outline_contour(ring):
+    canvas = np.zeros(IMAGE_SIZE, dtype=np.uint8)
+    points = np.floor(np.array(ring)).astype(np.int32)
+    cv2.polylines(canvas, [points], isClosed=True, color=255)
+    contours, _ = cv2.findContours(canvas, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    return contours[0]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_points_inside_contour_matches_opencv(seed):
+    rng = np.random.RandomState(seed)
+    contour = outline_contour(random_ring(rng, (60, 50), 40, rng.randint(3, 20)))
+    vertices = contour.reshape(-1, 2).astype(np.float64)
+    grid = np.mgrid[0 : IMAGE_SIZE[1] : 0.5, 0 : IMAGE_SIZE[0] : 0.5].reshape(2, -1).T
+    points = np.concatenate(
+        [
+            rng.uniform(0, IMAGE_SIZE[1], (500, 2)),
+            # integer and half-integer points, many of them lie on the contour edges
+            grid,
+            vertices,
+            (vertices + np.roll(vertices, 1, axis=0)) / 2,
+        ]
+    ).astype(np.float32)
+
+    expected = [cv2.pointPolygonTest(contour, (float(x), float(y)), False) > 0 for x, y in points]
+    assert coco_converter.points_inside_contour(contour, points).tolist() == expected
+
+
+def full_canvas_polygon_vertices(coco_ann, image_size):
+    """convert_polygon_vertices drawing every outline on the full-size canvas."""
+    polygons = coco_ann["segmentation"]
+    exteriors = []
+    for polygon in polygons:
+        polygon = [polygon[i * 2 : (i + 1) * 2] for i in range((len(polygon) + 2 - 1) // 2)]
+        exterior_points = [(width, height) for width, height in polygon]
+        if len(exterior_points) == 0:
+            continue
+        exteriors.append(exterior_points)
+
+    interiors = {idx: [] for idx in range(len(exteriors))}
+    id2del = []
+    for idx, exterior in enumerate(exteriors):
+        temp_img = np.zeros(image_size + (3,), dtype=np.uint8)
+        geom = sly.Polygon([sly.PointLocation(y, x) for x, y in exterior])
+        geom.draw_contour(temp_img, color=[255, 255, 255])
+        im = cv2.cvtColor(temp_img, cv2.COLOR_RGB2GRAY)
+        contours, _ = cv2.findContours(im, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+        if len(contours) == 0:
+            continue
+        for idy, exterior2 in enumerate(exteriors):
+            if idx == idy or idy in id2del:
+                continue
+            points_inside = [
+                cv2.pointPolygonTest(contours[0], (x, y), False) > 0 for x, y in exterior2
+            ]
+            if all(points_inside):
+                interiors[idx].append(deepcopy(exteriors[idy]))
+                id2del.append(idy)
+
+    for j in sorted(id2del, reverse=True):
+        del exteriors[j]
+
+    return [
+        coco_converter.create_polygon(exterior, interior)
+        for exterior, interior in zip(exteriors, interiors.values())
+    ]
+
+
+def flatten(ring):
+    return [coord for point in ring for coord in point]
+
+
+def random_polygons(seed):
+    """Rings of a few objects with holes, nested rings and rings partly outside the image."""
+    rng = np.random.RandomState(seed)
+    polygons = []
+    for _ in range(rng.randint(1, 4)):
+        center = rng.uniform([-10, -10], [130, 110])
+        radius = rng.uniform(10, 50)
+        exterior = random_ring(rng, center, radius, rng.randint(6, 12), min_radius=0.8)
+        polygons.append(flatten(exterior))
+        for _ in range(rng.randint(0, 3)):
+            hole_center = center + rng.uniform(-radius / 3, radius / 3, 2)
+            hole = random_ring(rng, hole_center, radius / 4, rng.randint(3, 8))
+            polygons.append(flatten(hole))
+    rng.shuffle(polygons)
+    return polygons
+
+
+@pytest.mark.parametrize(
+    "segmentation",
+    [
+        pytest.param([SQUARE, HOLE], id="hole"),
+        pytest.param([HOLE, SQUARE], id="hole_first"),
+        # the hole touches the exterior, its points lie on the outline
+        pytest.param([SQUARE, [10, 10, 30, 20, 20, 30]], id="touching_hole"),
+        pytest.param([SQUARE, HOLE, [22, 22, 28, 22, 28, 28]], id="nested_rings"),
+        pytest.param([SQUARE, [0, 0, 70, 0, 70, 70, 0, 70]], id="ring_inside_hole"),
+        pytest.param([[90, 80, 150, 80, 150, 130], [110, 90, 115, 90, 115, 95]], id="cropped"),
+    ]
+    + [pytest.param(random_polygons(seed), id=f"random_{seed}") for seed in range(30)],
+)
+def test_polygon_vertices_match_full_canvas(segmentation):
+    coco_ann = {"segmentation": segmentation}
+    expected = full_canvas_polygon_vertices(coco_ann, IMAGE_SIZE)
+    polygons = coco_converter.convert_polygon_vertices(coco_ann, IMAGE_SIZE)
+    assert [polygon.to_json() for polygon in polygons] == [
+        polygon.to_json() for polygon in expected
+    ]
+
+
+# size, compressed counts, uncompressed counts and the mask decoded by pycocotools 2.0.6
+RLE_FIXTURES = {
+    "multi_column_runs": (
+        [6, 5],
+        "4`0:",
+        [4, 16, 10],
+        [".###.", ".###.", ".##..", ".##..", "###..", "###.."],
+    ),
+    "scattered": (
+        [8, 10],
+        "122O50K010N011O07OL0O30ONN00031M0010O1",
+        [
+            1,
+            2,
+            2,
+            1,
+            7,
+            1,
+            2,
+            1,
+            3,
+            1,
+            1,
+            1,
+            2,
+            2,
+            1,
+            2,
+            8,
+            1,
+            4,
+            1,
+            3,
+            4,
+            3,
+            3,
+            1,
+            1,
+            1,
+            1,
+            1,
+            4,
+            2,
+            1,
+            2,
+            1,
+            3,
+            1,
+            2,
+            2,
+        ],
+        [
+            "..#...###.",
+            "#..#..#.#.",
+            "#..#..##..",
+            ".....#...#",
+            "..##...##.",
+            "##.#......",
+            "..#.#.##.#",
+            ".....#####",
+        ],
+    ),
+    "long_runs": (
+        [20, 12],
+        "i01T1`0U1BXN000l0",
+        [25, 1, 36, 17, 73, 3, 17, 3, 17, 3, 45],
+        [
+            "............",
+            "............",
+            "...#........",
+            "...#........",
+            "...#........",
+            ".#.#........",
+            "...#........",
+            "...#........",
+            "...#........",
+            "...#........",
+            "...#........",
+            "...#........",
+            "...#...###..",
+            "...#...###..",
+            "...#...###..",
+            "...#........",
+            "...#........",
+            "...#........",
+            "...#........",
+            "............",
+        ],
+    ),
+    "full": ([4, 5], "0d0", [0, 20], ["#####", "#####", "#####", "#####"]),
+    "empty": ([4, 5], "d0", [20], [".....", ".....", ".....", "....."]),
+    "past_image_area": ([4, 5], "342T1", [3, 4, 2, 40], [".#.##", ".####", ".####", "#.###"]),
+}
+
+
+def mask_rows(decoded_mask, size):
+    mask, origin = decoded_mask
+    full = np.zeros(size, dtype=bool)
+    if mask is not None:
+        top, left = origin
+        full[top : top + mask.shape[0], left : left + mask.shape[1]] = mask
+    return ["".join("#" if value else "." for value in row) for row in full]
+
+
+def rle_bbox_shape(rows):
+    mask = np.array([[char == "#" for char in row] for row in rows])
+    ys, xs = np.nonzero(mask)
+    return (ys.max() - ys.min() + 1, xs.max() - xs.min() + 1)
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+@pytest.mark.parametrize("name", RLE_FIXTURES)
+def test_decode_rle_matches_pycocotools(name, compressed):
+    size, string, counts, expected = RLE_FIXTURES[name]
+    # pycocotools.decode rejects counts past the image area ("past_image_area"),
+    # the expected mask is decoded from the counts truncated at the image area
+    segmentation = {"size": size, "counts": string if compressed else counts}
+
+    decoded_mask = coco_converter.decode_rle_in_bbox(segmentation)
+
+    assert mask_rows(decoded_mask, size) == expected
+    has_foreground = any("#" in row for row in expected)
+    assert coco_converter.rle_has_foreground(segmentation) == has_foreground
+    if has_foreground:
+        assert decoded_mask[0].shape == rle_bbox_shape(expected)
+    else:
+        assert decoded_mask == (None, None)
+
+
+def test_decode_rles_in_bbox_batch():
+    segmentations = [
+        {"size": size, "counts": counts}
+        for size, string, uncompressed, _ in RLE_FIXTURES.values()
+        for counts in [string, uncompressed]
+    ]
+    expected = [RLE_FIXTURES[name][3] for name in RLE_FIXTURES for _ in range(2)]
+    decoded_masks = coco_converter.decode_rles_in_bbox(segmentations)
+    rows = [
+        mask_rows(decoded_mask, segmentation["size"])
+        for decoded_mask, segmentation in zip(decoded_masks, segmentations)
+    ]
+    assert rows == expected
@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+import coco_loader
+
+IMAGES_COUNT = 40
+
+
+def make_instances(keys_order):
+    images = [
+        {"id": img_id, "file_name": f"{img_id}.jpg", "height": 10, "width": 10}
+        # ids are not sorted, so the file order differs from the order of ids and their hashes
+        for img_id in [(idx * 7919) % 1000 + 1 for idx in range(IMAGES_COUNT)]
+    ]
+    annotations = []
+    for idx, image in enumerate(images):
+        # some images have no objects
+        for _ in range(idx % 3):
+            annotations.append(
+                {
+                    "id": len(annotations) + 1,
+                    "image_id": image["id"],
+                    "category_id": idx % 2 + 1,
+                    "segmentation": [[0, 0, 5, 0, 5, 5]],
+                    "bbox": [0, 0, 5, 5],
+                }
+            )
+    # the object of the missing image is ignored
+    annotations.append({"id": len(annotations) + 1, "image_id": 5000, "category_id": 1})
+    # objects of the same image are not adjacent
+    annotations.reverse()
+    data = {
+        "annotations": annotations,
+        "images": images,
+        "categories": [{"id": 2, "name": "dog"}, {"id": 1, "name": "cat"}],
+    }
+    return {key: data[key] for key in keys_order}
+
+
+def make_captions(instances):
+    return {
+        "annotations": [
+            {"id": idx + 1, "image_id": image["id"], "caption": f"caption {idx}"}
+            for idx, image in enumerate(instances["images"])
+            if idx % 4 == 0
+        ]
+    }
+
+
+def write_json(path, data):
+    with open(path, "w") as f:
+        json.dump(data, f)
+    return str(path)
+
+
+@pytest.mark.parametrize(
+    "keys_order",
+    [["images", "annotations", "categories"], ["annotations", "categories", "images"]],
+)
+@pytest.mark.parametrize("buckets_count", [1, 4])
+def test_stream_matches_load(tmp_path, monkeypatch, keys_order, buckets_count):
+    instances = make_instances(keys_order)
+    ann_path = write_json(tmp_path / "instances.json", instances)
+    captions_path = write_json(tmp_path / "captions.json", make_captions(instances))
+    # the bucket size is chosen so the file is split to the given number of buckets
+    monkeypatch.setattr(coco_loader, "STREAM_BUCKET_SIZE", 1)
+    monkeypatch.setattr(coco_loader, "STREAM_MAX_BUCKETS", buckets_count)
+
+    loaded = coco_loader.load_coco_annotations(ann_path)
+    loaded.add_captions(captions_path)
+    streamed = coco_loader.stream_coco_annotations(ann_path, str(tmp_path / "spill"))
+    try:
+        streamed.add_captions(captions_path)
+        assert list(streamed.iter_images()) == list(loaded.iter_images())
+        assert streamed.categories == loaded.categories
+        assert streamed.ann_types == loaded.ann_types
+        assert streamed.profile.to_json() == loaded.profile.to_json()
+    finally:
+        streamed.close()
+
+
+def test_stream_without_annotations(tmp_path):
+    instances = make_instances(["images", "annotations", "categories"])
+    instances["annotations"] = []
+    ann_path = write_json(tmp_path / "instances.json", instances)
+    loaded = coco_loader.load_coco_annotations(ann_path)
+    streamed = coco_loader.stream_coco_annotations(ann_path, str(tmp_path / "spill"))
+    try:
+        assert list(streamed.iter_images()) == list(loaded.iter_images())
+    finally:
+        streamed.close()
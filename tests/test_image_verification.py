@@ -0,0 +1,57 @@
+import json
+import types
+
+import cv2
+import numpy as np
+import pytest
+
+import image_verification
+import input_source
+
+
+class FakeFileApi:
+    def __init__(self, error=None):
+        self.uploads = {}
+        self.error = error
+
+    def upload(self, team_id, src, dst):
+        if self.error is not None:
+            raise self.error
+        with open(src) as f:
+            self.uploads[(team_id, dst)] = json.load(f)
+
+
+@pytest.fixture
+def images(tmp_path, g, monkeypatch):
+    monkeypatch.setattr(g, "STORAGE_DIR", str(tmp_path / "storage"), raising=False)
+    monkeypatch.setattr(g, "TEAM_ID", 7, raising=False)
+    monkeypatch.setattr(g, "TEAM_FILES_DIR", "/import-coco/100", raising=False)
+    monkeypatch.setattr(g, "VERIFICATION_WORKERS", 1, raising=False)
+    monkeypatch.setattr(g, "input_source", input_source.local_input, raising=False)
+    good_path, truncated_path = str(tmp_path / "good.png"), str(tmp_path / "truncated.png")
+    cv2.imwrite(good_path, np.zeros((20, 30, 3), dtype=np.uint8))
+    with open(good_path, "rb") as f:
+        data = f.read()
+    with open(truncated_path, "wb") as f:
+        f.write(data[: len(data) // 2])
+    return [(1, "good.png", good_path, (20, 30)), (2, "truncated.png", truncated_path, None)]
+
+
+def test_report_is_uploaded_to_team_files(images, g, monkeypatch):
+    file_api = FakeFileApi()
+    monkeypatch.setattr(g, "api", types.SimpleNamespace(file=file_api), raising=False)
+
+    report = image_verification.verify_images("train", images, len(images))
+
+    uploaded_report = json.loads(json.dumps(report))
+    assert file_api.uploads == {(7, "/import-coco/100/verification/train.json"): uploaded_report}
+    assert [item["file_name"] for item in report["images"]] == ["truncated.png"]
+
+
+def test_upload_error_does_not_fail_verification(images, g, monkeypatch):
+    file_api = FakeFileApi(error=ConnectionError("Team Files are not available"))
+    monkeypatch.setattr(g, "api", types.SimpleNamespace(file=file_api), raising=False)
+
+    report = image_verification.verify_images("train", images, len(images))
+
+    assert report["invalid"] == 1
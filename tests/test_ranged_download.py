@@ -0,0 +1,70 @@
+import functools
+import os
+import threading
+import types
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import supervisely as sly
+
+import coco_downloader
+import ranged_download
+
+
+class NoRangesHandler(SimpleHTTPRequestHandler):
+    """Advertises range requests, but answers them with the whole file."""
+
+    def end_headers(self):
+        self.send_header("Accept-Ranges", "bytes")
+        super().end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def no_ranges_url(tmp_path):
+    root = tmp_path / "http"
+    root.mkdir()
+    handler = functools.partial(NoRangesHandler, directory=str(root))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield root, f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_ranged_download_raises_if_ranges_are_ignored(no_ranges_url, tmp_path):
+    root, url = no_ranges_url
+    data = os.urandom(300 * 1024)
+    (root / "file.zip").write_bytes(data)
+    path = str(tmp_path / "file.zip")
+    downloaded = []
+
+    download = ranged_download.RangedDownload(f"{url}/file.zip", path, len(data), part_size=1024)
+    with pytest.raises(ranged_download.RangesNotSupported):
+        download.run(4, progress_cb=downloaded.append)
+
+    assert sum(downloaded) == 0
+    assert not os.path.exists(download.partial_path)
+    assert not os.path.exists(download.state_path)
+
+
+def test_download_falls_back_to_single_stream(no_ranges_url, tmp_path, g, monkeypatch):
+    root, url = no_ranges_url
+    data = os.urandom(300 * 1024)
+    (root / "file.zip").write_bytes(data)
+    monkeypatch.setattr(g, "DOWNLOAD_CONNECTIONS", 4, raising=False)
+    monkeypatch.setattr(g, "my_app", types.SimpleNamespace(cache=None), raising=False)
+    path = str(tmp_path / "file.zip")
+    downloaded = []
+
+    coco_downloader.download_file_from_link(
+        f"{url}/file.zip", "file.zip", path, "Download", sly.logger, downloaded.append
+    )
+
+    with open(path, "rb") as f:
+        assert f.read() == data
+    assert sum(downloaded) == len(data)
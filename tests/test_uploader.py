@@ -0,0 +1,45 @@
+import threading
+from types import SimpleNamespace
+
+import supervisely as sly
+
+from checkpoint import Checkpoint
+from uploader import PipelinedUploader
+
+
+class FakeApi:
+    def __init__(self):
+        self.uploading = threading.Event()
+        self.release = threading.Event()
+        self.project = SimpleNamespace(
+            create=lambda *args, **kwargs: SimpleNamespace(id=1, name="coco"),
+            update_meta=lambda *args: None,
+        )
+        self.dataset = SimpleNamespace(
+            create=lambda *args, **kwargs: SimpleNamespace(id=len(args[1]), name=args[1])
+        )
+        self.image = SimpleNamespace(upload_paths=self._upload_paths)
+        self.annotation = SimpleNamespace(upload_jsons=lambda *args: None)
+
+    def _upload_paths(self, dataset_id, names, paths):
+        self.uploading.set()
+        self.release.wait(timeout=10)
+        return [SimpleNamespace(id=i) for i, _ in enumerate(names)]
+
+
+def test_dataset_is_finished_after_its_images_are_uploaded(tmp_path):
+    path = str(tmp_path / "checkpoint.jsonl")
+    checkpoint = Checkpoint(path, "fingerprint")
+    api = FakeApi()
+    pipeline = PipelinedUploader(api, 1, "coco", remove_files=False, checkpoint=checkpoint)
+    for name in ["a.jpg", "b.jpg"]:
+        pipeline.add_item("ds", name, str(tmp_path / name), {}, meta=sly.ProjectMeta())
+    pipeline.finish_dataset("ds", 2)
+
+    assert api.uploading.wait(timeout=10)
+    assert Checkpoint(path, "fingerprint").finished == {}
+    api.release.set()
+    pipeline.close()
+    resumed = Checkpoint(path, "fingerprint")
+    assert resumed.finished == {"ds": 2}
+    assert resumed.is_uploaded("ds", "a.jpg") and resumed.is_uploaded("ds", "b.jpg")
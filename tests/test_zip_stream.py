@@ -0,0 +1,130 @@
+import functools
+import io
+import os
+import random
+import threading
+import zipfile
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import supervisely as sly
+
+import coco_downloader
+import zip_stream
+
+
+class UnseekableWriter(io.RawIOBase):
+    """zipfile writes data descriptors after the members to unseekable files."""
+
+    def __init__(self):
+        self.data = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.data.write(data)
+
+
+def make_members():
+    rng = random.Random(0)
+    return {
+        "train/a.jpg": bytes(rng.getrandbits(8) for _ in range(5000)),
+        "train/b.txt": b"text " * 2000,
+        "train/nested/c.png": bytes(rng.getrandbits(8) for _ in range(300)),
+        "train/empty.txt": b"",
+        "other/d.json": b'{"key": "value"}' * 50,
+    }
+
+
+def write_zip(path, members, streamed):
+    """Stored and deflated members, members of the streamed archive have data descriptors."""
+    if streamed:
+        writer = UnseekableWriter()
+        with zipfile.ZipFile(writer, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("train/", b"")
+            for name, data in members.items():
+                archive.writestr(name, data)
+        with open(path, "wb") as f:
+            f.write(writer.data.getvalue())
+        return
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("train/", b"")
+        for idx, (name, data) in enumerate(members.items()):
+            compression = zipfile.ZIP_STORED if idx % 2 == 0 else zipfile.ZIP_DEFLATED
+            archive.writestr(name, data, compress_type=compression)
+
+
+@pytest.fixture(scope="module")
+def http_dir(tmp_path_factory):
+    """Directory served over HTTP, yields the directory and its url."""
+    root = tmp_path_factory.mktemp("http")
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=str(root))
+    handler.log_message = lambda *args: None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield root, f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def read_tree(root):
+    files = {}
+    for dir_path, _, file_names in os.walk(root):
+        for file_name in file_names:
+            path = os.path.join(dir_path, file_name)
+            with open(path, "rb") as f:
+                files[os.path.relpath(path, root).replace(os.sep, "/")] = f.read()
+    return files
+
+
+def to_images_dir(member_name):
+    """The same filter as for the original COCO images archives."""
+    if member_name.startswith("train/"):
+        return os.path.join("images", member_name[len("train/") :])
+    return None
+
+
+@pytest.mark.parametrize("streamed", [False, True])
+# chunks of a few bytes split local file headers and data descriptors
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1024 * 1024])
+@pytest.mark.parametrize("member_filter", [None, to_images_dir])
+def test_extract_over_http(http_dir, tmp_path, monkeypatch, streamed, chunk_size, member_filter):
+    root, url = http_dir
+    members = make_members()
+    archive_name = f"archive_{int(streamed)}.zip"
+    write_zip(os.path.join(root, archive_name), members, streamed)
+    monkeypatch.setattr(zip_stream, "CHUNK_SIZE", chunk_size)
+    downloaded = []
+
+    coco_downloader.download_and_extract_zip(
+        f"{url}/{archive_name}",
+        archive_name,
+        str(tmp_path / "out"),
+        "Download",
+        sly.logger,
+        member_filter=member_filter,
+        progress_cb=downloaded.append,
+    )
+
+    with zipfile.ZipFile(os.path.join(root, archive_name)) as archive:
+        expected = {}
+        for info in archive.infolist():
+            name = info.filename if member_filter is None else member_filter(info.filename)
+            if name is not None and not info.is_dir():
+                expected[name.replace(os.sep, "/")] = archive.read(info)
+    assert read_tree(tmp_path / "out") == expected
+    assert sum(downloaded) == os.path.getsize(os.path.join(root, archive_name))
+
+
+def test_extract_rejects_bad_crc(tmp_path):
+    archive_path = tmp_path / "archive.zip"
+    write_zip(archive_path, make_members(), streamed=False)
+    data = bytearray(archive_path.read_bytes())
+    # the first member is stored, its data follows the header and the name
+    data[30 + len("train/") + 30 + len("train/a.jpg")] ^= 0xFF
+    with pytest.raises(ValueError):
+        zip_stream.extract_zip_stream([bytes(data)], str(tmp_path / "out"))